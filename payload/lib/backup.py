@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Back up files before they are changed to one deduplicated,
+#            compressed store, indexed by path, run and host, and restore
+#            them from it.
+#            ------------------------------------------------------------------
+#            Use: "$pyBin" "$instLib/backup.py" save "$sysSambaConfig"
+#                 "$pyBin" "$instLib/backup.py" restore -r 12 "$sysSambaConfig"
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/05/19
+
+
+
+"""
+PURPOSE:    Instead of a cp -p of each file to $backupDir, where a file of
+            the same name from another directory replaced it, and a
+            .orig copy with ls -l text appended, each file is saved once
+            to $backupDir:
+
+                objects/9f/9f1c...gz    contents, gzip compressed, named
+                                        by the sha1 of the contents
+                index.db                sqlite: one row for each file
+                                        saved, by host, run and full path,
+                                        with its mode, owner, mtime, size
+                                        and digest
+
+            Contents already in objects/ are not stored again, so a file
+            saved on every run, unchanged, is stored once, and the stores
+            of several hosts, collected on one with import, hold each
+            distinct file once.
+
+            The run is $runID, the run install.py records to results.db.
+            The first backup of a path in a run is the one kept: it is the
+            file as it was before the run changed it. Outside of a run,
+            each save is a run of its own, numbered -1, -2, ..., so it never
+            mixes with the runs of results.db, and a file saved again is
+            backed up again.
+            Paths are saved without $exeDir, so in test mode the backup of
+            payload/sys/etc/samba/smb.conf is /etc/samba/smb.conf, and it
+            is restored to the test root.
+
+                backup.py save FILE...        back up each FILE
+                backup.py show FILE           print the contents backed up
+                backup.py restore FILE...     restore each FILE
+                backup.py restore -r RUN      restore every file of RUN
+                backup.py list [FILE]         list the backups
+                backup.py import DIRECTORY    add the store of another host
+
+            show and restore take the backup of run -r, else the one saved
+            last; restore sets the contents, mode, owner and mtime backed
+            up, in one rename.
+
+ASSUMPTION: 1) Only regular files and symbolic links are backed up.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/05/19
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import gzip
+import hashlib
+import os
+import shutil
+import socket
+import sqlite3
+import stat
+import sys
+import time
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# files and directories of a backup directory
+indexName = 'index.db'
+objectsName = 'objects'
+
+# tables and indexes, created on first use
+schema = '''
+CREATE TABLE IF NOT EXISTS backups (
+    host        TEXT NOT NULL,
+    run         INTEGER NOT NULL,
+    path        TEXT NOT NULL,
+    mode        INTEGER NOT NULL,
+    uid         INTEGER NOT NULL,
+    gid         INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    size        INTEGER NOT NULL,
+    digest      TEXT NOT NULL,
+    saved       TEXT NOT NULL,
+    PRIMARY KEY (host, run, path)
+);
+CREATE INDEX IF NOT EXISTS backups_path ON backups (path, host, run);
+CREATE INDEX IF NOT EXISTS backups_run ON backups (run, host);
+'''
+
+# columns of a backup, in the order of the table
+backupColumns = ('host', 'run', 'path', 'mode', 'uid', 'gid', 'mtime',
+                 'size', 'digest', 'saved')
+
+# size of the blocks files are read and compressed in, and how hard
+copyBlockSize = 65536
+compressLevel = 6
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def objectPath(backupDir, digest):
+    ''' path of the contents with digest in backupDir '''
+    return(os.path.join(backupDir, objectsName, digest[:2], digest + '.gz'))
+
+
+def storeObject(fp, backupDir):
+    ''' Compress what is read from fp to the store of backupDir, unless   '''
+    ''' the store has it already. Returns (digest, True if it was added   '''
+    ''' to the store, its size).                                          '''
+    objectsDir = os.path.join(backupDir, objectsName)
+    tmpFile = os.path.join(objectsDir, '.tmp.%d' % os.getpid())
+    if not os.path.isdir(objectsDir):
+        os.makedirs(objectsDir, 0o700)
+
+    # hash and compress in one read; the gzip header holds no name or time,
+    #   so the same contents are the same object on every host
+    sha1 = hashlib.sha1()
+    size = 0
+    rawFp = open(tmpFile, 'wb')
+    try:
+        zipFp = gzip.GzipFile('', 'wb', compressLevel, rawFp, 0)
+    except TypeError:
+        # python 2.6 has no mtime argument, and writes the time
+        zipFp = gzip.GzipFile('', 'wb', compressLevel, rawFp)
+    try:
+        while True:
+            block = fp.read(copyBlockSize)
+            if not block:
+                break
+            sha1.update(block)
+            zipFp.write(block)
+            size += len(block)
+    finally:
+        zipFp.close()
+        rawFp.close()
+
+    digest = sha1.hexdigest()
+    storedFile = objectPath(backupDir, digest)
+    if os.path.isfile(storedFile):
+        os.remove(tmpFile)
+        return(digest, False, size)
+    if not os.path.isdir(os.path.dirname(storedFile)):
+        os.makedirs(os.path.dirname(storedFile), 0o700)
+    os.chmod(tmpFile, 0o400)
+    os.rename(tmpFile, storedFile)
+    return(digest, True, size)
+
+
+def openIndex(backupDir):
+    ''' the index of backupDir, created on first use '''
+    if not os.path.isdir(backupDir):
+        os.makedirs(backupDir, 0o700)
+    # wait for another module writing to the index instead of failing
+    db = sqlite3.connect(os.path.join(backupDir, indexName), timeout=60)
+    db.executescript(schema)
+    db.commit()
+    return(db)
+
+
+def systemPath(path, exeDir=''):
+    ''' absolute path, without exeDir, as the backup of path is indexed '''
+    path = os.path.abspath(path)
+    if exeDir and path.startswith(exeDir.rstrip('/') + '/'):
+        path = path[len(exeDir.rstrip('/')):]
+    return(path)
+
+
+def newRun(db, host):
+    ''' run of a save outside of an install.py run: one below the lowest '''
+    ''' run of host, and below 0                                          '''
+    row = db.execute('SELECT min(run) FROM backups WHERE host = ?',
+                     (host,)).fetchone()
+    return(min(row[0] or 0, 0) - 1)
+
+
+def saveFile(db, backupDir, filename, run, host, exeDir=''):
+    ''' Back up filename in run of host, unless it was in that run. '''
+    ''' Returns (0, '', (path, digest, 'stored', 'deduplicated' or   '''
+    ''' 'kept')), else (1, error message, None).                     '''
+    path = systemPath(filename, exeDir)
+    row = db.execute('SELECT digest FROM backups WHERE host = ? AND '
+                     'run = ? AND path = ?', (host, run, path)).fetchone()
+    if row is not None:
+        # the first backup in a run is the file before the run changed it
+        return(0, '', (path, row[0], 'kept'))
+
+    try:
+        fstat = os.lstat(filename)
+        if stat.S_ISLNK(fstat.st_mode):
+            # the contents of a symbolic link is the path it points to
+            from io import BytesIO
+            target = os.readlink(filename)
+            if not isinstance(target, bytes):
+                target = target.encode('utf-8', 'surrogateescape')
+            (digest, stored, size) = storeObject(BytesIO(target), backupDir)
+        elif stat.S_ISREG(fstat.st_mode):
+            fp = open(filename, 'rb')
+            try:
+                (digest, stored, size) = storeObject(fp, backupDir)
+            finally:
+                fp.close()
+        else:
+            return(1, 'Could not back up %s: not a file' % filename, None)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not back up %s: %s' % (filename, value), None)
+
+    db.execute('INSERT INTO backups (%s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
+               '?, ?)' % ', '.join(backupColumns),
+               (host, run, path, fstat.st_mode, fstat.st_uid, fstat.st_gid,
+                fstat.st_mtime, size, digest,
+                time.strftime('%Y-%m-%d %H:%M:%S')))
+    db.commit()
+    # return 0 for success, no error message, and what was saved
+    return(0, '', (path, digest, stored and 'stored' or 'deduplicated'))
+
+
+def findBackups(db, host, run=None, path=None, latest=True):
+    ''' [{column: value}] of the backups of host, of run if given, else    '''
+    ''' the one saved last of each path, or every one if not latest; of    '''
+    ''' path if given, else of every path. In path, then save order.       '''
+    where = ['host = ?']
+    params = [host]
+    if path is not None:
+        where.append('path = ?')
+        params.append(path)
+    if run is not None:
+        where.append('run = ?')
+        params.append(run)
+    elif latest:
+        where.append('run = (SELECT b.run FROM backups b WHERE '
+                     'b.host = backups.host AND b.path = backups.path '
+                     'ORDER BY b.saved DESC, b.rowid DESC LIMIT 1)')
+    cursor = db.execute('SELECT %s FROM backups WHERE %s '
+                        'ORDER BY path, saved, rowid'
+                        % (', '.join(backupColumns), ' AND '.join(where)),
+                        params)
+    return([dict(zip(backupColumns, row)) for row in cursor])
+
+
+def openObject(backupDir, digest):
+    ''' file object reading the contents with digest '''
+    return(gzip.open(objectPath(backupDir, digest), 'rb'))
+
+
+def restoreFile(backupDir, backup, exeDir=''):
+    ''' Restore backup, as findBackups returns it, to its path under      '''
+    ''' exeDir: contents, mode, owner and mtime, renamed over the file.   '''
+    ''' Returns (0, ''), else (1, error message).                         '''
+    filename = exeDir.rstrip('/') + backup['path']
+    tmpFile = os.path.join(os.path.dirname(filename), '.%s.%d'
+                           % (os.path.basename(filename), os.getpid()))
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename), 0o755)
+        fp = openObject(backupDir, backup['digest'])
+        try:
+            if stat.S_ISLNK(backup['mode']):
+                target = fp.read()
+                if not isinstance(target, str):
+                    target = target.decode('utf-8', 'surrogateescape')
+                os.symlink(target, tmpFile)
+            else:
+                outFp = open(tmpFile, 'wb')
+                try:
+                    shutil.copyfileobj(fp, outFp, copyBlockSize)
+                finally:
+                    outFp.close()
+        finally:
+            fp.close()
+
+        if os.geteuid() == 0:
+            os.lchown(tmpFile, backup['uid'], backup['gid'])
+        if not stat.S_ISLNK(backup['mode']):
+            os.chmod(tmpFile, stat.S_IMODE(backup['mode']))
+            os.utime(tmpFile, (backup['mtime'], backup['mtime']))
+        os.rename(tmpFile, filename)
+    except Exception:
+        # if error, remove what was written, and return error
+        (type, value, traceback) = sys.exc_info()
+        if os.path.lexists(tmpFile):
+            os.remove(tmpFile)
+        return(1, 'Could not restore %s: %s' % (filename, value))
+    # return 0 for success, no error message
+    return(0, '')
+
+
+def importStore(db, backupDir, otherDir):
+    ''' Add the backups and contents of otherDir, the backup directory    '''
+    ''' of another host, to backupDir. Returns (0, '', (backups added,    '''
+    ''' contents stored)), else (1, error message, (0, 0)).               '''
+    added = 0
+    stored = 0
+    try:
+        otherDB = sqlite3.connect(os.path.join(otherDir, indexName),
+                                  timeout=60)
+        rows = otherDB.execute('SELECT %s FROM backups'
+                               % ', '.join(backupColumns)).fetchall()
+        otherDB.close()
+        for row in rows:
+            backup = dict(zip(backupColumns, row))
+            storedFile = objectPath(backupDir, backup['digest'])
+            if not os.path.isfile(storedFile):
+                if not os.path.isdir(os.path.dirname(storedFile)):
+                    os.makedirs(os.path.dirname(storedFile), 0o700)
+                shutil.copy2(objectPath(otherDir, backup['digest']),
+                             storedFile)
+                stored += 1
+            cursor = db.execute('INSERT OR IGNORE INTO backups (%s) VALUES '
+                                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                                % ', '.join(backupColumns), row)
+            added += cursor.rowcount
+        db.commit()
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not import %s: %s' % (otherDir, value), (0, 0))
+    # return 0 for success, no error message, and what was added
+    return(0, '', (added, stored))
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # optparse, not argparse: the payload helpers must also run on the
+    #   python 2.6 of CentOS 6
+    from optparse import OptionParser
+
+    usage = '''%prog [options] command [argument...]
+
+commands:
+  save FILE...      back up each FILE, in run $runID, else a new run
+  show FILE         print the contents backed up of FILE
+  restore FILE...   restore each FILE, or with -r every file of the run
+  list [FILE]       list the backups, of FILE
+  import DIRECTORY  add the backups of another host's backup directory'''
+    parser = OptionParser(usage=usage)
+    parser.add_option("-d", "--backupdir", dest="BACKUPDIR",
+                      default=os.environ.get('backupDir'),
+                      help="backup directory, default $backupDir.")
+    parser.add_option("-r", "--run", dest="RUN", type="int",
+                      help="save to, or show, restore or list the backups \
+                      of, run RUN; default $runID, else a new run, to save, \
+                      else the backup of each file saved last.")
+    parser.add_option("-H", "--host", dest="HOST",
+                      default=socket.gethostname(),
+                      help="backups of host HOST, default this one.")
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error('a command is required')
+    command = args[0]
+    if not options.BACKUPDIR:
+        parser.error('no backup directory, set backupDir or use -d')
+    if command in ('save', 'import') and len(args) < 2:
+        parser.error('%s takes at least one argument' % command)
+    if command == 'show' and len(args) != 2:
+        parser.error('show takes one argument')
+    if command == 'restore' and len(args) < 2 and options.RUN is None:
+        parser.error('restore takes files, or a run with -r')
+    exeDir = os.environ.get('exeDir', '')
+    db = openIndex(options.BACKUPDIR)
+
+    ecode = 0
+    if command == 'save':
+        run = options.RUN
+        if run is None and os.environ.get('runID'):
+            run = int(os.environ['runID'])
+        elif run is None:
+            run = newRun(db, options.HOST)
+        for filename in args[1:]:
+            (ecode, rval, saved) = saveFile(db, options.BACKUPDIR, filename,
+                                            run, options.HOST, exeDir)
+            if ecode != 0:
+                print('%s' % rval)
+                sys.exit(1)
+            print('Backed up %s to run %s, %s %s'
+                  % (saved[0], run, saved[2], saved[1]))
+    elif command in ('show', 'restore', 'list'):
+        paths = [systemPath(filename, exeDir) for filename in args[1:]]
+        backups = []
+        for path in paths or [None]:
+            found = findBackups(db, options.HOST, options.RUN, path,
+                                command != 'list')
+            if not found and path is not None:
+                print('No backup of %s%s' % (path, options.RUN is not None
+                                             and ' in run %s' % options.RUN
+                                             or ''))
+                ecode = 1
+            backups.extend(found)
+        if command == 'show':
+            for backup in backups:
+                fp = openObject(options.BACKUPDIR, backup['digest'])
+                data = fp.read()
+                fp.close()
+                getattr(sys.stdout, 'buffer', sys.stdout).write(data)
+        elif command == 'restore':
+            for backup in backups:
+                (rval, message) = restoreFile(options.BACKUPDIR, backup,
+                                              exeDir)
+                if rval != 0:
+                    print('%s' % message)
+                    ecode = 1
+                else:
+                    print('Restored %s from run %s' % (backup['path'],
+                                                       backup['run']))
+        else:
+            print('run\tmode\towner\tsize\tmtime\tdigest\tpath')
+            for backup in backups:
+                print('%s\t%06o\t%s:%s\t%s\t%s\t%s\t%s'
+                      % (backup['run'], backup['mode'], backup['uid'],
+                         backup['gid'], backup['size'],
+                         time.strftime('%Y-%m-%d %H:%M:%S',
+                                       time.localtime(backup['mtime'])),
+                         backup['digest'][:12], backup['path']))
+    elif command == 'import':
+        for otherDir in args[1:]:
+            (ecode, rval, counts) = importStore(db, options.BACKUPDIR,
+                                                otherDir)
+            if ecode != 0:
+                print('%s' % rval)
+                sys.exit(1)
+            print('Imported %s: %s backups, %s contents stored'
+                  % ((otherDir,) + counts))
+    else:
+        parser.error('unknown command %s' % command)
+    db.close()
+    sys.exit(ecode)
@@ -12,29 +12,23 @@
 ###----------------------------------------------------------------------------
 #### VARIABLES
 ####----------------------------------------------------------------------------
-permsAll="$(ls -l $1)"
 permsFile="$(stat -c '%a' $1)"
-backupFileLoc="$dirBackup/$(basename $1)".orig
-origFile="$(basename $backupFileLoc)"
 
 
 ####----------------------------------------------------------------------------
 #### FUNCTION
 ####----------------------------------------------------------------------------
 boildown() {
-    # Phase 1, record some stats and make a file.orig backup
-    echo -e "Backing-up $1 to $backupFileLoc\n"
-    yes | cp -p "$1" "$backupFileLoc"
+    # Phase 1, back up the file, its contents, mode, owner and mtime, to the
+    # backup store; see backup.py to list or restore it
+    echo -e "Backing-up $1 to $backupDir\n"
+    "$pyBin" "$instLib/backup.py" save "$1" || return 1
 
-    # Phase 2: boil down original file and insure proper permissions
+    # Phase 2: boil down the file as it is and insure proper permissions
     echo -e "Boiling-down $1 to its essentials...\n"
-    egrep -v '^(;|#|$)' "$backupFileLoc" > "$1"
-    yes | cp -p "$1" "$dirBackup"/
+    egrep -v '^(;|#|$)' "$1" > "$1.boildown"
+    cat "$1.boildown" > "$1"
+    rm -f "$1.boildown"
     echo -e "Re-applying original file permissions to new $1.\n"
     chmod "$permsFile" "$1"
-
-    # Phase 3: record file permissions to file.orig
-    echo -e " " >> "$backupFileLoc"
-    echo -e "Original file permissions were:\n$permsAll"   >> "$backupFileLoc"
-    echo -e "Original octal permissions were: $permsFile." >> "$backupFileLoc"
 }
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Set a whole list of parameters in an INI or Name Value
+#            configuration file, reading and writing the file only once.
+#            ------------------------------------------------------------------
+#            Use: "$pyBin" "$instLib/confedit.py" -s global -a security \
+#                     "$sysSambaConfig" "$varLists/samba_populate.list"
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/04/21
+
+
+
+"""
+PURPOSE:    Instead of a grep of the configuration file for each parameter,
+            and a sed -i rewriting all of it for each one missing, the file
+            is parsed once into its lines, in order: comments, blank lines,
+            [section] headers and parameters, each kept as it was read. The
+            parameters are then set in memory:
+
+              - a parameter already in the section with the desired value
+                is left alone
+              - one with another value has its value replaced, keeping the
+                indent and the separator of its line
+              - one not in the section is added after the parameter given
+                with -a, else after the last parameter of the section,
+                indented like its neighbours
+
+            and, if anything changed, the file is written once: to a
+            temporary file in the same directory, with the mode and owner
+            of the file, then renamed over it.
+
+            Parameters are Name = Value, Name=Value, Name Value or
+            Name<tab>Value, as in parse_ini.sh. In an INI file, one with
+            [section] headers, the name is everything before the first =,
+            blanks included; else it is the first word. Names are compared
+            ignoring case and runs of blanks, as Samba and sshd do, so
+            "Hosts  Allow" is "hosts allow". The parameters list has one
+            parameter per line, # comments and blank lines skipped:
+
+                # Samba Parameters and Values to be injected into smb.conf
+                    hosts allow = 127.
+                    encrypt passwords = yes
+
+            With -c nothing is written: the exit status is 0 if every
+            parameter is already set, 1 if not, so one call checks a whole
+            list instead of a grepit for each pair.
+
+ASSUMPTION: 1) Values hold no inline comments.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/04/21
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import re
+import stat
+import sys
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# lines which are not parameters
+commentLine = re.compile(r'^\s*([#;].*)?$')
+sectionLine = re.compile(r'^\s*\[([^]]*)\]\s*$')
+
+# a parameter: indent, name, separator, value; the name of an INI parameter
+#   may hold blanks, e.g. hosts allow = 127.
+iniParamLine = re.compile(r'^(\s*)([^=]*?)(\s*=\s*)(.*?)\s*$')
+paramLine = re.compile(r'^(\s*)([^\s=]+)(\s*=\s*|\s+|$)(.*?)\s*$')
+
+# style of a parameter added to a file with no parameter to copy it from
+defaultIndent = {True: '\t', False: ''}
+defaultSeparator = {True: ' = ', False: ' '}
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def paramKey(name):
+    ''' name as parameters are compared: lower case, single blanks '''
+    return(' '.join(name.lower().split()))
+
+
+def parseParam(line, isINI):
+    ''' Return (indent, name, separator, value) of a parameter line, of an '''
+    ''' INI file if isINI, None for a comment, blank line or section       '''
+    ''' header.                                                            '''
+    if commentLine.match(line) or sectionLine.match(line):
+        return(None)
+    if isINI:
+        match = iniParamLine.match(line)
+    else:
+        match = paramLine.match(line)
+    if match is None:
+        # a name alone, e.g. a flag
+        return(re.match(r'^(\s*)', line).group(1), line.strip(), '', '')
+    return(match.groups())
+
+
+def loadParams(paramsFile):
+    ''' Return (0, '', [(name, value)]) of the parameters listed in       '''
+    ''' paramsFile, else (1, error message, []). If every parameter has   '''
+    ''' an =, they are read as INI parameters.                            '''
+    params = []
+    try:
+        fp = open(paramsFile, 'rb')
+        lines = [line for line in fp.read().decode('latin-1').splitlines()
+                 if parseParam(line, False) is not None]
+        fp.close()
+        isINI = not [line for line in lines if '=' not in line]
+        for line in lines:
+            param = parseParam(line, isINI)
+            params.append((param[1], param[3]))
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not read parameters %s: %s' % (paramsFile, value),
+               [])
+    return(0, '', params)
+
+
+class Line(object):
+    ''' A line of a configuration file, and the section it is in '''
+    __slots__ = ('text', 'section')
+
+    def __init__(self, text, section):
+        self.text = text
+        self.section = section
+
+
+class ConfigFile(object):
+    ''' The lines of a configuration file, parsed once, with parameters   '''
+    ''' set in memory and written back in one atomic write.               '''
+
+    def __init__(self, filename, contents=None):
+        # follow a link, so the file it points to is replaced, not the link
+        self.filename = os.path.realpath(filename)
+        if contents is None:
+            fp = open(self.filename, 'rb')
+            # latin-1 maps every byte to a character and back, so lines
+            #   which are not touched are written back byte for byte
+            contents = fp.read().decode('latin-1')
+            fp.close()
+        self.parse(contents)
+        self.changed = False
+
+    def parse(self, contents):
+        ''' make contents the lines of the file '''
+        texts = contents.splitlines()
+        # an INI file has [section] headers and Name = Value parameters
+        self.isINI = bool([text for text in texts if sectionLine.match(text)])
+
+        # every line, and by (section, name) and (None, name) the first line
+        #   of each parameter, and by section its last parameter line, so a
+        #   parameter is found without reading the lines again
+        self.lines = []
+        self.params = {}
+        self.lastParam = {}
+        self.sections = set([''])
+        section = ''
+        for text in texts:
+            match = sectionLine.match(text)
+            if match:
+                section = paramKey(match.group(1))
+                self.sections.add(section)
+            line = Line(text, section)
+            self.lines.append(line)
+            self.index(line)
+
+    def text(self):
+        ''' the contents of the file, as it would be written '''
+        return(''.join([line.text + '\n' for line in self.lines]))
+
+    def replace(self, contents):
+        ''' Replace the whole contents of the file. Returns 'set' if they  '''
+        ''' were contents already, else 'changed'.                         '''
+        if contents.splitlines() == [line.text for line in self.lines]:
+            return('set')
+        self.parse(contents)
+        self.changed = True
+        return('changed')
+
+    def index(self, line):
+        ''' add line to the parameters found, if it is one '''
+        param = parseParam(line.text, self.isINI)
+        if param is None:
+            return
+        name = paramKey(param[1])
+        self.params.setdefault((line.section, name), line)
+        self.params.setdefault((None, name), line)
+        self.lastParam[line.section] = line
+
+    def find(self, name, section=None):
+        ''' Return the line of parameter name in section, None if it is not '''
+        ''' there.                                                          '''
+        if section is not None:
+            section = paramKey(section)
+        return(self.params.get((section, paramKey(name))))
+
+    def get(self, name, section=None):
+        ''' value of parameter name in section, None if it is not set '''
+        line = self.find(name, section)
+        if line is None:
+            return(None)
+        return(parseParam(line.text, self.isINI)[3])
+
+    def set(self, name, value, section=None, after=None):
+        ''' Set parameter name to value in section, adding it after the    '''
+        ''' parameter after, else the last of the section, if it is not    '''
+        ''' there. Returns 'set', 'changed' or 'added'.                    '''
+        line = self.find(name, section)
+        if line is not None:
+            (indent, oldName, separator, oldValue) = \
+                parseParam(line.text, self.isINI)
+            if oldValue == value:
+                return('set')
+            line.text = indent + oldName + (separator or ' ') + value
+            self.changed = True
+            return('changed')
+
+        sectionKey = ''
+        if section is not None:
+            sectionKey = paramKey(section)
+        if sectionKey not in self.sections:
+            # no such section yet, add it at the end
+            self.lines.append(Line('[%s]' % section, sectionKey))
+            self.sections.add(sectionKey)
+
+        # add after the anchor parameter, else the last one of the section,
+        #   in the style of that line
+        anchor = None
+        if after is not None:
+            anchor = self.find(after, section)
+        if anchor is None:
+            anchor = self.lastParam.get(sectionKey)
+        if anchor is None:
+            (indent, separator) = (defaultIndent[self.isINI],
+                                   defaultSeparator[self.isINI])
+            # right after the section header, or at the top of the file
+            position = 0
+            for (i, line) in enumerate(self.lines):
+                if line.section == sectionKey:
+                    position = i + int(bool(sectionKey))
+                    break
+        else:
+            (indent, oldName, separator, oldValue) = \
+                parseParam(anchor.text, self.isINI)
+            separator = separator or defaultSeparator[self.isINI]
+            position = self.lines.index(anchor) + 1
+
+        previousLast = self.lastParam.get(sectionKey)
+        line = Line(indent + name + separator + value, sectionKey)
+        self.lines.insert(position, line)
+        self.index(line)
+        if anchor is not None and anchor is not previousLast:
+            # added in the middle of the section, the last is still the last
+            self.lastParam[sectionKey] = previousLast
+        self.changed = True
+        return('added')
+
+    def apply(self, params, section=None, after=None):
+        ''' Set every (name, value) of params, those added in the order of '''
+        ''' params. Returns [(name, value, 'set', 'changed' or 'added')].  '''
+        results = []
+        for (name, value) in params:
+            result = self.set(name, value, section, after)
+            if result == 'added' and after is not None:
+                # the next one goes after this one, keeping the list order
+                after = name
+            results.append((name, value, result))
+        return(results)
+
+    def write(self):
+        ''' Write the lines back, if anything changed, to a temporary file '''
+        ''' with the mode and owner of the file, renamed over it. Returns  '''
+        ''' 0, else the error.                                             '''
+        if not self.changed:
+            return(0)
+
+        tmpFile = os.path.join(os.path.dirname(self.filename), '.%s.%d'
+                               % (os.path.basename(self.filename),
+                                  os.getpid()))
+        try:
+            fstat = os.stat(self.filename)
+            fp = open(tmpFile, 'wb')
+            try:
+                fp.write(self.text().encode('latin-1'))
+                fp.flush()
+                os.fsync(fp.fileno())
+            finally:
+                fp.close()
+            os.chown(tmpFile, fstat.st_uid, fstat.st_gid)
+            os.chmod(tmpFile, stat.S_IMODE(fstat.st_mode))
+            os.rename(tmpFile, self.filename)
+        except Exception:
+            # if error, remove what was written, and return error
+            (type, value, traceback) = sys.exc_info()
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+            return(value)
+        self.changed = False
+        # return 0 for success
+        return(0)
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # optparse, unlike install.py: the helpers of payload/lib also run on the
+    #   python 2.6 of CentOS 6 ($pyBin), which has no argparse
+    from optparse import OptionParser
+
+    parser = OptionParser(usage='%prog [options] configfile paramsfile')
+    parser.add_option("-s", "--section", dest="SECTION",
+                      help="set the parameters in section SECTION of an INI \
+                      file, e.g. global.")
+    parser.add_option("-a", "--after", dest="AFTER",
+                      help="add missing parameters after parameter AFTER, \
+                      else after the last parameter of the section.")
+    parser.add_option("-c", "--check", action="store_true", dest="CHECK",
+                      default=False, help="write nothing, exit with status \
+                      1 if any parameter is not set.")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error('a configuration file and a parameters file are '
+                     'required')
+    (configFile, paramsFile) = args
+
+    (ecode, rval, params) = loadParams(paramsFile)
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
+    try:
+        config = ConfigFile(configFile)
+    except Exception:
+        (type, value, traceback) = sys.exc_info()
+        print('Could not read %s: %s' % (configFile, value))
+        sys.exit(1)
+
+    results = config.apply(params, options.SECTION, options.AFTER)
+    for (name, value, result) in results:
+        print('%-8s %s = %s' % (result, name, value))
+
+    if options.CHECK:
+        sys.exit(int(config.changed))
+    rval = config.write()
+    if rval != 0:
+        print('Could not write %s: %s' % (configFile, rval))
+        sys.exit(1)
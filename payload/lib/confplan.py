@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Compile the target configuration of a standard, declared in
+#            its lists and target files, into one change plan per file, and
+#            apply each plan with one read and at most one write.
+#            ------------------------------------------------------------------
+#            Use: "$pyBin" "$instLib/confplan.py" tdsh
+#                 "$pyBin" "$instLib/confplan.py" tdsh /etc/samba/smb.conf
+#                 "$pyBin" "$instLib/confplan.py" -n tdsh   # plan only
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/04/28
+
+
+
+"""
+PURPOSE:    The configuration files a standard sets, and where their
+            desired state comes from, are declared in
+            payload/var/lists/<standard>_configs.list, one source per line:
+
+                # configuration file  kind    source               options
+                /etc/samba/smb.conf   params  samba_populate.list  \\
+                                                section=global after=security
+                /etc/ssh/sshd_config  file    sshd_config
+                /etc/ssh/sshd_config  perms   0600    owner=root:root
+
+            (one line each, without the \\). A params source is a parameters
+            list of payload/var/lists, as confedit.py reads it, set in
+            section, new ones added after parameter after. A file source is
+            the whole contents of the file, from payload/var/targets. A
+            perms source is the octal mode of the file, - to leave it, and
+            owner its user:group, looked up in etc/passwd and etc/group of
+            the root it is applied to; the file is not read for a perms
+            source alone.
+
+            Every declaration and source is read once and indexed by
+            configuration file into a plan: the contents to replace it
+            with, if any, every parameter to set, its mode and owner. When
+            two sources set the same parameter of the same section, or two
+            file or perms sources the same file, the one declared last
+            wins, and the conflict is reported. The plans are cached
+            (pickle) with the size and mtime of every list and target they
+            were compiled from, and only compiled again when one of those
+            changed.
+
+            Each plan is applied by confedit.py: the file is read once, the
+            contents replaced and parameters set in memory, and written
+            once, only if anything changed. A standard setting 40 files does
+            40 reads and at most 40 writes, however many sources each file
+            has.
+
+            Paths are relative to $exeDir, so in test mode the fake root is
+            changed, not the real one. The files named after the standard,
+            as declared, are the only ones planned or changed, so a module
+            script applies the plans of the files it hardens, e.g.
+            harden_samba.sh those of /etc/samba/smb.conf.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/04/28
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import pickle
+import stat
+import sys
+import time
+
+from confedit import ConfigFile, loadParams, paramKey
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# kinds of source a configuration file can have, and the options of each
+sourceKinds = ('params', 'file', 'perms')
+kindOptions = {'params': ('section', 'after'), 'file': (),
+               'perms': ('owner',)}
+
+# changes when the plans saved to the cache are laid out differently
+planVersion = 2
+
+# lists and targets of the payload this file is in, unless the environment
+#   says otherwise
+payloadDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+defaultListsDir = os.path.join(payloadDir, 'var', 'lists')
+defaultTargetsDir = os.path.join(payloadDir, 'var', 'targets')
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def standardFiles(standard, cacheFile=None):
+    ''' Return (declarationsFile, listsDir, targetsDir, cacheFile) of      '''
+    ''' standard, from the environment, else this payload; cacheFile,      '''
+    ''' unless given, is in $tmpDir, None without it.                      '''
+    listsDir = os.environ.get('varLists') or \
+        os.environ.get('instLists') or defaultListsDir
+    targetsDir = os.environ.get('varTargets') or defaultTargetsDir
+    if cacheFile is None and os.environ.get('tmpDir'):
+        cacheFile = os.path.join(os.environ['tmpDir'],
+                                 standard + '_configs.plan')
+    declarationsFile = os.path.join(listsDir, standard + '_configs.list')
+    return(declarationsFile, listsDir, targetsDir, cacheFile)
+
+
+def loadDeclarations(declarationsFile):
+    ''' Read declarationsFile. Returns (0, '', [(path, kind, source,       '''
+    ''' {option: value})]) in declared order, else (1, error message, []). '''
+    declarations = []
+
+    try:
+        fp = open(declarationsFile, 'r')
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open configurations list %s: %s'
+               % (declarationsFile, value), [])
+
+    for (number, line) in enumerate(fp):
+        # skip comments and blank lines
+        fields = line.split('#')[0].split()
+        if not fields:
+            continue
+        if len(fields) < 3 or fields[1] not in sourceKinds:
+            fp.close()
+            return(1, '%s line %s: expected: path %s source [option=value]'
+                   % (declarationsFile, number + 1, '|'.join(sourceKinds)),
+                   [])
+
+        options = {}
+        for field in fields[3:]:
+            (option, sep, value) = field.partition('=')
+            if option not in kindOptions[fields[1]] or not value:
+                fp.close()
+                return(1, '%s line %s: unknown option %s, expected %s'
+                       % (declarationsFile, number + 1, field,
+                          ' or '.join(['%s=...' % name for name in
+                                       kindOptions[fields[1]]]) or 'none'),
+                       [])
+            options[option] = value
+        if fields[1] == 'perms' and fields[2] != '-':
+            try:
+                int(fields[2], 8)
+            except ValueError:
+                fp.close()
+                return(1, '%s line %s: mode %s is not octal, or -'
+                       % (declarationsFile, number + 1, fields[2]), [])
+        declarations.append((fields[0], fields[1], fields[2], options))
+    fp.close()
+
+    # return 0 for success, no error message, and the declarations
+    return(0, '', declarations)
+
+
+def sourcePath(kind, source, listsDir, targetsDir):
+    ''' path of source of kind '''
+    if kind == 'file':
+        return(os.path.join(targetsDir, source))
+    return(os.path.join(listsDir, source))
+
+
+def compilePlans(declarations, listsDir, targetsDir):
+    ''' Compile declarations into plans. Returns (0, '', plans, conflicts) '''
+    ''' with plans {path: {'replace': (source, contents) or None,          '''
+    ''' 'params': [(section, name, value, after, source)], 'mode': mode or '''
+    ''' None, 'owner': (user, group) or None}} and conflicts [(path,       '''
+    ''' section, name, [(source, value)])], else (1, error message, {},    '''
+    ''' []). A conflict over a whole file has name (file), (mode) or       '''
+    ''' (owner).                                                           '''
+    plans = {}
+    # by path, then (section, name): position in the plan's params, and
+    #   every (source, value) which set it
+    positions = {}
+    setBy = {}
+
+    for (path, kind, source, options) in declarations:
+        plan = plans.setdefault(path, {'replace': None, 'params': [],
+                                       'mode': None, 'owner': None})
+        setBy.setdefault(path, {})
+        positions.setdefault(path, {})
+        sourceFile = sourcePath(kind, source, listsDir, targetsDir)
+
+        if kind == 'perms':
+            if source != '-':
+                plan['mode'] = int(source, 8)
+                setBy[path].setdefault(('', '(mode)'), []).append(
+                    ('perms', source))
+            if 'owner' in options:
+                (user, sep, group) = options['owner'].partition(':')
+                plan['owner'] = (user or None, group or None)
+                setBy[path].setdefault(('', '(owner)'), []).append(
+                    ('perms', options['owner']))
+            continue
+
+        if kind == 'file':
+            try:
+                fp = open(sourceFile, 'rb')
+                contents = fp.read().decode('latin-1')
+                fp.close()
+            except Exception:
+                # if error, return error message
+                (type, value, traceback) = sys.exc_info()
+                return(1, 'Could not read target %s: %s'
+                       % (sourceFile, value), {}, [])
+            plan['replace'] = (source, contents)
+            setBy[path].setdefault(('', '(file)'), []).append(
+                (source, '(file)'))
+            continue
+
+        (ecode, rval, params) = loadParams(sourceFile)
+        if ecode != 0:
+            return(1, rval, {}, [])
+        section = options.get('section')
+        after = options.get('after')
+        for (name, value) in params:
+            key = (paramKey(section or ''), paramKey(name))
+            setBy[path].setdefault(key, []).append((source, value))
+            entry = (section, name, value, after, source)
+            if key in positions[path]:
+                # declared last wins, in the place it was first declared
+                plan['params'][positions[path][key]] = entry
+            else:
+                positions[path][key] = len(plan['params'])
+                plan['params'].append(entry)
+
+    conflicts = []
+    for path in sorted(setBy):
+        for (key, values) in sorted(setBy[path].items()):
+            if len(set([value for (source, value) in values])) > 1 or \
+                    (key == ('', '(file)') and len(values) > 1):
+                conflicts.append((path, key[0], key[1], values))
+
+    # return 0 for success, no error message, plans and conflicts
+    return(0, '', plans, conflicts)
+
+
+def conflictMessages(conflicts):
+    ''' a line describing each conflict compilePlans returned '''
+    return(['conflict: %s [%s] %s set by %s, %s wins'
+            % (path, section, name,
+               ', '.join(['%s (%s)' % entry for entry in values]),
+               values[-1][0])
+            for (path, section, name, values) in conflicts])
+
+
+def inputStates(files):
+    ''' {file: (size, mtime)} of files, None for a file which is missing '''
+    states = {}
+    for filename in files:
+        try:
+            fstat = os.stat(filename)
+            states[filename] = (fstat.st_size, fstat.st_mtime)
+        except OSError:
+            states[filename] = None
+    return(states)
+
+
+def loadPlans(declarationsFile, listsDir, targetsDir, cacheFile=None):
+    ''' Return (0, '', plans, conflicts, cached) as compilePlans returns   '''
+    ''' them, read from cacheFile if none of the files they were compiled  '''
+    ''' from changed since, else compiled and saved to it; cached is True  '''
+    ''' if they came from the cache. Else (1, error message, {}, [],       '''
+    ''' False).                                                            '''
+    # cache holds {'version': , 'inputs': {file: (size, mtime)}, 'plans': ,
+    #   'conflicts': }
+    if cacheFile is not None and os.access(cacheFile, os.F_OK):
+        try:
+            fp = open(cacheFile, 'rb')
+            cache = pickle.load(fp)
+            fp.close()
+        except Exception:
+            # unreadable cache, compile again
+            cache = None
+        if cache is not None and cache['version'] == planVersion and \
+                inputStates(cache['inputs']) == cache['inputs']:
+            return(0, '', cache['plans'], cache['conflicts'], True)
+
+    (ecode, rval, declarations) = loadDeclarations(declarationsFile)
+    if ecode != 0:
+        return(1, rval, {}, [], False)
+    # stat before reading, so a file changed while compiling is compiled
+    #   again next time
+    inputs = inputStates([declarationsFile] +
+                         [sourcePath(kind, source, listsDir, targetsDir)
+                          for (path, kind, source, options) in declarations
+                          if kind != 'perms'])
+    (ecode, rval, plans, conflicts) = compilePlans(declarations, listsDir,
+                                                   targetsDir)
+    if ecode != 0:
+        return(1, rval, {}, [], False)
+
+    if cacheFile is not None:
+        try:
+            fp = open(cacheFile + '.tmp', 'wb')
+            pickle.dump({'version': planVersion, 'inputs': inputs,
+                         'plans': plans, 'conflicts': conflicts}, fp, 2)
+            fp.close()
+            os.rename(cacheFile + '.tmp', cacheFile)
+        except Exception:
+            # no cache, compiled again next time
+            pass
+
+    # return 0 for success, no error message, plans and conflicts
+    return(0, '', plans, conflicts, False)
+
+
+def planConfig(config, plan):
+    ''' Apply plan to ConfigFile config, in memory. Returns [(result,      '''
+    ''' section, name, value)], result 'set', 'changed' or 'added'. The    '''
+    ''' config is only changed if its contents end up different from what  '''
+    ''' was read, and then every result counts from the replaced contents. '''
+    original = config.text()
+    if plan['replace'] is not None:
+        (source, contents) = plan['replace']
+        config.replace(contents)
+
+    # parameters added after the same one keep their declared order
+    results = []
+    lastAdded = {}
+    for (section, name, value, after, source) in plan['params']:
+        anchor = lastAdded.get((section, after), after)
+        result = config.set(name, value, section, anchor)
+        if result == 'added' and after is not None:
+            lastAdded[(section, after)] = name
+        results.append((result, section, name, value))
+
+    config.changed = config.text() != original
+    if not config.changed:
+        # already the planned contents, whatever the replaced ones were
+        results = [('set',) + entry[1:] for entry in results]
+    if plan['replace'] is not None:
+        results.insert(0, (config.changed and 'changed' or 'set', None,
+                           plan['replace'][0], '(file)'))
+    return(results)
+
+
+def loadIds(rootDir, overlay=None):
+    ''' Return (0, '', {'uid': {user: uid}, 'gid': {group: gid}}) of the  '''
+    ''' users and groups of rootDir, from its etc/passwd and etc/group,    '''
+    ''' read through overlay when given, else (1, error message, {}).      '''
+    ids = {}
+    for (key, filename) in (('uid', 'passwd'), ('gid', 'group')):
+        ids[key] = {}
+        try:
+            if overlay is None:
+                fp = open(rootDir + '/etc/' + filename, 'r')
+            else:
+                fp = overlay.open('/etc/' + filename, 'r')
+            for line in fp:
+                fields = line.rstrip('\n').split(':')
+                if len(fields) > 2 and fields[2].isdigit():
+                    ids[key].setdefault(fields[0], int(fields[2]))
+            fp.close()
+        except Exception:
+            # if error, return error message
+            (type, value, traceback) = sys.exc_info()
+            return(1, 'Could not read %s/etc/%s: %s'
+                   % (rootDir, filename, value), {})
+    # return 0 for success, no error message, and the ids
+    return(0, '', ids)
+
+
+def planPerms(fstat, plan, ids):
+    ''' Compare the mode and owner of plan with fstat, the stat of its     '''
+    ''' file. Returns (0, '', results, (mode, uid, gid)) as planConfig     '''
+    ''' returns results, with names (mode) and (owner), and the mode and   '''
+    ''' owner the file is to have, else (1, error message, [], None).      '''
+    mode = stat.S_IMODE(fstat.st_mode)
+    (uid, gid) = (fstat.st_uid, fstat.st_gid)
+    results = []
+    if plan.get('mode') is not None:
+        results.append((plan['mode'] == mode and 'set' or 'changed', None,
+                        '(mode)', '%04o' % plan['mode']))
+        mode = plan['mode']
+    if plan.get('owner') is not None:
+        (user, group) = plan['owner']
+        try:
+            if user is not None:
+                uid = ids['uid'][user]
+            if group is not None:
+                gid = ids['gid'][group]
+        except KeyError:
+            (type, value, traceback) = sys.exc_info()
+            return(1, 'No such user or group %s' % value, [], None)
+        results.append(((uid, gid) == (fstat.st_uid, fstat.st_gid) and
+                        'set' or 'changed', None, '(owner)',
+                        '%s:%s' % (user or '', group or '')))
+    # return 0 for success, no error message, results and the new state
+    return(0, '', results, (mode, uid, gid))
+
+
+def applyPerms(filename, plan, ids, results):
+    ''' Set the mode and owner of plan on filename, if they differ,        '''
+    ''' adding the results of planPerms to results. Returns (0, ''), else  '''
+    ''' (1, error message).                                                '''
+    try:
+        fstat = os.stat(filename)
+    except Exception:
+        (type, value, traceback) = sys.exc_info()
+        return(1, value)
+    (ecode, rval, permResults, state) = planPerms(fstat, plan, ids)
+    if ecode != 0:
+        return(1, rval)
+    if [entry for entry in permResults if entry[0] != 'set']:
+        try:
+            os.chown(filename, state[1], state[2])
+            os.chmod(filename, state[0])
+        except Exception:
+            (type, value, traceback) = sys.exc_info()
+            return(1, value)
+    results.extend(permResults)
+    # return 0 for success, no error message
+    return(0, '')
+
+
+def applyPlans(plans, rootDir):
+    ''' Apply each plan to its file under rootDir: one read, changes in    '''
+    ''' memory, at most one write, then its mode and owner set if they     '''
+    ''' differ. Returns (0, '', report), else (1, error messages, report), '''
+    ''' report [(path, results of planConfig and planPerms, True if        '''
+    ''' written)] in path order.                                           '''
+    report = []
+    errors = []
+    ids = None
+    if [plan for plan in plans.values() if plan.get('owner') is not None]:
+        (ecode, rval, ids) = loadIds(rootDir)
+        if ecode != 0:
+            return(1, rval, report)
+
+    for path in sorted(plans):
+        plan = plans[path]
+        # only read the file if its contents are planned
+        results = []
+        written = False
+        filename = os.path.realpath(rootDir + path)
+        if plan['replace'] is not None or plan['params']:
+            try:
+                config = ConfigFile(rootDir + path)
+            except Exception:
+                (type, value, traceback) = sys.exc_info()
+                errors.append('Could not read %s: %s' % (rootDir + path,
+                                                         value))
+                continue
+            results = planConfig(config, plan)
+            written = config.changed
+            rval = config.write()
+            if rval != 0:
+                errors.append('Could not write %s: %s' % (rootDir + path,
+                                                          rval))
+                report.append((path, results, False))
+                continue
+
+        if plan.get('mode') is not None or plan.get('owner') is not None:
+            (ecode, rval) = applyPerms(filename, plan, ids, results)
+            if ecode != 0:
+                errors.append('Could not set mode and owner of %s: %s'
+                              % (rootDir + path, rval))
+        report.append((path, results, written))
+
+    if errors:
+        return(1, '\n'.join(errors), report)
+    # return 0 for success, no error message, and what was done
+    return(0, '', report)
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # optparse, as confedit.py: executed by $pyBin, python 2.6 on CentOS 6
+    from optparse import OptionParser
+
+    startTime = time.time()
+    parser = OptionParser(usage='%prog [options] standard [file ...]')
+    parser.add_option("-r", "--root", dest="ROOTDIR",
+                      default=os.environ.get('exeDir', ''),
+                      help="apply to the files under ROOTDIR, default \
+                      $exeDir, empty in LIVE.")
+    parser.add_option("-c", "--cache", dest="CACHEFILE",
+                      help="plan cache file, default \
+                      $tmpDir/<standard>_configs.plan.")
+    parser.add_option("-n", "--plan-only", action="store_true",
+                      dest="PLANONLY", default=False,
+                      help="print the plan of each file, change nothing.")
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error('a standard is required')
+    standard = args[0]
+
+    (declarationsFile, listsDir, targetsDir, cacheFile) = \
+        standardFiles(standard, options.CACHEFILE)
+    (ecode, rval, plans, conflicts, cached) = loadPlans(declarationsFile,
+                                                        listsDir, targetsDir,
+                                                        cacheFile)
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
+
+    for message in conflictMessages(conflicts):
+        print(message)
+
+    # only the files named, if any
+    if args[1:]:
+        undeclared = [path for path in args[1:] if path not in plans]
+        if undeclared:
+            print('Not declared in %s: %s' % (declarationsFile,
+                                              ' '.join(undeclared)))
+            sys.exit(1)
+        plans = dict([(path, plans[path]) for path in args[1:]])
+
+    if options.PLANONLY:
+        for path in sorted(plans):
+            print('%s:' % path)
+            if plans[path]['replace'] is not None:
+                print('    replace  with %s' % plans[path]['replace'][0])
+            if plans[path]['mode'] is not None:
+                print('    mode     %04o' % plans[path]['mode'])
+            if plans[path]['owner'] is not None:
+                print('    owner    %s:%s' % tuple([name or '' for name in
+                                                    plans[path]['owner']]))
+            for (section, name, value, after, source) in \
+                    plans[path]['params']:
+                print('    set      [%s] %s = %s  (%s)'
+                      % (section or '', name, value, source))
+        sys.exit(0)
+
+    (ecode, rval, report) = applyPlans(plans, options.ROOTDIR)
+    for (path, results, written) in report:
+        changes = [entry for entry in results if entry[0] != 'set']
+        print('%s: %s of %s set, %s' % (path, len(results) - len(changes),
+                                        len(results),
+                                        written and 'written' or 'unchanged'))
+        for (result, section, name, value) in changes:
+            print('    %-8s [%s] %s = %s' % (result, section or '', name,
+                                             value))
+    print('%s files read, %s written, plan %s, in %.2f seconds'
+          % (len(report), len([entry for entry in report if entry[2]]),
+             cached and 'from cache' or 'compiled',
+             time.time() - startTime))
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
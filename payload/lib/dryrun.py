@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Print what a standard would change, as a unified diff and a
+#            mode and ownership delta, from memory, without changing any
+#            file or executing any program.
+#            ------------------------------------------------------------------
+#            Use: "$pyBin" "$instLib/dryrun.py" tdsh
+#                 python3 install.py -s tdsh --dry-run --fail-on-change
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/05/05
+
+
+
+"""
+PURPOSE:    Test mode executes the standard against a fake root, which
+            still executes chmod, chown, cp and sed for every change, and
+            with -r resets the files after each execution. For a check of
+            what a standard would do, in CI, none of that is needed.
+
+            The changes a standard declares, in
+            payload/var/lists/<standard>_configs.list (see confplan.py), are
+            evaluated against a VirtualRoot: the files under the root are
+            read, and stat'ed, once each when first needed, and every write,
+            chmod and chown is kept in memory. When every plan is
+            evaluated, the VirtualRoot holds the files as the standard would
+            leave them, and what changed is printed:
+
+                --- a/etc/samba/smb.conf
+                +++ b/etc/samba/smb.conf
+                @@ -3,2 +3,3 @@
+                     security = user
+                +    hosts allow = 127.
+                ...
+                mode   /etc/samba/smb.conf  0664 -> 0644
+                owner  /etc/samba/smb.conf  root:wheel -> root:root
+
+            No file is written, and no process is forked: users and groups
+            are looked up in etc/passwd and etc/group of the root, not by
+            stat or id. The exit status is 0, or with -c (install.py
+            --fail-on-change) 1 if anything would change, so CI can fail a
+            host which is not hardened.
+
+            The root is / when executed by root, else the test root of
+            install.py -t: payload/sys is only its upper layer, holding
+            the files test mode has changed, over -b TESTBASE (default /),
+            so the files are read through the Overlay of the two (see
+            overlay.py), from the base until copied up. -r ROOTDIR sets
+            the upper layer, or with -r / the root.
+
+ASSUMPTION: 1) Only the changes declared in <standard>_configs.list are
+               evaluated; those the module scripts make as they execute
+               can only be seen by executing them, e.g. with -t.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/05/05
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import difflib
+import os
+import stat
+import sys
+from collections import namedtuple
+
+from confedit import ConfigFile
+from confplan import (conflictMessages, loadIds, loadPlans, planConfig,
+                      planPerms, standardFiles)
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# mode and owner of a file of a VirtualRoot, as planPerms reads them from a
+#   stat
+VirtualStat = namedtuple('VirtualStat', 'st_mode st_uid st_gid')
+
+# the fake root of test mode, relative to the payload
+payloadDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+defaultTestRoot = os.path.join(payloadDir, 'sys')
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+class VirtualRoot(object):
+    ''' The files under rootDir, read from it, or through overlay when     '''
+    ''' given, and changed in memory only.                                 '''
+
+    def __init__(self, rootDir, overlay=None):
+        self.rootDir = rootDir
+        self.overlay = overlay
+        # by path: contents and stat as read, and as changed, None until
+        #   needed
+        self.readText = {}
+        self.text = {}
+        self.readStat = {}
+        self.stats = {}
+
+    def read(self, path):
+        ''' contents of path, as changed '''
+        if path not in self.text:
+            if self.overlay is None:
+                fp = open(self.rootDir + path, 'rb')
+            else:
+                fp = self.overlay.open(path, 'rb')
+            self.readText[path] = fp.read().decode('latin-1')
+            fp.close()
+            self.text[path] = self.readText[path]
+        return(self.text[path])
+
+    def stat(self, path):
+        ''' VirtualStat of path, as changed '''
+        if path not in self.stats:
+            if self.overlay is None:
+                fstat = os.stat(self.rootDir + path)
+            else:
+                fstat = self.overlayStat(path)
+            self.readStat[path] = VirtualStat(fstat.st_mode, fstat.st_uid,
+                                              fstat.st_gid)
+            self.stats[path] = self.readStat[path]
+        return(self.stats[path])
+
+    def overlayStat(self, path):
+        ''' stat of path in the overlay, following symbolic links as       '''
+        ''' os.stat does; the overlay only lstat's.                        '''
+        for count in range(40):
+            fstat = self.overlay.lstat(path)
+            if not stat.S_ISLNK(fstat.st_mode):
+                return(fstat)
+            path = os.path.normpath(os.path.join(os.path.dirname(path),
+                                                 self.overlay.readlink(path)))
+        raise OSError('Too many levels of symbolic links: %s' % path)
+
+    def write(self, path, contents):
+        ''' change the contents of path '''
+        self.read(path)
+        self.text[path] = contents
+
+    def chmod(self, path, mode):
+        ''' change the permission bits of path '''
+        fstat = self.stat(path)
+        self.stats[path] = fstat._replace(
+            st_mode=stat.S_IFMT(fstat.st_mode) | mode)
+
+    def chown(self, path, uid, gid):
+        ''' change the owner of path '''
+        self.stats[path] = self.stat(path)._replace(st_uid=uid, st_gid=gid)
+
+    def diff(self):
+        ''' unified diff lines of every file whose contents changed '''
+        lines = []
+        for path in sorted(self.text):
+            if self.text[path] == self.readText[path]:
+                continue
+            lines.extend([line.rstrip('\n') for line in difflib.unified_diff(
+                self.readText[path].splitlines(True),
+                self.text[path].splitlines(True),
+                'a' + path, 'b' + path)])
+        return(lines)
+
+    def permsDelta(self, ids=None):
+        ''' [(path, 'mode' or 'owner', was, is)] of every file whose mode  '''
+        ''' or owner changed, owners named by ids as loadIds returns them. '''
+        if ids is None:
+            ids = {}
+        users = dict([(uid, name) for (name, uid) in
+                      ids.get('uid', {}).items()])
+        groups = dict([(gid, name) for (name, gid) in
+                       ids.get('gid', {}).items()])
+        delta = []
+        for path in sorted(self.stats):
+            (was, now) = (self.readStat[path], self.stats[path])
+            if was.st_mode != now.st_mode:
+                delta.append((path, 'mode',
+                              '%04o' % stat.S_IMODE(was.st_mode),
+                              '%04o' % stat.S_IMODE(now.st_mode)))
+            if (was.st_uid, was.st_gid) != (now.st_uid, now.st_gid):
+                delta.append((path, 'owner',
+                              '%s:%s' % (users.get(was.st_uid, was.st_uid),
+                                         groups.get(was.st_gid, was.st_gid)),
+                              '%s:%s' % (users.get(now.st_uid, now.st_uid),
+                                         groups.get(now.st_gid,
+                                                    now.st_gid))))
+        return(delta)
+
+
+def dryRun(plans, rootDir, overlay=None):
+    ''' Evaluate each plan against a VirtualRoot of rootDir, or of overlay '''
+    ''' when given. Returns (0, '', root, ids, report), report as          '''
+    ''' applyPlans returns it, else (1, error messages, root, ids, report). '''
+    root = VirtualRoot(rootDir, overlay)
+    report = []
+    errors = []
+    ids = {}
+    if [plan for plan in plans.values() if plan.get('owner') is not None]:
+        (ecode, rval, ids) = loadIds(rootDir, overlay)
+        if ecode != 0:
+            return(1, rval, root, {}, report)
+
+    for path in sorted(plans):
+        plan = plans[path]
+        results = []
+        try:
+            if plan['replace'] is not None or plan['params']:
+                config = ConfigFile(rootDir + path, root.read(path))
+                results = planConfig(config, plan)
+                if config.changed:
+                    root.write(path, config.text())
+            if plan.get('mode') is not None or \
+                    plan.get('owner') is not None:
+                (ecode, rval, permResults, (mode, uid, gid)) = \
+                    planPerms(root.stat(path), plan, ids)
+                if ecode != 0:
+                    errors.append('%s: %s' % (rootDir + path, rval))
+                else:
+                    root.chmod(path, mode)
+                    root.chown(path, uid, gid)
+                    results.extend(permResults)
+        except Exception:
+            # if error, note it, and evaluate the next plan
+            (type, value, traceback) = sys.exc_info()
+            errors.append('Could not read %s: %s' % (rootDir + path, value))
+            continue
+        report.append((path, results,
+                       root.text.get(path) != root.readText.get(path)))
+
+    if errors:
+        return(1, '\n'.join(errors), root, ids, report)
+    # return 0 for success, no error message, and what would be done
+    return(0, '', root, ids, report)
+
+
+def dryRunStandard(standard, rootDir, cacheFile=None, overlay=None):
+    ''' Print what standard would change under rootDir, read through       '''
+    ''' overlay when given. Returns (0, '', changed), changed True if      '''
+    ''' anything would, else (1, error message, False).                    '''
+    (declarationsFile, listsDir, targetsDir, cacheFile) = \
+        standardFiles(standard, cacheFile)
+    (ecode, rval, plans, conflicts, cached) = loadPlans(declarationsFile,
+                                                        listsDir, targetsDir,
+                                                        cacheFile)
+    if ecode != 0:
+        return(1, rval, False)
+    for message in conflictMessages(conflicts):
+        print(message)
+
+    (ecode, rval, root, ids, report) = dryRun(plans, rootDir, overlay)
+    diffLines = root.diff()
+    delta = root.permsDelta(ids)
+    for line in diffLines:
+        print(line)
+    for (path, kind, was, now) in delta:
+        print('%-6s %s  %s -> %s' % (kind, path, was, now))
+    print('%s files evaluated, %s would change, under %s'
+          % (len(report), len(set([path for (path, kind, was, now)
+                                   in delta]) |
+                              set([path for (path, results, changed)
+                                   in report if changed])),
+             rootDir or '/'))
+    if ecode != 0:
+        return(1, rval, bool(diffLines or delta))
+    # return 0 for success, no error message, and if anything would change
+    return(0, '', bool(diffLines or delta))
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # optparse: like the other payload/lib helpers, also run on python 2.6
+    from optparse import OptionParser
+
+    if os.geteuid() == 0:
+        rootDir = ''
+    else:
+        rootDir = defaultTestRoot
+    parser = OptionParser(usage='%prog [options] standard')
+    parser.add_option("-r", "--root", dest="ROOTDIR", default=rootDir,
+                      help="evaluate against the files under ROOTDIR, \
+                      default / as root, else payload/sys.")
+    parser.add_option("-b", "--testbase", dest="TESTBASE", default='/',
+                      help="base layer under ROOTDIR, a directory or a \
+                      snapshot, as install.py -b, default /.")
+    parser.add_option("-C", "--cache", dest="CACHEFILE",
+                      help="plan cache file, default \
+                      $tmpDir/<standard>_configs.plan.")
+    parser.add_option("-c", "--check", action="store_true", dest="CHECK",
+                      default=False, help="exit with status 1 if anything \
+                      would change.")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error('a standard is required')
+
+    rootDir = options.ROOTDIR.rstrip('/')
+    overlay = None
+    if rootDir:
+        # overlay.py is in the directory of install.py, above the payload
+        sys.path.append(os.path.dirname(payloadDir))
+        from overlay import openOverlay
+        (ecode, rval, overlay) = openOverlay(rootDir, options.TESTBASE)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+    (ecode, rval, changed) = dryRunStandard(args[0], rootDir,
+                                            options.CACHEFILE, overlay)
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
+    if options.CHECK:
+        sys.exit(int(changed))
@@ -11,6 +11,10 @@
 #           need to be modified, it only takes one value to be out of place to
 #           trigger the backup and modification process.
 #
+#           grepit reads the file once for each pair. To check, or set, a
+#           whole list of pairs of one file in a single pass, use
+#           confedit.py (confedit.py -c only checks).
+#
 #  AUTHORS: Jim Browning, Todd E Thomas
 #     DATE: 2012/04/10
 # MODIFIED:
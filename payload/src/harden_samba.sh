@@ -15,7 +15,6 @@
 ###----------------------------------------------------------------------------
 ### VARIABLES
 ###----------------------------------------------------------------------------
-paramsFile="$varLists/samba_populate.list"
 targetSambaConfig="$varTargets/smb.conf"
 
 
@@ -61,66 +60,47 @@ fi
 
 
 ###---
-### Record the permissions on the file
+### Backup the file, to the backup store of this run
 ###---
-getStats "$sysSambaConfig"
-
-
-###---
-### Backup the file
-###---
-cp -p "$sysSambaConfig" "$backupDir"
+"$pyBin" "$instLib/backup.py" save "$sysSambaConfig"
+if [[ "$?" -ne '0' ]]; then
+    printFStat "The Samba configuration cannot be backed up; exiting."
+    exit 1
+fi
 
 
 ###---
 ### Display configuration and normalize the file
 ###---
-displayConfig "$backupDir/${sysSambaConfig##*/}" > "$sysSambaConfig"
+displayConfig "$sysSambaConfig" > "$sysSambaConfig.display"
+cat "$sysSambaConfig.display" > "$sysSambaConfig"
+rm -f "$sysSambaConfig.display"
 printInfo ""
 printInfo ""
 
 
 ###---
-### Diff the file and update it to the required specification.
+### Diff the file against the specification
 ###---
 diff "$sysSambaConfig" "$targetSambaConfig"  >/dev/null
 if [[ "$?" -ne '0' ]]; then
     printInfo "The Samba configuration file does not meet the specification."
-    printInfo "Adding new parameters:"
-    # Read parameters into a while loop
-    # URL: http://goo.gl/sehtX
-    while IFS='\t' read -r confLine; do
-        [[ "$confLine" = \#* ]] && continue
-        # Using BASH PE (parameter expansion)
-        # URL: http://goo.gl/stZWt
-        strSrch="${confLine%% = *}"
-        grep "$strSrch" "$sysSambaConfig"
-        if [[ "$?" -ne '0' ]]; then
-            printInfo "$confLine"
-            sed -i "/security \= user/a\ $confLine" "$sysSambaConfig"
-        else
-            printSStat "$confLine is already set in the configuration."
-        fi
-    done < "$paramsFile"
 else
     printInfo "Samba configuration file meets the specification."
 fi
 
 
 ###---
-### Ensure correct permissions and ownership
+### Set the parameters, permissions and ownership declared for the file in
+### tdsh_configs.list: in one pass over the file, written only if anything
+### changed; see confplan.py
 ###---
-### Ensure permissions are correct on the new file
-printInfo ""
-printInfo "Re-applying original permissions to the file."
-chmod "$fsoPerms" "$sysSambaConfig"
-
-
-###---
-### Ensure correct ownership
-###---
-printInfo "Re-applying original user and group ownership to the file."
-chown "$fsoOwner:$fsoGroup" "$sysSambaConfig"
+printInfo "Setting parameters, permissions and ownership:"
+"$pyBin" "$instLib/confplan.py" tdsh "$sysSambaConfig"
+if [[ "$?" -ne '0' ]]; then
+    printFStat "The Samba configuration cannot be set; exiting."
+    exit 1
+fi
 
 
 ###---
@@ -134,7 +114,7 @@ displayConfig "$sysSambaConfig"
 ###---
 ### Reset Test
 ###---
-cp -p "$backupDir/smb.conf" "$sysSambaConfig"
+"$pyBin" "$instLib/backup.py" restore "$sysSambaConfig"
 
 
 ###---
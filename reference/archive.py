@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Write the results archive in-process, as the results are
+#            produced, optionally compressing it on several threads.
+#            ------------------------------------------------------------------
+#            Use: archive = ResultsArchive('results.tgz', threads=4)
+#                 archive.add(filename, arcname)
+#                 (files, bytesIn, bytesOut, seconds) = archive.close()
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/03/10
+
+
+
+"""
+PURPOSE:    Build results.tgz with the tarfile module instead of executing
+            tar once everything is written. install.py opens the archive
+            before it writes the report, and adds each file to it as soon
+            as that file is complete.
+
+            With threads > 0 the tar stream is cut into blocks which are
+            compressed at the same time on that many threads, each block as
+            its own gzip member, and written out in order. A file made of
+            several gzip members is a valid gzip file, so the archive is
+            extracted the usual way: tar -xzf results.tgz
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/03/10
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import tarfile
+import threading
+import time
+import zlib
+
+# Queue was renamed to queue in Python 3
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# size of the blocks compressed on each thread
+compressBlockSize = 1024 * 1024
+
+# gzip compression level, same as tar -z
+compressLevel = 6
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+class CompressJob(object):
+    ''' one block of data, and its gzip member once compressed '''
+
+    def __init__(self, data):
+        self.data = data
+        self.result = None
+        self.done = threading.Event()
+
+
+def compressWorker(jobQueue):
+    ''' compress jobs from jobQueue until it hands us None '''
+    while True:
+        job = jobQueue.get()
+        if job is None:
+            return
+        # wbits 31 writes a complete gzip member, header and trailer included
+        compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, 31)
+        job.result = compressor.compress(job.data) + compressor.flush()
+        job.data = None
+        job.done.set()
+
+
+class ParallelGzipWriter(object):
+    ''' File-like object gzip compressing what is written to it on several '''
+    ''' threads, and writing the compressed blocks to fileobj in order. At '''
+    ''' most two blocks per thread are held in memory at any time.        '''
+
+    def __init__(self, fileobj, threads):
+        self.fileobj = fileobj
+        self.buffer = []
+        self.buffered = 0
+        self.pending = []
+        self.maxPending = 2 * threads
+        self.bytesOut = 0
+
+        self.jobQueue = queue.Queue()
+        self.workers = []
+        for i in range(threads):
+            thread = threading.Thread(target=compressWorker,
+                                      args=(self.jobQueue,))
+            # Allows program to exit if only the worker threads are alive
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+
+    def write(self, data):
+        ''' buffer data, handing each full block to the compress threads '''
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= compressBlockSize:
+            self.submit()
+
+    def submit(self):
+        ''' hand the buffered data to the compress threads as one block '''
+        if not self.buffered:
+            return
+        job = CompressJob(b''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+        self.pending.append(job)
+        self.jobQueue.put(job)
+        while len(self.pending) > self.maxPending:
+            self.writeOldest()
+
+    def writeOldest(self):
+        ''' wait for the oldest block to be compressed, then write it out '''
+        job = self.pending.pop(0)
+        job.done.wait()
+        self.fileobj.write(job.result)
+        self.bytesOut += len(job.result)
+
+    def close(self):
+        ''' compress what is left, write every block, stop the threads '''
+        self.submit()
+        while self.pending:
+            self.writeOldest()
+        for thread in self.workers:
+            self.jobQueue.put(None)
+        for thread in self.workers:
+            thread.join()
+        self.fileobj.close()
+
+
+class ResultsArchive(object):
+    ''' gzip compressed tar archive, written as files are added to it '''
+
+    def __init__(self, tarFile, threads=0):
+        self.tarFile = tarFile
+        self.files = 0
+        self.bytesIn = 0
+        self.startTime = time.time()
+
+        if threads > 0:
+            self.writer = ParallelGzipWriter(open(tarFile, 'wb'), threads)
+            self.tar = tarfile.open(fileobj=self.writer, mode='w|')
+        else:
+            self.writer = None
+            self.tar = tarfile.open(tarFile, 'w:gz')
+
+    def add(self, filename, arcname):
+        ''' add filename, or directory filename and its contents, to the   '''
+        ''' archive under name arcname                                     '''
+        for (path, name) in self.walk(filename, arcname):
+            self.tar.add(path, name, recursive=False)
+            self.files += 1
+            if os.path.isfile(path) and not os.path.islink(path):
+                self.bytesIn += os.path.getsize(path)
+
+    def walk(self, filename, arcname):
+        ''' list (path, arcname) of filename and, if a directory, all its  '''
+        ''' contents, in a stable order                                    '''
+        entries = [(filename, arcname)]
+        if os.path.isdir(filename) and not os.path.islink(filename):
+            for name in sorted(os.listdir(filename)):
+                entries.extend(self.walk(os.path.join(filename, name),
+                                         arcname + '/' + name))
+        return(entries)
+
+    def close(self):
+        ''' Finish the archive. Returns (files, bytes archived, bytes      '''
+        ''' written, seconds since the archive was opened).               '''
+        self.tar.close()
+        if self.writer is not None:
+            self.writer.close()
+        bytesOut = os.path.getsize(self.tarFile)
+        return(self.files, self.bytesIn, bytesOut,
+               time.time() - self.startTime)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Keep one copy of each web page asset (style sheet, images) for
+#            all the reports, and link every report directory to it.
+#            ------------------------------------------------------------------
+#            Use: (ecode, rval, placed) = linkAssets(cssDir, reportAssets,
+#                                                    storeDir, resultsHTMLdir)
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/03/17
+
+
+
+"""
+PURPOSE:    Every report directory needs hardening.css and its images. They
+            are the same for every run, so instead of copying them into each
+            new directory, one copy of each is kept in a store directory,
+            named by the sha1 of its contents:
+
+                logs/assets/<sha1>.css
+                logs/assets/<sha1>.gif
+
+            and each report directory gets a hard link to it. Where a hard
+            link is not possible (store on another file system, or links
+            not permitted), the file is cloned (reflink) if the file system
+            supports it, and copied as a last resort.
+
+            An asset which changes in payload/docs/css gets a new digest, so
+            it is stored next to the old one, and reports written before
+            keep the asset they were written with.
+
+ASSUMPTION: 1) Files in the store, and so the assets of a report directory,
+                are never edited in place.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/03/17
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import shutil
+import sys
+
+from toolchain import fileDigest
+
+# fcntl is only there on unix, without it assets are copied instead of cloned
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# assets the web page refers to, in payload/docs/css
+reportAssets = ['hardening.css', 'bg.gif', 'bottom.gif', 'procedure.gif',
+                'Teradata.gif', 'T_Header.gif']
+
+# Linux FICLONE ioctl, _IOW(0x94, 9, int): share the extents of a file
+FICLONE = 0x40049409
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def cloneFile(srcFile, destFile):
+    ''' Make destFile a reflink of srcFile, sharing its blocks. Returns    '''
+    ''' True on success, else False with no destFile left behind.          '''
+    if fcntl is None:
+        return(False)
+
+    srcFp = open(srcFile, 'rb')
+    destFp = open(destFile, 'wb')
+    try:
+        fcntl.ioctl(destFp.fileno(), FICLONE, srcFp.fileno())
+        cloned = True
+    except (IOError, OSError):
+        # file system can not clone
+        cloned = False
+    destFp.close()
+    srcFp.close()
+
+    if not cloned:
+        os.remove(destFile)
+    return(cloned)
+
+
+def storeAsset(srcFile, storeDir):
+    ''' Return the path of the copy of srcFile in storeDir, adding it to   '''
+    ''' the store first if its contents are not there yet.                 '''
+    extension = os.path.splitext(srcFile)[1]
+    storedFile = os.path.join(storeDir, fileDigest(srcFile) + extension)
+
+    if not os.path.isfile(storedFile):
+        # add under a temporary name and rename, so a run never links to a
+        #   file another run is still copying
+        tmpFile = '%s.%d' % (storedFile, os.getpid())
+        shutil.copy(srcFile, tmpFile)
+        os.chmod(tmpFile, 0o444)
+        os.rename(tmpFile, storedFile)
+    return(storedFile)
+
+
+def placeAsset(storedFile, destFile):
+    ''' Put storedFile at destFile, as a hard link, else a reflink, else a '''
+    ''' copy. Returns how it was placed: 'link', 'clone' or 'copy'.        '''
+    try:
+        os.link(storedFile, destFile)
+        return('link')
+    except OSError:
+        # other file system, or hard links not permitted
+        pass
+
+    if cloneFile(storedFile, destFile):
+        return('clone')
+
+    shutil.copy(storedFile, destFile)
+    return('copy')
+
+
+def linkAssets(srcDir, assetNames, storeDir, destDir):
+    ''' Place each of assetNames of srcDir in destDir, from the store at   '''
+    ''' storeDir. Returns (0, '', {'link': n, 'clone': n, 'copy': n}),     '''
+    ''' else (1, error message, counts so far).                            '''
+    placed = {'link': 0, 'clone': 0, 'copy': 0}
+
+    try:
+        if os.path.isdir(storeDir) is False:
+            os.makedirs(storeDir, mode=0o755)
+        for name in assetNames:
+            storedFile = storeAsset(os.path.join(srcDir, name), storeDir)
+            placed[placeAsset(storedFile, os.path.join(destDir, name))] += 1
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not place web page assets in %s: %s'
+               % (destDir, value), placed)
+
+    # return 0 for success, no error message, and how assets were placed
+    return(0, '', placed)
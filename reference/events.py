@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Structured events from the modules of a standard: module start
+#            and end, test case status, files changed, durations.
+#            ------------------------------------------------------------------
+#            Use: from events import emit, moduleEvents, runCommand
+#                 with moduleEvents('harden_sshd.py'):
+#                     emit('test', tcid=tcid, status='PASS')
+#                     emit('file', path='/etc/ssh/sshd_config',
+#                          action='changed')
+#                     (returncode, stdout, stderr) = \
+#                         runCommand([SERVICE_PROGRAM, 'sshd', 'reload'])
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/03/31
+
+
+
+"""
+PURPOSE:    Modules report what they do on their standard output, one event
+            per line, as a JSON object behind a marker:
+
+                ##EVENT {"event": "test", "tcid": "TC_...", "status": "PASS"}
+
+            install.py takes these lines out of the output before it reaches
+            the console, the text log and the web page, and writes each event
+            to logs/<date>_installOutput_<host>.jsonl, next to the text log.
+            The module and test case tables of the web page, the status of
+            the STIG csv file, and the results database are built from the
+            events.
+
+            Events, and their fields besides "event" and "time" (seconds
+            since the epoch, added by install.py when missing):
+
+                module-start    module
+                module-end      module, status (PASS or FAIL), timing
+                test            tcid, status, module
+                file            path, action (changed, created, removed),
+                                module
+                command         command, status (exit status), timing,
+                                module
+
+            timing is the resources used from start to end, by the module
+            and the commands it executed:
+
+                duration        wall clock seconds
+                cpu             user and system CPU seconds
+                children        commands executed with runCommand()
+                readBytes       bytes read from disk (block I/O)
+                writeBytes      bytes written to disk (block I/O)
+
+            Any language can emit events, e.g. from bash:
+
+                echo '##EVENT {"event": "test", "tcid": "'$tcid'", \\
+                    "status": "PASS", "module": "'$myFileName'"}'
+
+ASSUMPTION: 1) An event line is written, and flushed, in one write, so it
+                is never interleaved with other output.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/03/31
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# start of a line holding an event rather than output
+eventMarker = '##EVENT '
+
+# module emitting events, see moduleEvents()
+currentModule = os.environ.get('exeScriptname', '')
+
+# commands executed with runCommand() so far
+commandCount = 0
+
+# size of the blocks counted by getrusage() for block I/O
+rusageBlockSize = 512
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def emit(event, **fields):
+    ''' Write one event of type event, with fields, to standard output.  '''
+    ''' The module field defaults to the module being executed.          '''
+    fields['event'] = event
+    fields.setdefault('time', time.time())
+    if currentModule:
+        fields.setdefault('module', currentModule)
+    sys.stdout.write(eventMarker + json.dumps(fields, sort_keys=True) + '\n')
+    sys.stdout.flush()
+
+
+def usage(who=(resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)):
+    ''' Return (wall clock, CPU seconds, blocks read, blocks written) used '''
+    ''' so far by this process, and the children it waited for.           '''
+    (cpu, blocksIn, blocksOut) = (0.0, 0, 0)
+    for rusageWho in who:
+        rusage = resource.getrusage(rusageWho)
+        cpu += rusage.ru_utime + rusage.ru_stime
+        blocksIn += rusage.ru_inblock
+        blocksOut += rusage.ru_oublock
+    return(time.time(), cpu, blocksIn, blocksOut)
+
+
+def timing(startUsage, endUsage, children):
+    ''' timing fields of an event, from two usage() results '''
+    return({'duration': round(endUsage[0] - startUsage[0], 3),
+            'cpu': round(endUsage[1] - startUsage[1], 3),
+            'children': children,
+            'readBytes': (endUsage[2] - startUsage[2]) * rusageBlockSize,
+            'writeBytes': (endUsage[3] - startUsage[3]) * rusageBlockSize})
+
+
+@contextmanager
+def moduleEvents(module):
+    ''' Emit module-start, then module-end with the timing of the block   '''
+    ''' and status FAIL if it raised, else PASS.                          '''
+    global currentModule
+
+    currentModule = module
+    startUsage = usage()
+    startCommands = commandCount
+    emit('module-start', module=module)
+    status = 'FAIL'
+    try:
+        yield
+        status = 'PASS'
+    finally:
+        fields = timing(startUsage, usage(), commandCount - startCommands)
+        emit('module-end', module=module, status=status, **fields)
+
+
+def runCommand(cmd, **popenArgs):
+    ''' Execute external command cmd, a list, as subprocess.Popen would,   '''
+    ''' with its output captured, and emit a command event with its exit   '''
+    ''' status and timing. Returns (exit status, stdout, stderr).          '''
+    global commandCount
+
+    commandCount += 1
+    popenArgs.setdefault('stdout', subprocess.PIPE)
+    popenArgs.setdefault('stderr', subprocess.PIPE)
+    # only the resources of the command, which is the child we wait for
+    startUsage = usage((resource.RUSAGE_CHILDREN,))
+    process = subprocess.Popen(cmd, **popenArgs)
+    (stdout, stderr) = process.communicate()
+    fields = timing(startUsage, usage((resource.RUSAGE_CHILDREN,)), 1)
+    emit('command', command=' '.join(cmd), status=process.returncode,
+         **fields)
+    return(process.returncode, stdout, stderr)
+
+
+def parseEvent(line):
+    ''' Return the event of an event line, None for a line of output or a '''
+    ''' malformed event line.                                              '''
+    if not line.startswith(eventMarker):
+        return(None)
+    try:
+        event = json.loads(line[len(eventMarker):])
+    except ValueError:
+        return(None)
+    if not isinstance(event, dict) or 'event' not in event:
+        return(None)
+    event.setdefault('time', time.time())
+    return(event)
+
+
+class EventDemux(object):
+    ''' Line handler taking events out of the standard's output: event     '''
+    ''' lines are written to eventsFile and passed to each function in     '''
+    ''' eventHandlers as handler(event), every other line goes on to each  '''
+    ''' function in lineHandlers as handler(streamName, line).             '''
+
+    def __init__(self, eventsFile, lineHandlers, eventHandlers=()):
+        self.eventsFile = eventsFile
+        self.fp = open(eventsFile, 'w')
+        self.lineHandlers = list(lineHandlers)
+        self.eventHandlers = list(eventHandlers)
+        # module: {'status': , 'duration': , 'end': module-end event}, in
+        #   order of first event
+        self.modules = {}
+        self.moduleOrder = []
+        # command events, in order
+        self.commands = []
+        # test cases, [(tcid, module, status)], first status of each kept
+        self.tests = []
+        self.testStatus = {}
+        self.files = []
+
+    def handler(self, streamName, line):
+        ''' line handler, as streamProcess of install.py calls it '''
+        if streamName == 'stdout':
+            event = parseEvent(line)
+            if event is not None:
+                self.record(event)
+                return
+        for lineHandler in self.lineHandlers:
+            lineHandler(streamName, line)
+
+    def record(self, event):
+        ''' log event, add it to the summaries, and pass it on '''
+        self.fp.write(json.dumps(event, sort_keys=True) + '\n')
+        self.fp.flush()
+
+        kind = event['event']
+        module = event.get('module', '')
+        if module and module not in self.modules:
+            self.modules[module] = {'status': '', 'duration': None,
+                                    'end': None}
+            self.moduleOrder.append(module)
+        if kind == 'module-end' and module:
+            self.modules[module]['status'] = event.get('status', '')
+            self.modules[module]['duration'] = event.get('duration')
+            self.modules[module]['end'] = event
+        elif kind == 'command' and 'command' in event:
+            self.commands.append(event)
+        elif kind == 'test' and 'tcid' in event:
+            if event['tcid'] not in self.testStatus:
+                self.testStatus[event['tcid']] = event.get('status', '')
+                self.tests.append((event['tcid'], module,
+                                   event.get('status', '')))
+        elif kind == 'file' and 'path' in event:
+            self.files.append((event['path'], event.get('action', ''),
+                               module))
+
+        for eventHandler in self.eventHandlers:
+            eventHandler(event)
+
+    def close(self):
+        self.fp.close()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Harden many hosts from one controller: execute install.py on
+#            every host of an inventory and collect their results.
+#            ------------------------------------------------------------------
+#            Use: python3 install.py -s stig -i hosts.list -P 16
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/03/03
+
+
+
+"""
+PURPOSE:    Dispatch a hardening run to every host of an inventory, up to N
+            hosts at a time, print the progress of each host as it comes
+            back, prefixed with the host name, and pull every host's
+            results.tgz back to one collection directory:
+
+                <collectDir>/<host>.log           output of the run
+                <collectDir>/<host>_results.tgz   results archive
+
+            The inventory holds one host per line, its name followed by the
+            transport used to reach it:
+
+                # host      transport   target
+                node01      ssh
+                node02      ssh         root@10.0.0.2
+                lab01       local       /srv/hardening/lab01
+
+            ssh     executes hardening/install.py in the home directory of
+                    the target (default: the host name) over ssh, and copies
+                    hardening/logs/results.tgz back with scp.
+
+            local   stands in for a remote host on this machine: executes
+                    install.py of the hardening tree at target, always in
+                    test mode, so it only changes files under that tree's
+                    alternate root, payload/sys. Give each such host its own
+                    copy of the tree to simulate a fleet on one machine.
+
+ASSUMPTION: 1) ssh hosts accept our key without a password (BatchMode).
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/03/03
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+# Queue was renamed to queue in Python 3
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# transports we know how to reach a host with
+transports = ('ssh', 'local')
+
+# ssh options for unattended runs
+sshOptions = ['-o', 'BatchMode=yes']
+
+# serializes writes to the console from the host threads
+consoleLock = threading.Lock()
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def loadInventory(inventoryFile):
+    ''' Read inventoryFile. Returns (0, '', [(host, transport, target)])   '''
+    ''' in inventory order, else (1, error message, []).                   '''
+    hosts = []
+
+    try:
+        fp = open(inventoryFile, 'r')
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open inventory %s: %s' % (inventoryFile, value),
+               [])
+
+    lineno = 0
+    for line in fp:
+        lineno += 1
+        # skip comments and blank lines
+        fields = line.split('#')[0].split()
+        if not fields:
+            continue
+
+        host = fields[0]
+        if len(fields) > 1:
+            transport = fields[1]
+        else:
+            transport = 'ssh'
+        if transport not in transports:
+            fp.close()
+            return(1, '%s line %s: unknown transport %s for %s'
+                   % (inventoryFile, lineno, transport, host), [])
+
+        if len(fields) > 2:
+            target = fields[2]
+        elif transport == 'ssh':
+            target = host
+        else:
+            fp.close()
+            return(1, '%s line %s: local host %s needs the directory of its \
+hardening tree' % (inventoryFile, lineno, host), [])
+
+        if host in [entry[0] for entry in hosts]:
+            fp.close()
+            return(1, '%s line %s: %s is listed twice'
+                   % (inventoryFile, lineno, host), [])
+
+        hosts.append((host, transport, target))
+    fp.close()
+
+    # return 0 for success, no error message, and hosts
+    return(0, '', hosts)
+
+
+def hostCommands(transport, target, installArgs, resultsFile):
+    ''' Return the command executing install.py with installArgs on a     '''
+    ''' host, and the command copying its results archive to resultsFile. '''
+    ''' A local copy is done in-process, so its copy command is None.     '''
+    if transport == 'ssh':
+        remote = 'cd hardening && python3 install.py %s' % \
+            ' '.join(["'%s'" % arg for arg in installArgs])
+        runCmd = ['ssh'] + sshOptions + [target, remote]
+        fetchCmd = ['scp', '-q'] + sshOptions + \
+            ['%s:hardening/logs/results.tgz' % target, resultsFile]
+    else:
+        runCmd = [sys.executable, os.path.join(target, 'install.py')] + \
+            installArgs
+        if '-t' not in installArgs:
+            runCmd.append('-t')
+        fetchCmd = None
+    return(runCmd, fetchCmd)
+
+
+def localResults(target):
+    ''' location of results.tgz written by a test mode run of the tree at '''
+    ''' target, in its alternate root                                     '''
+    return(os.path.join(target, 'payload', 'sys', 'root', 'hardening',
+                        'logs', 'results.tgz'))
+
+
+def runHost(host, transport, target, installArgs, collectDir):
+    ''' Execute install.py on host, printing each line of its output as    '''
+    ''' it comes, prefixed with the host name, and logging it to           '''
+    ''' <collectDir>/<host>.log, then copy its results archive. Returns     '''
+    ''' (host, 0 or 1, message).                                           '''
+    resultsFile = os.path.join(collectDir, host + '_results.tgz')
+    (runCmd, fetchCmd) = hostCommands(transport, target, installArgs,
+                                      resultsFile)
+
+    logFp = open(os.path.join(collectDir, host + '.log'), 'w')
+    try:
+        process = subprocess.Popen(runCmd, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   universal_newlines=True)
+    except Exception:
+        # handle any exception from subprocess when it execs the process
+        (type, value, traceback) = sys.exc_info()
+        logFp.close()
+        return(host, 1, 'could not execute %s: %s' % (runCmd[0], value))
+
+    for line in iter(process.stdout.readline, ''):
+        logFp.write(line)
+        consoleLock.acquire()
+        try:
+            sys.stdout.write('[%s] %s' % (host, line))
+            sys.stdout.flush()
+        finally:
+            consoleLock.release()
+    process.stdout.close()
+    process.wait()
+    logFp.close()
+
+    if process.returncode != 0:
+        return(host, 1, 'install.py exited with status %s'
+               % process.returncode)
+
+    # pull the results archive
+    try:
+        if fetchCmd is None:
+            shutil.copy(localResults(target), resultsFile)
+        else:
+            fetchp = subprocess.Popen(fetchCmd, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      universal_newlines=True)
+            (stdout, stderr) = fetchp.communicate()
+            if fetchp.returncode != 0:
+                return(host, 1, 'could not copy results: %s'
+                       % stderr.strip())
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(host, 1, 'could not copy results: %s' % value)
+
+    return(host, 0, resultsFile)
+
+
+def worker(hostQueue, doneQueue, installArgs, collectDir):
+    ''' run hosts from hostQueue until it hands us None '''
+    while True:
+        entry = hostQueue.get()
+        if entry is None:
+            return
+        (host, transport, target) = entry
+        try:
+            doneQueue.put(runHost(host, transport, target, installArgs,
+                                  collectDir))
+        except Exception:
+            (type, value, traceback) = sys.exc_info()
+            doneQueue.put((host, 1, '%s' % value))
+
+
+def runFanout(hosts, installArgs, parallelHosts, collectDir):
+    ''' Execute install.py with installArgs on every host of [(host,       '''
+    ''' transport, target)], up to parallelHosts at a time, collecting the '''
+    ''' results to collectDir. Returns (0 if every host succeeded else 1,  '''
+    ''' [(host, 0 or 1, results archive or error message)] in inventory    '''
+    ''' order).                                                            '''
+    if os.path.isdir(collectDir) is False:
+        os.makedirs(collectDir, mode=0o755)
+
+    hostQueue = queue.Queue()
+    doneQueue = queue.Queue()
+    for entry in hosts:
+        hostQueue.put(entry)
+
+    workers = []
+    for i in range(max(1, min(parallelHosts, len(hosts)))):
+        hostQueue.put(None)
+        thread = threading.Thread(target=worker,
+                                  args=(hostQueue, doneQueue, installArgs,
+                                        collectDir))
+        # Allows program to exit if only the worker threads are alive
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    results = {}
+    for entry in hosts:
+        (host, ecode, rval) = doneQueue.get()
+        results[host] = (host, ecode, rval)
+        consoleLock.acquire()
+        try:
+            if ecode == 0:
+                print('[%s] done, results: %s' % (host, rval))
+            else:
+                print('[%s] FAILED: %s' % (host, rval))
+        finally:
+            consoleLock.release()
+
+    for thread in workers:
+        thread.join()
+
+    results = [results[host] for (host, transport, target) in hosts]
+    for (host, ecode, rval) in results:
+        if ecode != 0:
+            return(1, results)
+    return(0, results)
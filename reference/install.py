@@ -1,10 +1,10 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 # vim: set ft=python ts=4 sw=4 expandtab:
 #   PURPOSE: Foundation to select 'tdsh', 'stig', or 'scsem' as a hardening
 #            standard for installation.
 #            ------------------------------------------------------------------
-#            Execute: python install.py -s tdsh
+#            Execute: python3 install.py -s tdsh
 #            ------------------------------------------------------------------
 #            NOTES:
 #            ------------------------------------------------------------------
@@ -29,24 +29,31 @@ ASSUMPTION: 1) The programs are executed in 3 ways:
                 a) By user root in LIVE production environment, with
                     intention of changing system files. This is the most
                     common way the program will be called:
-                        python install.py -s tdsh
+                        python3 install.py -s tdsh
                     or
-                        python install.py -s tdsh -x disable_rootssh.py
+                        python3 install.py -s tdsh -x disable_rootssh.py
 
                 b) By user root in LIVE production environment in test
                     mode, with intention of only testing changes in an
                     alternate root directory at payload/sys (simulating
                     changes to those files, and not to actual system
                     files):
-                        python install.py -s tdsh -t -r
+                        python3 install.py -s tdsh -t -r
                     or
-                        python install.py -s tdsh -t -r -d 1
+                        python3 install.py -s tdsh -t -r -d 1
 
                 c) By non-root user in TEST environment in test mode, with
                     intention of debugging or making program enhancements.
-                        python install.py -s tdsh -t -r
+                        python3 install.py -s tdsh -t -r
                     or
-                        python install.py -s tdsh -t -r -d 1
+                        python3 install.py -s tdsh -t -r -d 1
+
+            In test mode payload/sys is the upper layer of an overlay of
+            the real /, see overlay.py: only the files the standard uses
+            are copied to it, and -r discards what the standard changed.
+            With -b, the files are read from another base, e.g. the
+            initial state snapshot of another host:
+                        python3 install.py -s tdsh -t -r -b initialstate
 
 DEPENDENCIES:
             1) Update the password policy for logindefs and pam files per
@@ -96,24 +103,45 @@ DEPENDENCIES:
                     thomas  ALL=(ALL)NOPASSWD: ALL
 
 
-USAGE:      First, execute ~/hardening/payload/src/sh/initialstate.sh to
-            1) save the initial state of different files that are possibly
-                touched by this program. This includes their permission modes,
-                ownership, and copies of them (save to the
-                ~hardening/logs/initialstate).
-            2) get list of all RPM packages currently installed
-            3) get list of current system configurations (chkconfig -l)
+USAGE:      On its first run, install.py saves the initial state of the files
+            that are possibly touched by this program, listed in
+            payload/var/lists/initialstate.list: their permission modes,
+            ownership, and contents (saved to
+            ~hardening/logs/initialstate, see snapshot.py).
 
-            Then execute the python modules:
-            python install.py -s tdsh       # execute LIVE, tdsh standard
-            python install.py -s stig       # execute LIVE, stig standard
-            python install.py -s scsem      # execute LIVE, scsem standard
+            Execute the python modules:
+            python3 install.py -s tdsh       # execute LIVE, tdsh standard
+            python3 install.py -s stig       # execute LIVE, stig standard
+            python3 install.py -s scsem      # execute LIVE, scsem standard
 
             # execute in test mode, reset changes, see debugging messages:
-                python install.py -s tdsh -t -r -d 1
+                python3 install.py -s tdsh -t -r -d 1
 
             # to execute just one script, e.g. disable_rootssh.py:
-                python install.py -s tdsh -x disable_rootssh.py
+                python3 install.py -s tdsh -x disable_rootssh.py
+
+            # see output of the standard while it executes (large runs):
+                python3 install.py -s stig -S
+
+            # execute up to 4 independent modules at the same time:
+                python3 install.py -s stig -j 4
+
+            # on a hardened host, see what drifted since the last run, and
+            #   execute only the modules whose inputs drifted:
+                python3 install.py -s stig -j 4 --check-drift
+
+            # print what the standard would change, as a diff and a mode
+            #   and owner delta, changing and executing nothing, and fail
+            #   (CI) if anything would; only the configurations declared in
+            #   payload/var/lists/<standard>_configs.list are evaluated:
+                python3 install.py -s tdsh --dry-run --fail-on-change
+
+            # execute on every host in hosts.list, 16 at a time:
+                python3 install.py -s stig -i hosts.list -P 16
+
+            # see the runs recorded so far, or when a test case first failed:
+                python3 results.py runs
+                python3 results.py first TC_V-22457_GEN005504_SV-26750r1_rule
 
             For all options: install.py --help
 
@@ -125,302 +153,613 @@ MODIFIED:
 ###----------------------------------------------------------------------------
 ### IMPORTS
 ###----------------------------------------------------------------------------
+# Modules only some runs need (webbrowser, xml.etree, pickle, glob,
+#   fanout.py for -i, dryrun.py for -n, scheduler.py for a list of modules),
+#   and those only a hardening run needs (snapshot.py, results.py and its
+#   sqlite3, events.py, progress.py, archive.py and assets.py) are imported
+#   where they are used, so --help, -n and -i do not pay for loading them.
+#   To measure: python3 -X importtime install.py -s tdsh -n 2>&1 | sort -t'|'
+#   -k2 -n | tail
+import argparse
 import datetime
 import os
+import queue
+import re
+import resource
 import shutil
 import subprocess
 import sys
 import threading
-import webbrowser
-from optparse import OptionParser
+
+from toolchain import Toolchain, fileDigest
 
 
 ###----------------------------------------------------------------------------
 ### VARIABLES
 ###----------------------------------------------------------------------------
-startTime = datetime.datetime.now()
-scriptName = sys.argv[0]
-pathname = os.path.dirname(sys.argv[0])
-scriptPath = os.path.abspath(pathname)
-
-# get environment variables
-try:
-    HOME = os.environ['HOME']
-except Exception:
-    print('%s required HOME not set in environment, exiting.' % scriptName)
-    sys.exit(1)
-
-exeScriptname = ''
-hardSpec = ''
-hardVersion = "0.01"
 tarFileName = 'results.tgz'
 
-# initialize to false until we determine if in test mode or not
-testMode = False
-
-# always initialize to InstallType=TEST to prevent accidental overwrite in
-#   root. During testing, all execution will be relative to exeDir, which is
-#   {location of this script}/payload/sys rather than /
-InstallType = "TEST"
-
-# initialize relative pathname variables dependent on InstallType
-#   scriptPath is the location of this script
-instDir = scriptPath + '/' + 'payload'
-instStandards = instDir + '/' + 'standards'
-exeDir = instDir + '/' + 'sys'
-sysEtcDir = exeDir + '/' + 'etc'
-sysReleaseInfo = sysEtcDir + '/' + 'SuSE-release'
-
-# External programs
-initialExtProgs = [('BASH_PROGRAM', '/bin/bash'),
-                   ('CHAGE_PROGRAM', '/usr/bin/chage'),
-                   ('CHGRP_PROGRAM', '/bin/chgrp'),
-                   ('CHMOD_PROGRAM', '/bin/chmod'),
-                   ('CHOWN_PROGRAM', '/bin/chown'),
-                   ('CP_PROGRAM', '/bin/cp'),
-                   ('DIG_PROGRAM', '/usr/bin/dig'),
-                   ('FIND_PROGRAM', '/usr/bin/find'),
-                   ('GROUPADD_PROGRAM', '/usr/sbin/groupadd'),
-                   ('GROUPDEL_PROGRAM', '/usr/sbin/groupdel'),
-                   ('HOSTNAME_PROGRAM', '/bin/hostname'),
-                   ('LN_PROGRAM', '/bin/ln'),
-                   ('LOGROTATE_PROGRAM', '/usr/sbin/logrotate'),
-                   ('MKDIR_PROGRAM', '/bin/mkdir'),
-                   ('MV_PROGRAM', '/bin/mv'),
-                   ('PAMCONFIG_PROGRAM', '/usr/bin/pam-config'),
-                   ('PASSWD_PROGRAM', '/usr/bin/passwd'),
-                   ('PWCONV_PROGRAM', '/usr/sbin/pwconv'),
-                   ('RPM_PROGRAM', '/bin/rpm'),
-                   ('RM_PROGRAM', '/bin/rm'),
-                   ('SYSCTL_PROGRAM', '/sbin/sysctl'),
-                   ('SERVICE_PROGRAM', '/sbin/service'),
-                   ('TAR_PROGRAM', '/usr/bin/tar'),
-                   ('TOUCH_PROGRAM', '/usr/bin/touch'),
-                   ('USERADD_PROGRAM', '/usr/sbin/useradd'),
-                   ('USERDEL_PROGRAM', '/usr/sbin/userdel'),
-                   ('USERMOD_PROGRAM', '/usr/sbin/usermod'),
-                   ('WHOAMI_PROGRAM', '/usr/bin/whoami')]
+# maximum number of output lines held between the standard script's pipe
+#   readers and the console/log writer when streaming; readers block when the
+#   queue is full, so memory stays constant no matter how much is printed
+streamQueueDepth = 1024
+
+# Per Jim: Do not configure, define exception verbiage
+eList = ['TC_V-23826_GEN005490_SV-28762r1_rule, FIPS, \
+            "Teradata: Need exception verbiage"',
+         'TC_V-23827_GEN005495_SV-28763r1_rule, FIPS, \
+            "Teradata: Need exception verbiage"',
+         'TC_V-22457_GEN005504_SV-26750r1_rule, Listen, \
+            "Teradata: All are management interfaces; configuring all \
+interfaces gets the same result as configuring no interfaces."',
+         'TC_V-22470_GEN005521_SV-26763r1_rule, AllowGroups, \
+            "Teradata: Need exception verbiage"',
+         'TC_V-22473_GEN005524_SV-26766r1_rule, GSSAPI, \
+            "Teradata: systems do not require GSSAPIAuthentication."',
+         'TC_V-22474_GEN005525_SV-26767r1_rule, GSSAPI, \
+            "Teradata: systems do not require GSSAPIAuthentication."',
+         'TC_V-22475_GEN005526_SV-26768r1_rule, Kerberos, \
+            "Teradata systems do not require kerberos."',
+         'TC_V-22480_GEN005531_SV-26774r1_rule, PermitTunnel, \
+            "Teradata: PermitTunnel cannot be set in SLES 10 as it is \
+not a configurable option for this version of OpenSSH."',
+         'TC_V-22482_GEN005533_SV-26776r1_rule, MaxSessions, \
+            "Teradata: This would restrict pshell from proper operation. \
+This is not implemented.', ]
+
+# exception verbiage by test case ID, indexed once from eList
+stigExceptions = {}
+for tcException in eList:
+    (tcid, param, exceptStr) = tcException.split(',', 2)
+    stigExceptions[tcid.strip()] = exceptStr.strip().strip('"')
+
+# namespace of the elements in the STIG SRG manual
+xccdfNS = '{http://checklists.nist.gov/xccdf/1.1}'
+
+# color of module and test case status in the web page
+statusColors = {'PASS': 'green', 'FAIL': 'red'}
+
+# size of the buffer used to copy the body of the web page into the report
+reportBufferSize = 1024 * 1024
+
+# ANSI control sequences, \033[<parameters><command>. Only SGR (Select
+#   Graphic Rendition, command 'm') sequences are converted to HTML, any
+#   other sequence (e.g. \033[K, erase line) is dropped from the HTML.
+ansiPattern = re.compile('\033\\[([0-9;]*)([A-Za-z])')
+
+# SGR parameters we convert to HTML, mapped to (kind, HTML begin tag). Only
+#   one block of each kind is open at a time; a new color replaces the color
+#   currently open, just like it does on the terminal.
+sgrTags = {'1': ('bold', '<b>'),  # bold
+           '5': ('blink', '<b>'),  # blink
+           '30': ('color', '<font color="black">'),  # black
+           '31': ('color', '<font color="red">'),  # red
+           '32': ('color', '<font color="green">'),  # green
+           '33': ('color', '<font color="yellow">'),  # yellow
+           '34': ('color', '<font color="blue">'),  # blue
+           '35': ('color', '<font color="magenta">'),  # magenta
+           '36': ('color', '<font color="cyan">'),  # cyan
+           '37': ('color', '<font color="white">')  # white
+           }
+
+# SGR parameters which end one kind of block, 0 (reset) ends all of them
+sgrResets = {'22': 'bold',  # normal intensity
+             '25': 'blink',  # blink off
+             '39': 'color'  # default foreground color
+             }
+
+# HTML end tag for each kind of block
+sgrEndTags = {'bold': '</b>', 'blink': '</b>', 'color': '</font>'}
+
+# characters which must be escaped in HTML text, '&' must be first
+htmlEscapes = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'))
+
+# tags and resulting open blocks for each (open blocks, SGR parameters) seen
+sgrCache = {}
+sgrCacheSize = 4096
 
 ###----------------------------------------------------------------------------
 ### FUNCTIONS
 ###----------------------------------------------------------------------------
 
 
-class RepeatingTimer(threading._Timer):
-    def run(self):
-        ''' Since we use the subprocess call which is blocking until        '''
-        ''' completion, one way to print something out while waiting would  '''
-        ''' be to use multithreading. This function uses threading._Timer   '''
-        while True:
-            self.finished.wait(self.interval)
-            if self.finished.isSet():
-                return
-            else:
-                self.function(*self.args, **self.kwargs)
-
+def pumpLines(pipe, streamName, lineQueue):
+    ''' Read lines from a child process pipe and hand them to the writer    '''
+    ''' queue, tagged with the name of the stream they came from. A None    '''
+    ''' line marks the end of the stream.                                   '''
+    for line in iter(pipe.readline, ''):
+        lineQueue.put((streamName, line))
+    pipe.close()
+    lineQueue.put((streamName, None))
 
-def progressStatus():
-    ''' print current time '''
-    whatTime = datetime.datetime.now()
-    whatTime = '\033[36m%s\033[0m' % whatTime
-    sys.stdout.write("\r%s" % whatTime)
-    sys.stdout.flush()
 
+def streamProcess(cmd, lineHandlers):
+    ''' Execute cmd and pass every line of its standard output and standard '''
+    ''' error, as soon as it arrives, to each function in lineHandlers as   '''
+    ''' handler(streamName, line). Each pipe is drained by its own reader   '''
+    ''' thread so a child filling one pipe can never deadlock us while we   '''
+    ''' wait on the other.                                                  '''
 
-def verifyExtProg(programList):
-    ''' Verify path to external programs we use are correct paths.          '''
-    '''     If type reports an alternate location from standard list, then  '''
-    '''     use it. If type returns nothing, then report program could not  '''
-    '''     be found on system.                                             '''
-    ###---
-    ### Get OS Details with SUSE version number for pam configurations
-    ###---
-    modName = 'verifyExtProg'
-    sysReleaseInfo = '/etc/SuSE-release'
-
-    if os.path.isfile(sysReleaseInfo):
-        for line in open(sysReleaseInfo):
-            if line[0:7] == 'VERSION':
-                (version, versionNumber) = line.split('=')
-                SLES = versionNumber.strip()
-    else:
-        print('%s: could not open %s to determine SUSE version number'
-              % (modName, sysReleaseInfo))
-        if SLES == '':
-            print('%s: could not determine SUSE version number' % modName)
+    try:
+        process = subprocess.Popen(cmd,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   bufsize=1,
+                                   universal_newlines=True)
+    except Exception:
+        # handle any exception from subprocess when it execs the process
+        (type, value, traceback) = sys.exc_info()
+        # return 1 for error, error message, and no stderr line count
+        return(1, 'Could not execute %s: %s' % (cmd, value), 0)
+
+    # bounded queue shared by both reader threads
+    lineQueue = queue.Queue(streamQueueDepth)
+    readers = [threading.Thread(target=pumpLines,
+                                args=(process.stdout, 'stdout', lineQueue)),
+               threading.Thread(target=pumpLines,
+                                args=(process.stderr, 'stderr', lineQueue))]
+    for reader in readers:
+        # Allows program to exit if only the reader threads are alive
+        reader.daemon = True
+        reader.start()
+
+    # count lines written to standard error, callers decide if that is fatal
+    stderrLines = 0
+    openStreams = len(readers)
+    while openStreams:
+        (streamName, line) = lineQueue.get()
+        if line is None:
+            openStreams -= 1
+            continue
+        if streamName == 'stderr':
+            stderrLines += 1
+        for handler in lineHandlers:
+            handler(streamName, line)
+
+    for reader in readers:
+        reader.join()
+    process.wait()
+
+    # return exit status of cmd, no error message, and stderr line count
+    return(process.returncode, '', stderrLines)
+
+
+def teeLine(logFp):
+    ''' Return a line handler for streamProcess which writes each line to   '''
+    ''' the console, stdout or stderr as the child did, and to logFp.       '''
+    def handler(streamName, line):
+        if streamName == 'stderr':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        logFp.write(line)
+    return(handler)
+
+
+def holdLine(logFp, heldLines):
+    ''' Return a line handler for streamProcess which writes each line to   '''
+    ''' logFp, and holds it in heldLines, as (streamName, line), for the    '''
+    ''' console once the standard completes.                                '''
+    def handler(streamName, line):
+        heldLines.append((streamName, line))
+        if streamName == 'stdout':
+            logFp.write(line)
+    return(handler)
+
+
+def escapeHTML(text):
+    ''' escape characters in text that would otherwise be read as HTML '''
+    if '&' in text or '<' in text or '>' in text:
+        for (char, entity) in htmlEscapes:
+            text = text.replace(char, entity)
+    return(text)
+
+
+def sgrTransition(openBlocks, params):
+    ''' Work out the HTML tags for one SGR escape sequence with parameters '''
+    ''' params, e.g. '1;31', given the tuple of (kind, tag) blocks open   '''
+    ''' before it. Returns the tags and the blocks open after it.         '''
+    cnvTxt = []
+    openBlocks = list(openBlocks)
+
+    # an empty parameter list is the same as reset, \033[m
+    for param in params.split(';'):
+        if param == '' or param == '0':
+            # reset, close everything in reverse order of opening
+            while openBlocks:
+                cnvTxt.append(sgrEndTags[openBlocks.pop()[0]])
+            continue
+
+        if param in sgrTags:
+            (kind, tag) = sgrTags[param]
+        elif param in sgrResets:
+            (kind, tag) = (sgrResets[param], None)
+        else:
+            continue
+
+        # close the block of this kind if one is open. Blocks opened inside
+        #   it are closed first and opened again afterwards, to keep the
+        #   HTML tags properly nested
+        if kind in [openKind for (openKind, openTag) in openBlocks]:
+            reopen = []
+            while openBlocks:
+                (openKind, openTag) = openBlocks.pop()
+                cnvTxt.append(sgrEndTags[openKind])
+                if openKind == kind:
+                    break
+                reopen.insert(0, (openKind, openTag))
+            for (openKind, openTag) in reopen:
+                cnvTxt.append(openTag)
+                openBlocks.append((openKind, openTag))
+
+        if tag:
+            cnvTxt.append(tag)
+            openBlocks.append((kind, tag))
+
+    return(''.join(cnvTxt), tuple(openBlocks))
+
+
+class HTMLConverter(object):
+    ''' Convert lines of ANSI formatted text to HTML as they are fed in,    '''
+    ''' writing each converted line straight to filename. The open block  '''
+    ''' state is kept between lines, so a block started on one line can   '''
+    ''' be closed on a later one.                                         '''
+
+    def __init__(self, filename):
+        # open file in write mode, if not exist, create it
+        self.fp = open(filename, 'w')
+        self.filename = filename
+        # (kind, tag) of each block currently open, in order of opening
+        self.openBlocks = ()
+
+    def feed(self, line):
+        ''' convert one line of text and write it to the HTML file '''
+        line = escapeHTML(line.rstrip())
+
+        # convert every escape sequence in the line in a single scan,
+        #   skipping the scan when there is none
+        if '\033' in line:
+            line = ansiPattern.sub(self.sgrToHTML, line)
+
+        # write the converted line to file
+        self.fp.write(line + '<br>\n')
+
+    def sgrToHTML(self, match):
+        ''' return the HTML tags for one escape sequence match, updating    '''
+        ''' the open blocks. Anything but SGR is dropped.                   '''
+        (params, command) = match.groups()
+        if command != 'm':
+            return('')
+
+        # the same few sequences repeat all through a log, so remember the
+        #   tags worked out for each of them
+        key = (self.openBlocks, params)
+        transition = sgrCache.get(key)
+        if transition is None:
+            if len(sgrCache) >= sgrCacheSize:
+                sgrCache.clear()
+            transition = sgrCache[key] = sgrTransition(self.openBlocks,
+                                                       params)
+        (tags, self.openBlocks) = transition
+        return(tags)
+
+    def handler(self, streamName, line):
+        ''' line handler for streamProcess, converts both output streams '''
+        self.feed(line)
+
+    def close(self):
+        ''' close any block left open and close the HTML file '''
+        for (kind, tag) in reversed(self.openBlocks):
+            self.fp.write(sgrEndTags[kind])
+        self.openBlocks = ()
+        self.fp.close()
+
+
+def iterSRGRules(xmlFile):
+    ''' Generator parsing the rules out of the STIG SRG manual xmlFile,    '''
+    ''' yielding (tcid, severity, title, check content) for each rule as  '''
+    ''' soon as its element ends. Elements are cleared once handled, so   '''
+    ''' memory stays flat however large the manual is. The test case ID   '''
+    ''' is made of the group, rule version and rule IDs, e.g.              '''
+    ''' TC_V-23826_GEN005490_SV-28762r1_rule.                              '''
+    import xml.etree.ElementTree as ElementTree
+
+    groupTag = xccdfNS + 'Group'
+    ruleTag = xccdfNS + 'Rule'
+    root = None
+    groupID = ''
+
+    for (event, elem) in ElementTree.iterparse(xmlFile, ('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif elem.tag == groupTag:
+                groupID = elem.get('id')
+            continue
+
+        if elem.tag == ruleTag:
+            tcid = 'TC_%s_%s_%s' % (groupID,
+                                    elem.findtext(xccdfNS + 'version', ''),
+                                    elem.get('id'))
+            check = elem.findtext(xccdfNS + 'check/' + xccdfNS +
+                                  'check-content', '')
+            yield (tcid, elem.get('severity', ''),
+                   ' '.join(elem.findtext(xccdfNS + 'title', '').split()),
+                   ' '.join(check.split()))
+        elif elem.tag == groupTag:
+            # done with this group, drop it and everything before it
+            root.clear()
+
+
+def iterSRGCache(cacheFile):
+    ''' Generator yielding the rules saved to cacheFile by cacheSRGRules '''
+    import pickle
+
+    fp = open(cacheFile, 'rb')
+    # skip the header
+    pickle.load(fp)
+    try:
+        while True:
+            yield pickle.load(fp)
+    except EOFError:
+        fp.close()
 
-    # initialize empty list to hold the programs we can verify
-    verifiedProgs = []
 
-    # start at standard program list and see if executable exists, if not
-    #   use what type -P returns, else report an error
-    for line in programList:
+def cacheSRGRules(rules, cacheFile, header):
+    ''' Generator passing rules through while saving them to cacheFile,  '''
+    ''' after header. The cache only replaces cacheFile once every rule  '''
+    ''' went through, so a cache is never left half written.             '''
+    import pickle
 
-        # get first item in list which is variable name for the program
-        var = line[0]
+    fp = open(cacheFile + '.tmp', 'wb')
+    pickle.dump(header, fp, 2)
+    for rule in rules:
+        pickle.dump(rule, fp, 2)
+        yield rule
+    fp.close()
+    os.rename(cacheFile + '.tmp', cacheFile)
 
-        # get second item in list which is program location
-        program = line[1]
 
-        # get the basename of the program
-        fbasename = program.split('/')[-1]
-        bashBuiltInCmd = 'type -P %s' % fbasename
+def loadSRGRules(xmlFile, cacheFile):
+    ''' Return an iterator over the rules of the STIG SRG manual xmlFile,  '''
+    ''' read from cacheFile if it holds the rules of that same manual,     '''
+    ''' else parsed from the manual and saved to cacheFile as they are     '''
+    ''' read. A manual with the same size and mtime as the cached one is   '''
+    ''' not read at all; if only its mtime changed, its content hash       '''
+    ''' decides.                                                          '''
+    import pickle
 
-        if SLES != '11':
-            if var == 'PAMCONFIG_PROGRAM':
-                continue
+    try:
+        xmlStat = os.stat(xmlFile)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Unable to access STIG Manual %s: %s' % (xmlFile, value),
+               iter([]))
 
-        # Execute bash built-in type as a subprocess
+    # cache starts with header {'mtime': , 'size': , 'digest': }, followed
+    #   by one pickled record per rule
+    cache = None
+    if os.access(cacheFile, os.F_OK):
         try:
-            process = subprocess.Popen(["bash", "-c", bashBuiltInCmd],
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
+            fp = open(cacheFile, 'rb')
+            cache = pickle.load(fp)
+            fp.close()
         except Exception:
-            # handle any exception from subprocess when it execs bash process
-            (type, value, traceback) = sys.exc_info()
-            msg = 'Could not locate external program for %s at %s: %s' \
-                  % (fbasename, program, value)
-            # return 1 for error, error message, and empty list
-            return(1, msg, '')
-
-        # get standard output and standard error from bash -c
-        (stdout, stderr) = process.communicate()
-
-        # remove leading and trailing spaces and newline character
-        stdout = stdout.strip()
-        program = program.strip()
-
-        #print('stdout %s, program %s' % (stdout, program))
-
-        # if type returned no results, then report error that program could not
-        #   be located
-        if stdout == '':
-            msg = 'External program for %s is not located at %s.\n \
-Please update the externalPrograms list with correct location of executable.' \
-                  % (var, program)
-            # return 1 for error, error message, and empty list
-            return(1, msg, '')
-        else:
-            # if type returns that program exists at another location from
-            #   standard list, then use the location type returned instead
-            if stdout != program:
-                cmdList = (var, stdout)
-            else:
-                cmdList = (var, program)
-
-        # append the program name and location to verifiedProgs list
-        verifiedProgs.append(cmdList)
-
-    # return 0 for success, no error message, and verified program list
-    return(0, '', verifiedProgs)
-
-
-def beginTxtSpecialCharBlock(line, specialChar):
-    ''' find ascii special character in line and map them to HTML begin tag '''
-
-    # dictionary of special characters mapped to HTML tag equivalent
-    dictSpecialcharHTMLtag = {'[1m': '<b>',  # bold
-                              '[5m': '<b>',  # blink
-                              '[30m': '<font color="black">',  # black
-                              '[31m': '<font color="red">',  # red
-                              '[32m': '<font color="green">',  # green
-                              '[33m': '<font color="yellow">',  # yellow
-                              '[34m': '<font color="blue">',  # blue
-                              '[35m': '<font color="magenta">',  # magenta
-                              '[36m': '<font color="cyan">',  # cyan
-                              '[37m': '<font color="white">'  # white
-                              }
-
-    # strip blank characters at end of line
-    line.rstrip()
-
-    # find location of special character in the line
-    scIndex = line.index(specialChar)
-
-    # get the length of special character
-    scLength = scIndex + len(specialChar)
-
-    # get the text after special character
-    txtAfterIndex = line[scLength:]
-
-    # set HTML tag equivalent of the special character
-    tag = dictSpecialcharHTMLtag[specialChar]
-
-    # append any remaining text, after the converted special character
-    cnvTxt = tag + txtAfterIndex
-
-    # return the converted line
-    return(cnvTxt)
-
-
-def endTxtSpecialCharBlock(line, specialChar, lastSpecialChar):
-    ''' find ascii special character in line and map them to HTML end tag '''
+            # unreadable cache, parse the manual again
+            cache = None
+
+    if cache is not None:
+        if cache['mtime'] == xmlStat.st_mtime and \
+                cache['size'] == xmlStat.st_size:
+            return(0, '', iterSRGCache(cacheFile))
+
+    header = {'mtime': xmlStat.st_mtime, 'size': xmlStat.st_size,
+              'digest': fileDigest(xmlFile)}
+    if cache is not None and cache['digest'] == header['digest']:
+        # same manual, only save its new mtime
+        rules = iterSRGCache(cacheFile)
+    else:
+        rules = iterSRGRules(xmlFile)
 
-    # dictionary of special characters mapped to HTML end tag equivalent
-    dictSpecialcharHTMLtag = {'[1m': '</b>',  # bold
-                              '[5m': '</b>',  # blink
-                              '[30m': '</font>',  # black
-                              '[31m': '</font>',  # red
-                              '[32m': '</font>',  # green
-                              '[33m': '</font>',  # yellow
-                              '[34m': '</font>',  # blue
-                              '[35m': '</font>',  # magenta
-                              '[36m': '</font>',  # cyan
-                              '[37m': '</font>'  # white
-                              }
+    # return 0 for success, no error message, and the rules
+    return(0, '', cacheSRGRules(rules, cacheFile, header))
 
-    # strip blank characters left at end of line
-    line.rstrip()
 
-    # find location of special character in the line
-    scIndex = line.index(specialChar)
+def writeSRGCSV(rules, csvFile, statusIndex=None, exceptionIndex=None):
+    ''' Write rules to csvFile, one tab separated line per rule, with the '''
+    ''' test execution status of each rule taken from statusIndex, else   '''
+    ''' its verbiage from exceptionIndex, else set to Not Executed.       '''
+    if statusIndex is None:
+        statusIndex = {}
+    if exceptionIndex is None:
+        exceptionIndex = {}
+    try:
+        fp = open(csvFile + '.tmp', 'w')
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open %s: %s' % (csvFile, value))
 
-    # if special character is not at beginning of line, get the text
-    #   before the special character
-    if scIndex > 0:
-        # -1 to handle the ANSI escape code for VT100, \033
-        #   and escape code to switch foreground color, \x1b
-        txtBeforeIndex = line[0:scIndex - 1]
-    else:
-        txtBeforeIndex = ''
+    try:
+        fp.write('Test Case\tSeverity\tTitle\tStatus\tCheck\n')
+        for (tcid, severity, title, check) in rules:
+            if tcid in statusIndex:
+                tcstatus = statusIndex[tcid]
+            elif tcid in exceptionIndex:
+                tcstatus = exceptionIndex[tcid]
+            else:
+                tcstatus = 'Not Executed'
+            fp.write('%s\t%s\t%s\t%s\t%s\n'
+                     % (tcid, severity, title, tcstatus, check))
+        fp.close()
+        os.rename(csvFile + '.tmp', csvFile)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not write %s: %s' % (csvFile, value))
 
-    # set HTML tag equivalent of the special character
-    tag = dictSpecialcharHTMLtag[lastSpecialChar]
+    # return 0 for success, and no error message
+    return(0, '')
 
-    # prepend any text before tag, if any, before the converted special
-    #   character
-    cnvTxt = txtBeforeIndex + tag
 
-    # return the converted text
-    return(cnvTxt)
+def loadStigStatus(statusFile):
+    ''' Index the test execution status written by the modules, one line '''
+    ''' of "tcid filename status" per test case, by test case ID. The    '''
+    ''' first status written for a test case is the one kept.            '''
+    statusIndex = {}
 
+    try:
+        fp = open(statusFile, 'r')
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open %s: %s' % (statusFile, value), {})
+
+    for tcStatusLine in fp:
+        fields = tcStatusLine.split()
+        # skip blank or partially written lines
+        if len(fields) != 3:
+            continue
+        (tcid, fname, tcstatus) = fields
+        if tcid not in statusIndex:
+            statusIndex[tcid] = tcstatus
+    fp.close()
 
-def strToFile(text, filename):
-    ''' Write a file with the given name and the given text.'''
+    # return 0 for success, no error message, and the status index
+    return(0, '', statusIndex)
+
+
+def statusHTML(status):
+    ''' status of a module or test case, in green if it passed, in red if '''
+    ''' it failed                                                         '''
+    if status in statusColors:
+        return('<font color="%s">%s</font>' % (statusColors[status],
+                                              escapeHTML(status)))
+    return(escapeHTML(status))
+
+
+def eventsHTML(demux):
+    ''' Return the web page section summarizing the events of a run: each '''
+    ''' module with its status and duration, then each test case with its '''
+    ''' status. Returns an empty string if no module emitted events.      '''
+    if not demux.moduleOrder and not demux.tests:
+        return('')
+
+    html = ['<h2>Modules</h2>\n<table>\n',
+            '<tr><th>Module</th><th>Status</th><th>Seconds</th></tr>\n']
+    for module in demux.moduleOrder:
+        duration = demux.modules[module]['duration']
+        if duration is None:
+            duration = ''
+        html.append('<tr><td>%s</td><td>%s</td><td>%s</td></tr>\n'
+                    % (escapeHTML(module),
+                       statusHTML(demux.modules[module]['status']), duration))
+    html.append('</table>\n')
+
+    if demux.tests:
+        html.append('<h2>Test cases</h2>\n<table>\n'
+                    '<tr><th>Test case</th><th>Module</th><th>Status</th>'
+                    '</tr>\n')
+        for (tcid, module, status) in demux.tests:
+            html.append('<tr><td>%s</td><td>%s</td><td>%s</td></tr>\n'
+                        % (escapeHTML(tcid), escapeHTML(module),
+                           statusHTML(status)))
+        html.append('</table>\n')
+
+    return(''.join(html))
+
+
+def timingHTML(timings):
+    ''' Return the web page section of the time taken by the standard and '''
+    ''' by each module and command, [(kind, name, timing)] with timing as '''
+    ''' in a module-end event of events.py, slowest first.                '''
+    html = ['<h2>Timing</h2>\n<table>\n',
+            '<tr><th>Kind</th><th>Name</th><th>Seconds</th>'
+            '<th>CPU seconds</th><th>Commands</th><th>KB read</th>'
+            '<th>KB written</th></tr>\n']
+
+    # a bash module may report a module end without any timing, its fields
+    #   are left blank and it is sorted as taking no time
+    def cell(value, form, divisor=None):
+        if value is None:
+            return('')
+        if divisor:
+            value = value // divisor
+        return(form % value)
+
+    for (kind, name, entry) in sorted(timings, reverse=True,
+                                      key=lambda row: row[2].get('duration')
+                                      or 0):
+        html.append('<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td>'
+                    '<td>%s</td><td>%s</td><td>%s</td></tr>\n'
+                    % (kind, escapeHTML(name),
+                       cell(entry.get('duration'), '%.3f'),
+                       cell(entry.get('cpu'), '%.3f'),
+                       cell(entry.get('children'), '%s'),
+                       cell(entry.get('readBytes'), '%d', 1024),
+                       cell(entry.get('writeBytes'), '%d', 1024)))
+    html.append('</table>\n')
+    return(''.join(html))
+
+
+def writeReport(filename, header, bodyFile, trailer):
+    ''' Write the web page filename as header, then the contents of       '''
+    ''' bodyFile copied over a buffer at a time, then trailer; the page   '''
+    ''' is never held in memory as a whole.                              '''
 
     # open file in write mode, if not exist, create it
     try:
-        fp = open(filename, "w+")
+        fp = open(filename, 'wb')
+        bodyFp = open(bodyFile, 'rb')
     except Exception:
         # if error, return error message
         (type, value, traceback) = sys.exc_info()
         return(value)
-    # write text to the file
-    fp.write(text)
-    # rewind file to beginning
-    fp.seek(0)
-    # close the file pointer
-    fp.close()
+
+    try:
+        fp.write(header.encode('utf-8'))
+        shutil.copyfileobj(bodyFp, fp, reportBufferSize)
+        fp.write(trailer.encode('utf-8'))
+        bodyFp.close()
+        fp.close()
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(value)
+
     # return 0 for success
     return(0)
 
 
-def browseLocal(webpageText, filename):
-    ''' Start your webbrowser on a local file containing the text with      '''
-    ''' given filename.                                                     '''
+def targetsOf(instLists, moduleList):
+    ''' Return (0, '', [path]) of the targets whose state is saved: the   '''
+    ''' initial state targets and the inputs declared in moduleList, if   '''
+    ''' there is one. Else (1, error message, []).                       '''
+    from snapshot import loadTargets
+
+    (ecode, rval, targets) = loadTargets(instLists + '/' +
+                                         'initialstate.list')
+    if ecode != 0 or os.path.isfile(moduleList) is False:
+        return(ecode, rval, targets)
+
+    from scheduler import loadModuleInputs
+    (ecode, rval, moduleInputs) = loadModuleInputs(moduleList)
+    if ecode != 0:
+        return(1, rval, [])
+    for module in sorted(moduleInputs):
+        for path in moduleInputs[module]:
+            if path not in targets:
+                targets.append(path)
+    return(0, '', targets)
+
+
+def browseLocal(filename):
+    ''' Start your webbrowser on a local file with given filename.         '''
+    import webbrowser
 
-    # call to write HTML content to filename
-    strToFile(webpageText, filename)
     # view the file through web browser
     try:
         webbrowser.open("file:///" + os.path.abspath(filename))
@@ -434,100 +773,508 @@ def browseLocal(webpageText, filename):
 ###----------------------------------------------------------------------------
 ### MAIN PROGRAM
 ###----------------------------------------------------------------------------
+def main():
+    ''' Harden this host, or every host of an inventory, to the standard   '''
+    ''' given on the command line. Returns the exit status.                '''
+    startTime = datetime.datetime.now()
+    scriptName = sys.argv[0]
+    pathname = os.path.dirname(sys.argv[0])
+    scriptPath = os.path.abspath(pathname)
+
+    # get environment variables
+    try:
+        HOME = os.environ['HOME']
+    except Exception:
+        print('%s required HOME not set in environment, exiting.' % scriptName)
+        sys.exit(1)
+
+    exeScriptname = ''
+    hardSpec = ''
+    hardVersion = "0.01"
+    # initialize to false until we determine if in test mode or not
+    testMode = False
+
+    # always initialize to InstallType=TEST to prevent accidental overwrite
+    #   in root. During testing, all execution will be relative to exeDir,
+    #   which is {location of this script}/payload/sys rather than /
+    InstallType = "TEST"
+
+    # initialize relative pathname variables dependent on InstallType
+    #   scriptPath is the location of this script
+    instDir = scriptPath + '/' + 'payload'
+    instStandards = instDir + '/' + 'standards'
+    exeDir = instDir + '/' + 'sys'
+
+    # create instance of object to handle parsing comand line arguments to this
+    #   program
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--debuglevel", dest="DEBUGLEVEL",
+                        default=0, help="specify a debug level, 0 for \
+                        standard logging or 1 for debug output.")
+    parser.add_argument("-l", "--loglevel", dest="LOGLEVEL",
+                        default=0, help="specify a log level, 0 to write \
+                        results to html file or 1 to not write results to \
+                        html.")
+    parser.add_argument("-s", "--standard", dest="HARDSPEC",
+                        help="specify hardening standard spec, 'sig', 'scem' \
+                        or 'tdsh'.")
+    parser.add_argument("-x", "--executeOnly", dest="EXESCRIPTNAME",
+                        help="specify only one specific script should be \
+                        executed")
+    parser.add_argument("--profile", action="store_true", dest="PROFILE",
+                        default=False, help="execute the standard under \
+                        cProfile, each module on its own with -j, writing \
+                        the profiles next to the results.")
+    parser.add_argument("-P", "--parallelhosts", dest="PARALLELHOSTS",
+                        type=int, default=8, help="with -i, execute on up to \
+                        PARALLELHOSTS hosts at the same time.")
+    parser.add_argument("-r", "--resettest", action="store_true",
+                        dest="RESETTEST", default=False, help="specify after \
+                        each execution, reset files for testing purposes, \
+                        only works with -t (testmode).")
+    parser.add_argument("-b", "--testbase", dest="TESTBASE", default='/',
+                        help="with -t, read the files the standard has not \
+                        changed from TESTBASE, a directory, default /, or a \
+                        snapshot directory such as logs/initialstate.")
+    parser.add_argument("-t", "--testmode", action="store_true",
+                        dest="TESTMODE", default=False, help="run in testmode \
+                        which uses alternate execution directories from LIVE \
+                        production environment")
+    parser.add_argument("--check-drift", action="store_true",
+                        dest="CHECKDRIFT", default=False, help="compare the \
+                        targets and module inputs with their state after \
+                        the last run, print what drifted, and execute only \
+                        the modules whose inputs drifted; needs -j.")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        dest="DRYRUN", default=False, help="print what the \
+                        configurations the standard declares would change, \
+                        as a diff and a mode and owner delta, evaluated in \
+                        memory, without changing or executing anything. Only \
+                        the files declared in <standard>_configs.list are \
+                        covered, not what the module scripts change \
+                        themselves.")
+    parser.add_argument("--fail-on-change", action="store_true",
+                        dest="FAILONCHANGE", default=False, help="with -n, \
+                        exit with status 1 if anything would change.")
+    parser.add_argument("-c", "--collectdir", dest="COLLECTDIR",
+                        help="with -i, directory to collect the results of \
+                        every host to, default ~/hardening/fanout/<date>.")
+    parser.add_argument("-i", "--inventory", dest="INVENTORY",
+                        help="execute on every host listed in file INVENTORY \
+                        instead of this one, see fanout.py.")
+    parser.add_argument("-j", "--jobs", dest="JOBS", type=int, default=0,
+                        help="execute up to JOBS modules of the standard at \
+                        the same time, as declared in \
+                        <standard>_modules.list.")
+    parser.add_argument("-S", "--stream", action="store_true", dest="STREAM",
+                        default=False, help="stream output of the standard \
+                        script to screen and log file while it executes, \
+                        instead of printing it all once it completes.")
+    parser.add_argument("-v", "--version", dest="HARDVERSION",
+                        help="specify hardening version, version number used \
+                        for all installs but primarily for reporting.")
+    parser.add_argument("-z", "--compressthreads", dest="COMPRESSTHREADS",
+                        type=int, default=0, help="compress the results \
+                        archive on this many threads, for large results \
+                        directories.")
+
+    # parse the arguments to this program and save to options and arguments to
+    #   each option
+    options = parser.parse_args()
+
+    # if debuglevel was passed, then set DEBUGLEVEL to number specified
+    if options.DEBUGLEVEL:
+        debuglevel = options.DEBUGLEVEL
+    else:
+        # if no debuglevel was passed, then set default to 0
+        debuglevel = '0'
+
+    # if loglevel was passed, then set LOGLEVEL to number specified
+    if options.LOGLEVEL:
+        loglevel = options.LOGLEVEL
+    else:
+        # if no loglevel was passed, then set default to 0
+        loglevel = '0'
+
+    # if standard was passed, then set HARDSPEC (hardening specification
+    #   standard) to standard specified
+    if options.HARDSPEC:
+        hardSpec = options.HARDSPEC
+    else:
+        # if no standard was passed, print error and exit
+        print('%s hardSpec is a required parameter, see -h for help usage'
+              % scriptName)
+        sys.exit(1)
+
+    if options.EXESCRIPTNAME:
+        exeScriptname = options.EXESCRIPTNAME
+
+    # convert hardening specification standard to uppercase
+    hardSpecUC = hardSpec.upper()
+    # verify that standard is valid
+    if hardSpecUC != 'SCSEM':
+        if hardSpecUC != 'STIG':
+            if hardSpecUC != 'TDSH':
+                # if not valid standard, print error and exit
+                print('%s %s not a valid hardening standard type'
+                      % (scriptName, hardSpec))
+                sys.exit(1)
+
+    # if testmode was passed, set flag to True
+    if options.TESTMODE:
+        testMode = True
+
+    # if reset test was passed, set to 1 for on
+    if options.RESETTEST:
+        resetTest = '1'
+    else:
+        # if reset test was not passed, set to 0 for off
+        resetTest = '0'
+
+    # if stream was passed, tee standard script output as it is produced
+    if options.STREAM:
+        streamOutput = True
+    else:
+        streamOutput = False
+
+    # if profile was passed, execute the standard, or each module, under
+    #   cProfile
+    if options.PROFILE:
+        profileRun = True
+    else:
+        profileRun = False
+
+    # if check drift was passed, only execute modules whose inputs drifted
+    if options.CHECKDRIFT:
+        checkDriftRun = True
+    else:
+        checkDriftRun = False
+
+    # if compress threads was passed, compress the archive on that many threads
+    compressThreads = max(0, options.COMPRESSTHREADS)
+
+    # if jobs was passed, execute modules in parallel, up to that many at a
+    #   time
+    jobs = options.JOBS
+    if jobs < 0:
+        print('%s jobs must be a positive number, see -h for help usage'
+              % scriptName)
+        sys.exit(1)
 
-# create instance of object to handle parsing comand line arguments to this
-#   program
-parser = OptionParser()
-parser.add_option("-d", "--debuglevel", dest="DEBUGLEVEL",
-                  default=0, help="specify a debug level, 0 for standard \
-                  logging or 1 for debug output.")
-parser.add_option("-l", "--loglevel", dest="LOGLEVEL",
-                  default=0, help="specify a log level, 0 to write \
-                  results to html file or 1 to not write results to html.")
-parser.add_option("-s", "--standard", dest="HARDSPEC",
-                  help="specify hardening standard spec, 'sig', 'scem' or \
-                  'tdsh'.")
-parser.add_option("-x", "--executeOnly", dest="EXESCRIPTNAME",
-                  help="specify only one specific script should be executed")
-parser.add_option("-r", "--resettest", action="store_true", dest="RESETTEST",
-                  default=False, help="specify after each execution, reset \
-                  files for testing purposes, only works with -t (testmode).")
-parser.add_option("-t", "--testmode", action="store_true", dest="TESTMODE",
-                  default=False, help="run in testmode which uses alternate \
-                  execution directories from LIVE production environment")
-parser.add_option("-v", "--version", dest="HARDVERSION",
-                  help="specify hardening version, version number used for \
-                  all installs but primarily for reporting.")
-
-# parse the arguments to this program and save to options and arguments to
-#   each option
-(options, args) = parser.parse_args()
-
-# if debuglevel was passed, then set DEBUGLEVEL to number specified
-if options.DEBUGLEVEL:
-    debuglevel = options.DEBUGLEVEL
-else:
-    # if no debuglevel was passed, then set default to 0
-    debuglevel = '0'
-
-# if loglevel was passed, then set LOGLEVEL to number specified
-if options.LOGLEVEL:
-    loglevel = options.LOGLEVEL
-else:
-    # if no loglevel was passed, then set default to 0
-    loglevel = '0'
-
-# if standard was passed, then set HARDSPEC (hardening specification
-#   standard) to standard specified
-if options.HARDSPEC:
-    hardSpec = options.HARDSPEC
-else:
-    # if no standard was passed, print error and exit
-    print('%s hardSpec is a required parameter, see -h for help usage'
-          % scriptName)
-    sys.exit(1)
-
-if options.EXESCRIPTNAME:
-    exeScriptname = options.EXESCRIPTNAME
-
-# convert hardening specification standard to uppercase
-hardSpecUC = hardSpec.upper()
-# verify that standard is valid
-if hardSpecUC != 'SCSEM':
-    if hardSpecUC != 'STIG':
-        if hardSpecUC != 'TDSH':
-            # if not valid standard, print error and exit
-            print('%s %s not a valid hardening standard type'
-                  % (scriptName, hardSpec))
+    # only the scheduler of -j skips the modules whose inputs did not drift,
+    #   a standard executed on its own executes every module
+    if checkDriftRun is True and (not jobs or exeScriptname):
+        print('%s --check-drift needs -j, and not -x, see -h for help usage'
+              % scriptName)
+        sys.exit(1)
+
+    # if hardening version number was passed, then set version number to what
+    #   user specified, and later print the number. No other real action for
+    #   this in code at this time.
+    if options.HARDVERSION:
+        hardVersion = options.HARDVERSION
+
+
+    ###---
+    ### If dry run was passed, evaluate the standard in memory against the
+    ###     root it would change, / as root, else the test root, and exit:
+    ###     no directory is created and no program executed
+    ###---
+    if options.DRYRUN:
+        sys.path.insert(0, instDir + '/' + 'lib')
+        from dryrun import dryRunStandard
+
+        os.environ['instLists'] = instDir + '/' + 'var' + '/' + 'lists'
+        os.environ['varTargets'] = instDir + '/' + 'var' + '/' + 'targets'
+        if testMode is False and os.geteuid() == 0:
+            exeDir = ""
+        # in test mode exeDir only holds what was copied up: read the rest
+        #   from the test base, through the overlay
+        overlay = None
+        if exeDir:
+            from overlay import openOverlay
+
+            (ecode, rval, overlay) = openOverlay(exeDir, options.TESTBASE)
+            if ecode != 0:
+                print('%s' % rval)
+                sys.exit(1)
+        (ecode, rval, changed) = dryRunStandard(hardSpec, exeDir,
+                                                overlay=overlay)
+        if ecode != 0:
+            print('%s' % rval)
             sys.exit(1)
+        if options.FAILONCHANGE:
+            sys.exit(int(changed))
+        sys.exit(0)
 
-# if testmode was passed, set flag to True
-if options.TESTMODE:
-    testMode = True
-
-# if reset test was passed, set to 1 for on
-if options.RESETTEST:
-    resetTest = '1'
-else:
-    # if reset test was not passed, set to 0 for off
-    resetTest = '0'
-
-# if hardening version number was passed, then set version number to what
-#   user specified, and later print the number. No other real action for
-#   this in code at this time.
-if options.HARDVERSION:
-    hardVersion = options.HARDVERSION
-
-
-###---
-### verify we have correct paths to system's external programs
-###---
-(ecode, rval, verifiedExternalPrograms) = verifyExtProg(initialExtProgs)
-if ecode != 0:
-    print('%s' % rval)
-    sys.exit(1)
-else:
-    # put programs into environment so later called scripts have access to them
+    ###---
+    ### If an inventory was passed, we are the controller: execute on every
+    ###     host of it, with the same options, instead of on this one
+    ###---
+    if options.INVENTORY:
+        from fanout import loadInventory, runFanout
+
+        (ecode, rval, hosts) = loadInventory(options.INVENTORY)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+        installArgs = ['-s', hardSpec, '-d', debuglevel, '-l', loglevel,
+                       '-v', hardVersion]
+        if exeScriptname:
+            installArgs.extend(['-x', exeScriptname])
+        if jobs:
+            installArgs.extend(['-j', str(jobs)])
+        if compressThreads:
+            installArgs.extend(['-z', str(compressThreads)])
+        if streamOutput is True:
+            installArgs.append('-S')
+        if profileRun is True:
+            installArgs.append('--profile')
+        if checkDriftRun is True:
+            installArgs.append('--check-drift')
+        if testMode is True:
+            installArgs.append('-t')
+        if resetTest == '1':
+            installArgs.append('-r')
+
+        if options.COLLECTDIR:
+            collectDir = os.path.abspath(options.COLLECTDIR)
+        else:
+            collectDir = HOME + '/hardening/fanout/' + \
+                datetime.datetime.now().strftime("%y-%m-%d-%H-%M")
+
+        print('Executing on %s hosts, up to %s at a time.\n'
+              % (len(hosts), options.PARALLELHOSTS))
+        (ecode, hostResults) = runFanout(hosts, installArgs,
+                                         options.PARALLELHOSTS, collectDir)
+
+        print('\nResults collected to: %s' % collectDir)
+        for (host, hostEcode, rval) in hostResults:
+            if hostEcode == 0:
+                print('  %-20s ok' % host)
+            else:
+                print('  %-20s FAILED: %s' % (host, rval))
+
+        endTime = datetime.datetime.now()
+        diffTime = endTime - startTime
+        print('\nExecution complete. Elapsed time = %s seconds.'
+              % diffTime.seconds)
+        sys.exit(ecode)
+
+    ###---
+    ### External programs are looked up on first use. Until the tmp directory
+    ###     holding the toolchain cache is known, they are looked up uncached.
+    ###---
+    toolchain = Toolchain()
+
+    ###---
+    ### If testmode not explicitly requested on command line, find out if we
+    ###   are executing as root or not. If root then we will assume we are in
+    ###   LIVE production environment, else if we executing as some non-root
+    ###   user assume that we are in test mode, and use alternate execution
+    ###   directory and do not change real system files.
+    ###---
+    if testMode is False:
+        # find out who is executing this program
+        (ecode, rval, WHOAMI_PROGRAM) = toolchain.program('WHOAMI_PROGRAM')
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+        cmd = '%s' % WHOAMI_PROGRAM
+
+        # execute command in as a subprocess
+        whop = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+
+        # get standard output and standard error from command executed
+        (autoMan, err) = whop.communicate()
+        # strip newline character
+        autoMan = autoMan.rstrip()
+
+        # if we could determine who was executing, then check if root
+        if err is None:
+            if autoMan == "root":
+                # set that we are executing in live production environment
+                InstallType = "LIVE"
+
+                # set that we are executing from root's home directory, and
+                #   payload install directory
+                instDir = HOME + '/' + 'hardening' + '/' + 'payload'
+
+                # set standards directory location
+                instStandards = instDir + '/' + 'standards'
+
+                # exeDir is an alternate execution directory used during
+                #   testmode to ensure we only write to files found therein,
+                #   and not to real system file locations. If we are running
+                #   in LIVE production environment and not executing in
+                #   testmode, then this alternate exeDir should be blank
+                exeDir = ""
+        else:
+            # else, whoami failed, print error, and exit
+            print('%s unable to determine if we are executing as root'
+                  % scriptName)
+            sys.exit(1)
+
+    ###---
+    ### put variables into environment for this and later called scripts to use
+    ###---
+    # based on command line arguments and defaults
+    os.environ['exeScriptname'] = exeScriptname
+    os.environ['debuglevel'] = debuglevel
+    os.environ['loglevel'] = loglevel
+    os.environ['InstallType'] = InstallType
+    os.environ['instDir'] = instDir
+    os.environ['instStandards'] = instStandards
+    os.environ['exeDir'] = exeDir
+    os.environ['resetTest'] = resetTest
+
+    # relative to the installation directory of this script
+    instSrc = instDir + '/' + 'src'
+    os.environ['instSrc'] = instSrc
+    instSrcPy = instSrc + '/' + 'py'
+    os.environ['instSrcPy'] = instSrcPy
+    instSrcTests = instSrcPy + '/' 'tests'
+    os.environ['instSrcTests'] = instSrcTests
+
+    # installation variable, lists, and banner files
+    instVar = instDir + '/' + 'var'
+    os.environ['instVar'] = instVar
+    instLists = instVar + '/' + 'lists'
+    os.environ['instLists'] = instLists
+    specBanner = instVar + '/' + 'banner.txt'
+    os.environ['specBanner'] = specBanner
+
+    ###------------------------------------------------------------------------
+    ### Declare remaining environment variables which uses execution
+    ###     directory based on if we are executing in LIVE environment or
+    ###     in test mode
+    ###------------------------------------------------------------------------
+
+    # Set up variables to user's environment, note that exeDir is blank when
+    #   executing in LIVE environment in non-test mode; if in test mode, exeDir
+    #   will point to relative path hardening/payload/sys so that we will not
+    #   modify the real root directory, but a fake one
+    userHome = exeDir + '/' + 'root'
+    os.environ['userHome'] = userHome
+    hardDir = userHome + '/' + 'hardening'
+    os.environ['hardDir'] = hardDir
+
+    # Set up back up and log directories
+    backupDir = hardDir + '/' + 'backups'
+    os.environ['backupDir'] = backupDir
+    backupLogs = hardDir + '/' + 'logs'
+    os.environ['backupLogs'] = backupLogs
+    tmpDir = hardDir + '/' + 'tmp'
+    os.environ['tmpDir'] = tmpDir
+
+    ###---
+    ### Create the backups, logs, and tmp directories used by everything below
+    ###---
+    # create backups, logs, and tmp directories
+    setupDirs = (backupDir, backupLogs, tmpDir)
+    for directory in setupDirs:
+        """ create directory if not exist"""
+        if os.access(directory, os.F_OK):
+            if os.path.isdir(directory) is False:
+                try:
+                    os.makedirs(directory, mode=0o755)
+                except Exception:
+                    (type, value, traceback) = sys.exc_info()
+                    print('Unable to create required directory %s: %s'
+                          % (directory, value))
+                    sys.exit(1)
+        else:
+            try:
+                os.makedirs(directory, mode=0o755)
+            except Exception:
+                (type, value, traceback) = sys.exc_info()
+                print('Unable to create required directory %s: %s'
+                      % (directory, value))
+                sys.exit(1)
+
+    ###---
+    ### In test mode exeDir is the upper layer of an overlay of the test base:
+    ###     the targets and module inputs not yet in it are copied up, so the
+    ###     modules find them under exeDir
+    ###---
+    overlay = None
+    if exeDir:
+        from overlay import openOverlay
+
+        (ecode, rval, overlay) = openOverlay(exeDir, options.TESTBASE)
+        if ecode == 0:
+            os.environ['overlayBase'] = options.TESTBASE
+            (ecode, rval, targets) = targetsOf(instLists, instLists + '/' +
+                                               hardSpec + '_modules.list')
+        if ecode == 0:
+            (ecode, rval, counts) = overlay.materialize(targets)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+        if debuglevel == '1':
+            print('Test root %s over %s: %s files, %s copied up, %s '
+                  'unreadable, in %.2f seconds'
+                  % (exeDir, options.TESTBASE, counts['files'],
+                     counts['copied'], counts['unreadable'],
+                     counts['seconds']))
+
+    ###---
+    ### Save the initial state of the files the standard may change, their
+    ###     modes, ownership and contents, if we did not previously
+    ###---
+    from snapshot import (checkDrift, convergedName, loadManifest,
+                          manifestName, takeSnapshot, unchangedModules)
+
+    initialStateDir = backupLogs + '/' + 'initialstate'
+    os.environ['initialStateDir'] = initialStateDir
+    if os.path.isfile(initialStateDir + '/' + manifestName) is False:
+        # files and directories to save, default /etc, and module inputs
+        (ecode, rval, targets) = targetsOf(instLists, instLists + '/' +
+                                           hardSpec + '_modules.list')
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+        # relative to exeDir, so in test mode the state of the fake root is
+        #   saved, not the real one
+        (ecode, rval, counts) = takeSnapshot(targets, exeDir,
+                                             initialStateDir)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+        print('Initial state saved to %s:' % initialStateDir)
+        print('    %s files, %s stored (%.1f MB) in %.1f seconds'
+              % (counts['files'], counts['stored'],
+                 counts['storedBytes'] / 1048576.0, counts['seconds']))
+        if counts['unreadable']:
+            print('    %s files could not be read, their digest is ?'
+                  % counts['unreadable'])
+
+    ###---
+    ### Verified paths to the system's external programs are cached in the tmp
+    ###     directory, for later runs and for the scripts we execute
+    ###---
+    toolchainCache = tmpDir + '/' + 'toolchain.cache'
+    os.environ['toolchainCache'] = toolchainCache
+    toolchain = Toolchain(toolchainCache)
+
+    # let the scripts we execute import toolchain from here
+    if os.environ.get('PYTHONPATH'):
+        os.environ['PYTHONPATH'] = scriptPath + os.pathsep + \
+            os.environ['PYTHONPATH']
+    else:
+        os.environ['PYTHONPATH'] = scriptPath
+
+    # put every program into environment, so later called scripts which do
+    #   not use toolchain still have access to them; only programs missing
+    #   from, or replaced since, the cache are searched for
+    (verifiedExternalPrograms, missingPrograms) = toolchain.resolved()
+    if missingPrograms:
+        for var in missingPrograms:
+            print('%s' % toolchain.missingMessage(var))
+        sys.exit(1)
     for program in verifiedExternalPrograms:
         # parse list of programs whose execution path were verified
         #       verifiedExternalPrograms =
@@ -536,439 +1283,495 @@ else:
         #       os.environ['CHMOD_PROGRAM' = '/usr/sbin/chmod']
         os.environ[program[0]] = program[1]
 
-###---
-### If testmode not explicitly requested on command line, find out if we
-###   are executing as root or not. If root then we will assume we are in
-###   LIVE production environment, else if we executing as some non-root
-###   user assume that we are in test mode, and use alternate execution
-###   directory and do not change real system files.
-###---
-if testMode is False:
-    # find out who is executing this program
-    WHOAMI_PROGRAM = os.environ['WHOAMI_PROGRAM']
-    cmd = '%s' % WHOAMI_PROGRAM
-
-    # execute command in as a subprocess
-    whop = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    ###---
+    ### If STIG, create a csv file to status test results, from the rules
+    ###     parsed out of the original STIG SRG manual in xml format. The
+    ###     parsed rules are cached, and only parsed again when a different
+    ###     manual is found.
+    ###---
+    if hardSpecUC == 'STIG':
+        stigCSVFileBasename = 'SRG.csv'
+        stigCSVFile = backupLogs + '/' + stigCSVFileBasename
+        os.environ['stigCSVFile'] = stigCSVFile
+        stigCacheFile = backupLogs + '/' + 'SRG.cache'
+
+        # get XML full filename, newest manual if there is more than one
+        stigXMLPattern = instVar + '/' + 'U_UNIX_V*_SRG_Manual-xccdf.xml'
+        import glob
+        stigXMLFiles = glob.glob(stigXMLPattern)
+        if not stigXMLFiles:
+            print('Unable to find STIG Manual %s to create STIG csv file %s'
+                  % (stigXMLPattern, stigCSVFile))
+            sys.exit(1)
+        stigXMLOrigFile = max(stigXMLFiles, key=os.path.getmtime)
+
+        (ecode, rval, stigRules) = loadSRGRules(stigXMLOrigFile, stigCacheFile)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+        # written fresh every run, so no status is left from an earlier run
+        (ecode, rval) = writeSRGCSV(stigRules, stigCSVFile)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+    ###---
+    ### Create output log files in txt and HTML format, writing to txt file
+    ###     first, then converting it to HTML format once execution completes.
+    ###---
+    # get valid date string in yymmddHHMM format
+    valDate = str(datetime.datetime.now().strftime("%y-%m-%d-%H-%M"))
+
+    # get hostname
+    (ecode, rval, HOSTNAME_PROGRAM) = toolchain.program('HOSTNAME_PROGRAM')
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
+    cmd = '%s -s' % HOSTNAME_PROGRAM
+
+    # Execute hostname as a subprocess
+    hostnamep = subprocess.Popen(["bash", "-c", cmd],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
 
     # get standard output and standard error from command executed
-    (autoMan, err) = whop.communicate()
-    # strip newline character
-    autoMan = autoMan.rstrip()
-
-    # if we could determine who was executing, then check if root
-    if err is None:
-        if autoMan == "root":
-            # set that we are executing in live production environment
-            InstallType = "LIVE"
-
-            # set that we are executing from root's home directory, and
-            #   payload install directory
-            instDir = HOME + '/' + 'hardening' + '/' + 'payload'
-
-            # set standards directory location
-            instStandards = instDir + '/' + 'standards'
-
-            # exeDir is an alternate execution directory used during
-            #   testmode to ensure we only write to files found therein,
-            #   and not to real system file locations. If we are running
-            #   in LIVE production environment and not executing in
-            #   testmode, then this alternate exeDir should be blank
-            exeDir = ""
+    (valHostname, err) = hostnamep.communicate()
+
+    # set output filenames with time stamp and hostname if available
+    if valHostname:
+        # remove newline character
+        valHostname = valHostname.rstrip()
+        resultsName = backupLogs + '/' + \
+            valDate + '_installOutput_' + valHostname
     else:
-        # else, whoami failed, print error, and exit
-        print('%s unable to determine if we are executing as root'
-              % scriptName)
+        resultsName = backupLogs + '/' + valDate + '_installOutput'
+
+    # a run in the same minute as an earlier one gets the first free _2,
+    #   _3, ... suffix, so it never overwrites the earlier run's results
+    resultsSuffix = ''
+    runCount = 1
+    while os.path.exists(resultsName + resultsSuffix) or \
+            os.path.exists(resultsName + resultsSuffix + '.html') or \
+            os.path.exists(resultsName + resultsSuffix + '.txt'):
+        runCount += 1
+        resultsSuffix = '_%s' % runCount
+    resultsHTMLdir = resultsName + resultsSuffix
+    resultsHTML = resultsName + resultsSuffix + '.html'
+    resultsTxt = resultsName + resultsSuffix + '.txt'
+    resultsEvents = resultsName + resultsSuffix + '.jsonl'
+    profileDir = resultsName + resultsSuffix + '_profiles'
+
+    rdirbasename = resultsHTMLdir.split('/')[-1]
+    rbasename = resultsHTML.split('/')[-1]
+
+    # if loglevel == 0, set temporary html file name global variable
+    if int(loglevel) == 0:
+        outputHTML = tmpDir + '/' + \
+            valDate + '_installOutputBody_' + valHostname + resultsSuffix + \
+            '.html'
+        os.environ['outputHTML'] = outputHTML
+
+    # open the output log for writing
+    try:
+        resultsTxt_fp = open(resultsTxt, "w+")
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        print('Could not open %s to log results: %s' % (resultsTxt, value))
         sys.exit(1)
 
-###---
-### put variables into environment for this and later called scripts to use
-###---
-# based on command line arguments and defaults
-os.environ['exeScriptname'] = exeScriptname
-os.environ['debuglevel'] = debuglevel
-os.environ['loglevel'] = loglevel
-os.environ['InstallType'] = InstallType
-os.environ['instDir'] = instDir
-os.environ['instStandards'] = instStandards
-os.environ['exeDir'] = exeDir
-os.environ['resetTest'] = resetTest
-
-# relative to the installation directory of this script
-instSrc = instDir + '/' + 'src'
-os.environ['instSrc'] = instSrc
-instSrcPy = instSrc + '/' + 'py'
-os.environ['instSrcPy'] = instSrcPy
-instSrcTests = instSrcPy + '/' 'tests'
-os.environ['instSrcTests'] = instSrcTests
-
-# installation variable, lists, and banner files
-instVar = instDir + '/' + 'var'
-os.environ['instVar'] = instVar
-instLists = instVar + '/' + 'lists'
-os.environ['instLists'] = instLists
-specBanner = instVar + '/' + 'banner.txt'
-os.environ['specBanner'] = specBanner
+    # HTML conversion of the standard's output, written while it executes
+    convertedHTML = tmpDir + '/' + \
+        valDate + '_installOutputConverted_' + valHostname + resultsSuffix + \
+        '.html'
 
-###----------------------------------------------------------------------------
-### Declare remaining environment variables which uses execution
-###     directory based on if we are executing in LIVE environment or
-###     in test mode
-###----------------------------------------------------------------------------
+    try:
+        converter = HTMLConverter(convertedHTML)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        print('Could not open %s to convert results: %s'
+              % (convertedHTML, value))
+        sys.exit(1)
 
-# Set up variables to user's environment, note that exeDir is blank when
-#   executing in LIVE environment in non-test mode; if in test mode, exeDir
-#   will point to relative path hardening/payload/sys so that we will not
-#   modify the real root directory, but a fake one
-userHome = exeDir + '/' + 'root'
-os.environ['userHome'] = userHome
-hardDir = userHome + '/' + 'hardening'
-os.environ['hardDir'] = hardDir
-
-# Set up back up and log directories
-backupDir = hardDir + '/' + 'backups'
-os.environ['backupDir'] = backupDir
-backupLogs = hardDir + '/' + 'logs'
-os.environ['backupLogs'] = backupLogs
-tmpDir = hardDir + '/' + 'tmp'
-os.environ['tmpDir'] = tmpDir
-
-###---
-### Save initial state of the system if we did not previously
-###---
-initialstatelogdir = backupLogs + '/' + 'initialstatefiles'
-if os.access(initialstatelogdir, os.F_OK):
-    if os.path.isdir(initialstatelogdir) is False:
-        # Execute initialstate.sh as a subprocess
-        cmd = '%s/payload/src/sh/initialstate.sh' % hardDir
-        initstp = subprocess.Popen(["bash", "-c", cmd],
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
+    # create file to hold test execution status of STIG test cases
+    stigStatusFile = tmpDir + '/' + valDate + resultsSuffix + '_stigStatus.txt'
 
-        # get standard output and standard error from command executed
-        (valHostname, err) = initstp.communicate()
-
-###---
-### If STIG, ensure that we have a csv file to status test results, created
-###     by parsing the original STIG SRG manual in xml format
-###---
-if hardSpecUC == 'STIG':
-    stigCSVFileBasename = 'SRG.csv'
-    stigCSVFile = backupLogs + '/' + stigCSVFileBasename
-    os.environ['stigCSVFile'] = stigCSVFile
-    stigXMLOrigFile = instVar + '/' + 'U_UNIX_V*_SRG_Manual-xccdf.xml'
-    cmd = 'ls %s' % stigXMLOrigFile
-    # get XML full filename
+    # open the STIG status result log for writing
     try:
-        process = subprocess.Popen(["bash", "-c", cmd],
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
+        stigStatus_fp = open(stigStatusFile, "w+")
     except Exception:
-        # handle any exception from subprocess when it execs bash process
+        # if error, return error message
         (type, value, traceback) = sys.exc_info()
-        print('Could not get full filename of STIG Manual %s: %s'
-              % (stigXMLOrigFile, value))
-        # return 1 for error, error message, and empty list
+        print('Could not open %s: %s' % (stigStatusFile, value))
         sys.exit(1)
 
-    # get standard output and standard error from bash -c
-    (stdout, stderr) = process.communicate()
+    os.environ['stigStatusFile'] = stigStatusFile
 
-    # remove newline character
-    stigXMLOrigFile = stdout.strip()
+    # record the run, its output and test case status to the results database
+    from results import ResultsDB
 
-    if os.access(stigCSVFile, os.F_OK) is False:
-        # see if SRG manual is available to create it
-        if os.access(stigXMLOrigFile, os.F_OK):
-            parseModule = instSrcPy + '/parseSRGManual.py'
+    resultsDBFile = backupLogs + '/' + 'results.db'
+    try:
+        resultsDB = ResultsDB(resultsDBFile)
+        runID = resultsDB.startRun(valHostname, hardSpecUC, hardVersion,
+                                   InstallType, resultsTxt)
+        resultsDB.watchStatus(stigStatusFile)
+        # files the modules back up are indexed by this run
+        os.environ['runID'] = str(runID)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        print('Could not record the run to %s: %s' % (resultsDBFile, value))
+        sys.exit(1)
+
+    # the run is recorded as finished, with the status it ends with, however
+    #   it ends, and with all of its output
+    runStatus = 1
+    try:
+        # output is written to the console as the standard executes with -S
+        #   or -j, else once it completes
+        liveOutput = streamOutput is True or (jobs and not exeScriptname)
+
+        # progress is shown from the events of the modules, out of the modules
+        #   declared for the standard, if they are
+        moduleList = instLists + '/' + hardSpec + '_modules.list'
+
+        ###---
+        ### With check drift, find which targets and module inputs drifted
+        ###     since the last run, and which modules need not be executed
+        ###     again
+        ###---
+        unchanged = []
+        driftReport = []
+        if checkDriftRun is True:
+            (ecode, rval, driftTargets) = targetsOf(instLists, moduleList)
+            if ecode != 0:
+                print('%s' % rval)
+                sys.exit(1)
+
+            # against the state after the last run, else the initial state
+            baseline = initialStateDir + '/' + convergedName
+            if os.path.isfile(baseline) is False:
+                baseline = initialStateDir + '/' + manifestName
+            (ecode, rval, drifted, counts) = checkDrift(driftTargets, exeDir,
+                                                        baseline)
+            if ecode != 0:
+                print('%s' % rval)
+                sys.exit(1)
+
+            # reported with the settings below, to screen and log file
+            driftReport.append('Drift since %s: %s of %s files, %s hashed, in '
+                               '%.1f seconds'
+                               % (os.path.basename(baseline), len(drifted),
+                                  counts['files'], counts['hashed'],
+                                  counts['seconds']))
+            for (path, changes) in drifted:
+                driftReport.append('    %-20s %s' % (','.join(changes), path))
+
+            from scheduler import loadModuleInputs, loadModuleList
+            (ecode, rval, moduleInputs) = loadModuleInputs(moduleList)
+            if ecode == 0:
+                unchanged = unchangedModules(
+                    moduleInputs, drifted, dict(loadModuleList(moduleList)[2]))
+            if unchanged:
+                driftReport.append('Not executing %s unchanged modules: %s'
+                                   % (len(unchanged), ' '.join(unchanged)))
+
+        if exeScriptname:
+            moduleTotal = 1
+        elif os.path.isfile(moduleList):
+            from scheduler import loadModuleList
+            moduleTotal = len(loadModuleList(moduleList)[2]) or None
+        else:
+            moduleTotal = None
+        # with -j, the scheduler reports the modules, not their events
+        from events import EventDemux, timing, usage
+        from progress import Progress
+
+        progress = Progress(moduleTotal,
+                            moduleEvents=not (jobs and not exeScriptname))
+
+        # events emitted by the modules are taken out of their output, logged
+        #   to resultsEvents, and recorded; the rest of the output is logged to
+        #   screen and text file, converted to HTML, and recorded
+        heldLines = []
+        if liveOutput:
+            consoleHandler = progress.wrap(teeLine(resultsTxt_fp))
+        else:
+            consoleHandler = holdLine(resultsTxt_fp, heldLines)
+        try:
+            demux = EventDemux(resultsEvents,
+                               [consoleHandler, converter.handler,
+                                resultsDB.handler],
+                               [resultsDB.event, progress.event])
+        except Exception:
+            # if error, return error message
+            (type, value, traceback) = sys.exc_info()
+            print('Could not open %s to log events: %s'
+                  % (resultsEvents, value))
+            sys.exit(1)
+
+        ###---
+        ### Announce and harden, going forward we are writing duplicate
+        ###     messages to screen, and to log file.
+        ###---
+
+        # print information about settings we are executing with
+        if InstallType != 'LIVE':
+            print('Running in %s mode.' % InstallType)
+            resultsTxt_fp.write('Running in %s mode.\n' % InstallType)
+
+            if resetTest == '1':
+                print('Reset files for testing is turned on.')
+                resultsTxt_fp.write('Reset files for testing is turned on.\n')
+
+            print('Debug level = %s' % debuglevel)
+            resultsTxt_fp.write('Debug level = %s\n' % debuglevel)
+
+            print('Logging level = %s' % loglevel)
+            resultsTxt_fp.write('Logging level = %s\n' % loglevel)
+
+        ###---
+        ### If there is no backup directory then make one
+        ###---
+        if os.path.isdir(backupDir) is False:
             try:
-                parse_p = subprocess.Popen(parseModule,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE)
+                # create all paths along the way if needed, set permission mode
+                os.makedirs(backupDir, mode=0o755)
             except Exception:
                 # if error, print message, and exit
                 (type, value, traceback) = sys.exc_info()
-                print('Could not execute %s: %s' % (parseModule, value))
+                print('%s: %s' % (backupDir, value))
                 sys.exit(1)
 
-            parse_p.wait()
+        if debuglevel == '1':
+            print('The backup directory is here: %s' % backupDir)
+            resultsTxt_fp.write('The backup directory is here: %s\n'
+                                % backupDir)
 
-            # get the standard output and standard error results
-            (stdout, stderr) = parse_p.communicate()
-            if stderr:
-                print('%s: subprocess.Popen error %s' % (parseModule, stderr))
+        ###---
+        ### If there is no logs directory then make one
+        ###---
+        if os.path.isdir(backupLogs) is False:
+            try:
+                # create all paths along the way if needed, set permission mode
+                os.makedirs(backupLogs, mode=0o755)
+            except Exception:
+                # if error, print message, and exit
+                (type, value, traceback) = sys.exc_info()
+                print('%s: %s' % (backupLogs, value))
                 sys.exit(1)
 
-            ### Write output from subprocess python scripts to standard output
-            print(stdout)
-        else:
-            print('Unable to access STIG csv file %s (or original %s \
-to create it)'
-                  % (stigCSVFile, stigXMLOrigFile))
-            sys.exit(1)
-
-###---
-### Create output log files in txt and HTML format, writing to txt file
-###     first, then converting it to HTML format once execution completes.
-###---
-# create backups, logs, and tmp directories
-setupDirs = (backupDir, backupLogs, tmpDir)
-for directory in setupDirs:
-    """ create directory if not exist"""
-    if os.access(directory, os.F_OK):
-        if os.path.isdir(directory) is False:
+        if debuglevel == '1':
+            print('The logs directory is here: %s' % backupLogs)
+            resultsTxt_fp.write('The logs directory is here: %s\n'
+                                % backupLogs)
+
+        if debuglevel == '1':
+            print('\nExternal programs verified so far are:')
+            resultsTxt_fp.write('\nExternal programs verified so far are:\n')
+            for programs in toolchain.verified():
+                print('%s = %s' % (programs[0], programs[1]))
+                resultsTxt_fp.write('%s = %s\n' % (programs[0], programs[1]))
+
+        ###---
+        ### Kick-Off the standards script
+        ###---
+        for line in driftReport:
+            print(line)
+            resultsTxt_fp.write(line + '\n')
+
+        print('\nHardening to version %s of %s standard.\n'
+              % (hardVersion, hardSpec))
+        resultsTxt_fp.write('\nHardening to version %s of %s standard.\n\n'
+                            % (hardVersion, hardSpec))
+
+        standardFile = instSrcPy + '/' + hardSpec + '.py'
+        standardFile = os.path.abspath(standardFile)
+        print('The full path is: %s\n' % standardFile)
+        resultsTxt_fp.write('The full path is: %s\n\n' % standardFile)
+        if not exeScriptname:
+            print('Just a minute...:')
+            resultsTxt_fp.write('Just a minute...%s\n\n')
+
+        # with profile, the standard is executed under cProfile, or each module
+        #   when executed on its own, see runModules
+        standardCmd = [standardFile]
+        if profileRun is True:
             try:
-                os.makedirs(directory, mode=0755)
+                os.makedirs(profileDir, mode=0o755)
             except Exception:
+                # if error, print message, and exit
                 (type, value, traceback) = sys.exc_info()
-                print('Unable to create required directory: %s'
-                      % (directory, value))
+                print('Could not make directory: %s' % value)
+                sys.exit(1)
+            standardCmd = [sys.executable, '-m', 'cProfile', '-o',
+                           '%s/%s.prof'
+                           % (profileDir, exeScriptname or hardSpec),
+                           standardFile]
+
+        # resources used by the standard, i.e. by every child process of ours
+        moduleResults = []
+        standardUsage = usage((resource.RUSAGE_CHILDREN,))
+
+        if jobs and not exeScriptname:
+            from scheduler import loadModuleList, runModules
+
+            # modules of the standard, and the modules each depends on
+            (ecode, rval, modules) = loadModuleList(moduleList)
+            if ecode != 0:
+                print('%s' % rval)
                 sys.exit(1)
-    else:
-        try:
-            os.makedirs(directory, mode=0755)
-        except Exception:
-            (type, value, traceback) = sys.exc_info()
-            print('Unable to create required directory: %s'
-                  % (directory, value))
-            sys.exit(1)
 
-# get valid date string in yymmddHHMM format
-valDate = str(datetime.datetime.now().strftime("%y-%m-%d-%H-%M"))
-
-# get hostname
-HOSTNAME_PROGRAM = os.environ['HOSTNAME_PROGRAM']
-cmd = '%s -s' % HOSTNAME_PROGRAM
-
-# Execute hostname as a subprocess
-hostnamep = subprocess.Popen(["bash", "-c", cmd],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-# get standard output and standard error from command executed
-(valHostname, err) = hostnamep.communicate()
-
-# set output filenames with time stamp and hostname if available
-if valHostname:
-    # remove newline character
-    valHostname = valHostname.rstrip()
-    resultsHTMLdir = backupLogs + '/' + \
-        valDate + '_installOutput_' + valHostname
-    resultsHTML = backupLogs + '/' + \
-        valDate + '_installOutput_' + valHostname + '.html'
-    resultsTxt = backupLogs + '/' + \
-        valDate + '_installOutput_' + valHostname + '.txt'
-else:
-    resultsHTMLdir = backupLogs + '/' + valDate + '_installOutput'
-    resultsHTML = backupLogs + '/' + valDate + '_installOutput.html'
-    resultsTxt = backupLogs + '/' + valDate + '_installOutput.txt'
-
-rdirbasename = resultsHTMLdir.split('/')[-1]
-rbasename = resultsHTML.split('/')[-1]
-
-# if loglevel == 0, set temporary html file name global variable
-if int(loglevel) == 0:
-    outputHTML = tmpDir + '/' + \
-        valDate + '_installOutputBody_' + valHostname + '.html'
-    os.environ['outputHTML'] = outputHTML
-
-# open the output log for writing
-try:
-    resultsTxt_fp = open(resultsTxt, "w+")
-except Exception:
-    # if error, return error message
-    (type, value, traceback) = sys.exc_info()
-    print('Could not open % to log results: %s' % (resultsTxt, value))
-    sys.exit(1)
-
-# create file to hold test execution status of STIG test cases
-stigStatusFile = tmpDir + '/' + valDate + '_stigStatus.txt'
-
-# open the STIG status result log for writing
-try:
-    stigStatus_fp = open(stigStatusFile, "w+")
-except Exception:
-    # if error, return error message
-    (type, value, traceback) = sys.exc_info()
-    print('Could not open %s: %s' % (stigStatusFile, value))
-    sys.exit(1)
-
-os.environ['stigStatusFile'] = stigStatusFile
-
-###---
-### Announce and harden, going forward we are writing duplicate messages to
-###     screen, and to log file.
-###---
-
-# print information about settings we are executing with
-if InstallType != 'LIVE':
-    print('Running in %s mode.' % InstallType)
-    resultsTxt_fp.write('Running in %s mode.\n' % InstallType)
-
-    if resetTest == '1':
-        print('Reset files for testing is turned on.')
-        resultsTxt_fp.write('Reset files for testing is turned on.\n')
-
-    print('Debug level = %s' % debuglevel)
-    resultsTxt_fp.write('Debug level = %s\n' % debuglevel)
-
-    print('Logging level = %s' % loglevel)
-    resultsTxt_fp.write('Logging level = %s\n' % loglevel)
-
-###---
-### If there is no backup directory then make one
-###---
-if os.path.isdir(backupDir) is False:
-    try:
-        # create all paths along the way if needed, set permission mode
-        os.makedirs(backupDir, mode=0755)
-    except Exception:
-        # if error, print message, and exit
-        (type, value, traceback) = sys.exc_info()
-        print('%s: %s' % value)
-        sys.exit(1)
+            print('Executing %s modules, up to %s at a time.\n'
+                  % (len(modules), jobs))
+            resultsTxt_fp.write('Executing %s modules, up to %s at a time.\n\n'
+                                % (len(modules), jobs))
+
+            # with profile, each module is executed under cProfile
+            moduleProfileDir = None
+            if profileRun is True:
+                moduleProfileDir = profileDir
+
+            # output of each module is passed on once it completed, in report
+            #   order
+            (ecode, rval, moduleResults) = runModules(standardFile, modules,
+                                                      jobs, [demux.handler],
+                                                      tmpDir, moduleProfileDir,
+                                                      progress.moduleState,
+                                                      unchanged)
+            progress.finish()
+            resultsDB.recordModules(moduleResults)
+            if ecode != 0:
+                print('%s: %s' % (standardFile, rval))
+                sys.exit(1)
+        elif streamOutput is True:
+            (ecode, rval, stderrLines) = streamProcess(standardCmd,
+                                                       [demux.handler])
+            progress.finish()
+            if ecode != 0 and rval:
+                print(rval)
+                sys.exit(1)
+            if stderrLines:
+                print('%s: subprocess.Popen error, %s lines written to stderr'
+                      % (standardFile, stderrLines))
+                sys.exit(1)
+        else:
+            # output is held until the standard completes, events show progress
+            (ecode, rval, stderrLines) = streamProcess(standardCmd,
+                                                       [demux.handler])
+            progress.finish()
+            if ecode != 0 and rval:
+                print(rval)
+                sys.exit(1)
+            if stderrLines:
+                print('%s: subprocess.Popen error %s' % (standardFile,
+                      ''.join([line for (streamName, line) in heldLines
+                               if streamName == 'stderr'])))
+                sys.exit(1)
+
+            ### Write output from subprocess python scripts to standard output
+            for (streamName, line) in heldLines:
+                sys.stdout.write(line)
+            sys.stdout.flush()
+            heldLines = []
+
+        # the standard completed, with its exit status
+        runStatus = ecode
+
+        standardTiming = timing(standardUsage,
+                                usage((resource.RUSAGE_CHILDREN,)), None)
+
+        # output is logged and converted to HTML, events are logged, close all
+        #   three
+        resultsTxt_fp.close()
+        converter.close()
+        demux.close()
+
+        # time taken by the standard, by each module, and by each external
+        #   command the modules reported
+        timings = [('standard', exeScriptname or hardSpec, standardTiming)]
+        for (module, returncode, stderrLines, moduleTiming) in moduleResults:
+            if moduleTiming is not None:
+                timings.append(('process', module, moduleTiming))
+        for module in demux.moduleOrder:
+            if demux.modules[module]['end'] is not None:
+                timings.append(('module', module,
+                                demux.modules[module]['end']))
+        for event in demux.commands:
+            timings.append(('command', event['command'], event))
+
+        # the standard completed, record its timing; the rest of its output
+        #   and status are recorded as the run finishes
+        resultsDB.recordTimings(timings)
+    finally:
+        resultsDB.finishRun(runStatus)
+        resultsDB.close()
+
+    # with reset test, discard what the standard changed in the test root,
+    #   keeping our own logs and backups, and copy the targets it removed up
+    #   again, as the next run would
+    if overlay is not None and resetTest == '1':
+        (ecode, rval, counts) = overlay.reset([hardDir[len(exeDir):]])
+        if ecode == 0:
+            (ecode, rval, resetTargets) = targetsOf(instLists, moduleList)
+        if ecode == 0:
+            (ecode, rval, copied) = overlay.materialize(resetTargets)
+        if ecode != 0:
+            print('%s' % rval)
+        elif debuglevel == '1':
+            print('Test root reset: %s files, %s removed, %s copied up '
+                  'again, in %.2f seconds'
+                  % (counts['files'], counts['removed'], copied['copied'],
+                     counts['seconds'] + copied['seconds']))
+
+    # the state the run converged to, after any reset, is what the next
+    #   --check-drift compares with; files which kept their size and mtime are
+    #   not hashed again. A run which failed is not a state converged to, the
+    #   modules it changed files of are executed again next time
+    if runStatus != 0:
+        (ecode, rval) = (1, 'the standard exited with status %s' % runStatus)
+    else:
+        (ecode, rval, convergeTargets) = targetsOf(instLists, moduleList)
+    if ecode == 0:
+        previousState = initialStateDir + '/' + convergedName
+        if os.path.isfile(previousState) is False:
+            previousState = initialStateDir + '/' + manifestName
+        (ecode, rval, previous) = loadManifest(previousState)
+    if ecode == 0:
+        (ecode, rval, counts) = takeSnapshot(convergeTargets, exeDir,
+                                             initialStateDir, convergedName,
+                                             previous)
+    if ecode != 0:
+        print('Could not save the state after this run: %s' % rval)
+    elif debuglevel == '1':
+        print('State after this run saved: %s files, %s hashed, %s stored'
+              % (counts['files'], counts['hashed'], counts['stored']))
 
-if debuglevel == '1':
-    print('The backup directory is here: %s' % backupDir)
-    resultsTxt_fp.write('The backup directory is here: %s\n' % backupDir)
+    ###---
+    ### Open the results archive, each result is added to it as soon as it is
+    ###     written
+    ###---
+    from archive import ResultsArchive
 
-###---
-### If there is no logs directory then make one
-###---
-if os.path.isdir(backupLogs) is False:
     try:
-        # create all paths along the way if needed, set permission mode
-        os.makedirs(backupLogs, mode=0755)
+        resultsArchive = ResultsArchive(backupLogs + '/' + tarFileName,
+                                        compressThreads)
     except Exception:
         # if error, print message, and exit
         (type, value, traceback) = sys.exc_info()
-        print('%s: %s' % value)
+        print('Could not create %s/%s: %s' % (backupLogs, tarFileName, value))
         sys.exit(1)
 
-if debuglevel == '1':
-    print('The logs directory is here: %s' % backupLogs)
-    resultsTxt_fp.write('The logs directory is here: %s\n' % backupLogs)
-
-if debuglevel == '1':
-    print('\nExternal programs being used are:')
-    resultsTxt_fp.write('\nExternal programs being used are:\n')
-    for programs in verifiedExternalPrograms:
-        print('%s = %s' % (programs[0], programs[1]))
-        resultsTxt_fp.write('%s = %s\n' % (programs[0], programs[1]))
-
-###---
-### Kick-Off the standards script
-###---
-print('\nHardening to version %s of %s standard.\n'
-      % (hardVersion, hardSpec))
-resultsTxt_fp.write('\nHardening to version %s of %s standard.\n\n'
-                    % (hardVersion, hardSpec))
-
-standardFile = instSrcPy + '/' + hardSpec + '.py'
-standardFile = os.path.abspath(standardFile)
-print('The full path is: %s\n' % standardFile)
-resultsTxt_fp.write('The full path is: %s\n\n' % standardFile)
-if not exeScriptname:
-    print('Just a minute...:')
-    resultsTxt_fp.write('Just a minute...%s\n\n')
-
-# Start the time and hardening script
-timer = RepeatingTimer(1.0, progressStatus)
-# Allows program to exit if only the thread is alive
-timer.daemon = True
-
-timer.start()
-try:
-    # for progress bar, do real work here
-    standardp = subprocess.Popen(standardFile,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-except Exception:
-    # if error, print message, and exit
-    (type, value, traceback) = sys.exc_info()
-    print('Could not execute %s: %s' % (standardFile, value))
-    sys.exit(1)
-
-# get the standard output and standard error results
-(stdout, stderr) = standardp.communicate()
-if stderr:
-    print('%s: subprocess.Popen error %s' % (standardFile, stderr))
-    sys.exit(1)
-
-### Write output from subprocess python scripts to standard output
-print(stdout)
-resultsTxt_fp.write(stdout)
-timer.cancel()
-
-###---
-### Parse output to transform formatting from ANSI code to HTML tags
-###---
-# rewind to beginning of file
-resultsTxt_fp.seek(0)
-# read back all output results
-myBuffer = resultsTxt_fp.readlines()
-# rewind to beginning of file
-resultsTxt_fp.seek(0)
-# close the file
-resultsTxt_fp.close()
-
-###---
-### parse for special display characters in our output buffer, and replace
-###     special characters with HTML equivalent tags
-###---
-# boolean if special character detected
-specialCharFound = False
-# empty list to hold the converted text
-cnvBuffer = []
-
-for line in myBuffer:
-    # strip newline character
-    line.rstrip()
-
-    # if not blank line
-    if line:
-        line = line.rstrip()
-        # The ASCII special characters below represent these things:
-        #   specialChars = (bold, blink, black, red, green, yellow,
-        #                   blue, magenta, cyan, white)
-        specialChars = ('[1m', '[5m', '[30m', '[31m', '[32m', '[33m',
-                        '[34m', '[35m', '[36m', '[37m')
-
-        # check if special character detected is in our list of specialChars
-        for sChars in specialChars:
-            # if special character appears in the line of text
-            if sChars in line:
-                # set boolean to True that it was detected
-                specialCharFound = True
-                # save the special character detected
-                lastSpecialChar = sChars
-                # transform to HTML begin tag for this special character,
-                #   for example, '[1m' is bold, so HTML begin tag is <B>
-                line = beginTxtSpecialCharBlock(line, lastSpecialChar)
-                # break out of loop for this line
-                break
-
-        # if special character was detected earlier, then find where it is
-        #   reset, and convert that to HTML ending tag
-        if specialCharFound is True:
-            # [0m is ANSI reset character
-            if '[0m' in line:
-                specialChar = '[0m'
-                # transform to the HTML end tag for last special character,
-                #   for example, '[1m' is bold, so HTML end tag is </B>
-                line = endTxtSpecialCharBlock(line, specialChar,
-                                              lastSpecialChar)
-                # reset specialCharFound boolean once handled end of block
-                specialCharFound = False
-
-    # write the converted line to buffer to write to file later
-    cnvBuffer.append(line)
-
-###---
-### Built HTML web page
-###---
-# write generic text which starts standard web page
-valDate2 = str(datetime.datetime.now().strftime("%B %d, %Y"))
-webpageHeader = '''<!DOCTYPE html>
+    ###---
+    ### Built HTML web page
+    ###---
+    # write generic text which starts standard web page
+    valDate2 = str(datetime.datetime.now().strftime("%B %d, %Y"))
+    webpageHeader = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="utf-8">
@@ -1003,11 +1806,9 @@ webpageHeader = '''<!DOCTYPE html>
     <div class="main supporting" id="supporting" >
 
 ''' % (rdirbasename, hardSpecUC, valDate2)
-# write generic text which ends standard web page
-# start the buffer where body of web page content will be
-contentsHTML = webpageHeader
 
-webpageTrailer = '''
+    # write generic text which ends standard web page
+    webpageTrailer = '''
     </div>
 
 </div>
@@ -1024,188 +1825,129 @@ webpageTrailer = '''
 </html>
 '''
 
-fp = open(outputHTML, 'rb')
-for line in open(outputHTML, 'rb'):
-    contentsHTML = contentsHTML + line
-contentsHTML = contentsHTML + webpageTrailer
-
-# Commenting out section which launches browser because most of time script
-#   is executing from ssh to target system, and not launching browser from
-#   desktop.
-#
-# Write to HTML file, also attempt to open browser automatically to view
-#   it if possible.
-#rval = browseLocal(contentsHTML, resultsHTML)
-#if rval != 0:
-#    if debuglevel == 1:
-#        print('Open browser to display %s error: %s' % (resultsHTML, rval))
-
-# Write to HTML content to results file
-strToFile(contentsHTML, resultsHTML)
-
-try:
-    os.makedirs(resultsHTMLdir)
-except OSError:
-    # errno file exists, must be executing in same minute, create 2nd directory
-    resultsHTMLdir = resultsHTMLdir + '_2'
-    os.makedirs(resultsHTMLdir)
-except Exception:
-    # if error, print message, and exit
-    (type, value, traceback) = sys.exc_info()
-    print('Could not make directory: %s' % value)
-    sys.exit(1)
-
-shutil.copy(hardDir + '/payload/docs/css/hardening.css', resultsHTMLdir)
-shutil.copy(hardDir + '/payload/docs/css/bg.gif', resultsHTMLdir)
-shutil.copy(hardDir + '/payload/docs/css/bottom.gif', resultsHTMLdir)
-shutil.copy(hardDir + '/payload/docs/css/procedure.gif', resultsHTMLdir)
-shutil.copy(hardDir + '/payload/docs/css/Teradata.gif', resultsHTMLdir)
-shutil.copy(hardDir + '/payload/docs/css/T_Header.gif', resultsHTMLdir)
-
-print('Results saved to:')
-print('  text file: %s' % resultsTxt)
-print('  web page : %s' % resultsHTML)
-
-###---
-### If STIG, initialize all test status to Not Executed
-###---
-if hardSpecUC == 'STIG':
-    lineno = 0
-    tmpBuf = []
-    fp = open(stigStatusFile, 'rb')
-    statusBuf = fp.readlines()
-    fp.seek(0)
-    fp.close()
-
-    for csvline in open(stigCSVFile, 'rb'):
-        TCprocessed = False
-        lineno += 1
-        for tcStatusLine in statusBuf:
-            (tcid, fname, tcstatus) = tcStatusLine.split()
-            #print('line %s: tcStatusLine = %s\ntcstatus %s'
-            #      % (lineno, tcStatusLine, tcstatus))
-            if tcid in csvline:
-                #print('line %s: csvline = "%s"' % (lineno, csvline))
-                csvline = csvline.replace('Not Executed', tcstatus)
-                #print('line %s: replaced csvline = "%s"' % (lineno, csvline))
-                tmpBuf.append(csvline)
-                TCprocessed = True
-                break
-
-        if TCprocessed is False:
-            tmpBuf.append(csvline)
-
-if hardSpecUC == 'STIG':
-    if tmpBuf:
-        fp = open(stigCSVFile, 'w+')
-        for line in tmpBuf:
-            fp.write(line)
-        fp.seek(0)
-        fp.close()
+    # use the HTML log written by the modules, if they wrote one, else the
+    #   conversion of the standard's output
+    if int(loglevel) != 0 or os.access(outputHTML, os.F_OK) is False:
+        outputHTML = convertedHTML
+
+    # Commenting out section which launches browser because most of time script
+    #   is executing from ssh to target system, and not launching browser from
+    #   desktop.
+    #
+    # Write to HTML file, also attempt to open browser automatically to view
+    #   it if possible.
+    #rval = browseLocal(resultsHTML)
+    #if rval != 0:
+    #    if debuglevel == 1:
+    #        print('Open browser to display %s error: %s'
+    #              % (resultsHTML, rval))
+
+    # Write header, summary of the events, body, and trailer of the web page to
+    #   results file
+    rval = writeReport(resultsHTML,
+                       webpageHeader + eventsHTML(demux) + timingHTML(timings),
+                       outputHTML, webpageTrailer)
+    if rval != 0:
+        print('Could not write %s: %s' % (resultsHTML, rval))
+        sys.exit(1)
+    resultsArchive.add(resultsHTML, rbasename)
+    resultsArchive.add(resultsEvents, os.path.basename(resultsEvents))
+    if profileRun is True:
+        resultsArchive.add(profileDir, os.path.basename(profileDir))
 
-###---
-### If STIG, initialize all exception status to exception verbiage
-###---
-# Per Jim: Do not configure, define exception verbiage
-eList = ['TC_V-23826_GEN005490_SV-28762r1_rule, FIPS, \
-            "Teradata: Need exception verbiage"',
-         'TC_V-23827_GEN005495_SV-28763r1_rule, FIPS, \
-            "Teradata: Need exception verbiage"',
-         'TC_V-22457_GEN005504_SV-26750r1_rule, Listen, \
-            "Teradata: All are management interfaces; configuring all \
-interfaces gets the same result as configuring no interfaces."',
-         'TC_V-22470_GEN005521_SV-26763r1_rule, AllowGroups, \
-            "Teradata: Need exception verbiage"',
-         'TC_V-22473_GEN005524_SV-26766r1_rule, GSSAPI, \
-            "Teradata: systems do not require GSSAPIAuthentication."',
-         'TC_V-22474_GEN005525_SV-26767r1_rule, GSSAPI, \
-            "Teradata: systems do not require GSSAPIAuthentication."',
-         'TC_V-22475_GEN005526_SV-26768r1_rule, Kerberos, \
-            "Teradata systems do not require kerberos."',
-         'TC_V-22480_GEN005531_SV-26774r1_rule, PermitTunnel, \
-            "Teradata: PermitTunnel cannot be set in SLES 10 as it is \
-not a configurable option for this version of OpenSSH."',
-         'TC_V-22482_GEN005533_SV-26776r1_rule, MaxSessions, \
-            "Teradata: This would restrict pshell from proper operation. \
-This is not implemented.', ]
-if hardSpecUC == 'STIG':
-    lineno = 0
-    tmpBuf = []
-
-    for csvline in open(stigCSVFile, 'rb'):
-        TCprocessed = False
-        lineno += 1
-        for tcException in eList:
-            (tcid, param, exceptStr) = tcException.split()
-            if tcid in csvline:
-                csvline = csvline.replace('Not Executed', exceptStr)
-                #print('line %s: replaced csvline = "%s"' % (lineno, csvline))
-                tmpBuf.append(csvline)
-                TCprocessed = True
-                break
-
-        if TCprocessed is False:
-            tmpBuf.append(csvline)
-
-if hardSpecUC == 'STIG':
-    if tmpBuf:
-        fp = open(stigCSVFile, 'w+')
-        for line in tmpBuf:
-            fp.write(line)
-        fp.seek(0)
-        fp.close()
+    try:
+        os.makedirs(resultsHTMLdir)
+    except Exception:
+        # if error, print message, and exit
+        (type, value, traceback) = sys.exc_info()
+        print('Could not make directory: %s' % value)
+        sys.exit(1)
 
+    # link the style sheet and images of the web page from the asset store,
+    #   one copy of each is shared by every report directory
+    from assets import linkAssets, reportAssets
 
-if hardSpecUC == 'STIG':
-    print('\n  STIG csv file: %s' % stigCSVFile)
-    print('    Import into Excel with options set to: UTF-8, \
-separated by Tab, Text Delimiter of ";", and Merge delimiters.\n\n')
+    (ecode, rval, placed) = linkAssets(hardDir + '/payload/docs/css',
+                                       reportAssets, backupLogs + '/assets',
+                                       resultsHTMLdir)
+    if ecode != 0:
+        print('%s' % rval)
+        sys.exit(1)
+    if debuglevel == '1':
+        print('Web page assets: %s linked, %s cloned, %s copied'
+              % (placed['link'], placed['clone'], placed['copy']))
+    resultsArchive.add(resultsHTMLdir, os.path.basename(resultsHTMLdir))
+
+    print('Results saved to:')
+    print('  text file: %s' % resultsTxt)
+    print('  web page : %s' % resultsHTML)
+    print('  events   : %s' % resultsEvents)
+    if profileRun is True:
+        print('  profiles : %s' % profileDir)
+    print('  database : %s, run %s' % (resultsDBFile, runID))
+    print('    To query it, use "python3 results.py -f %s runs"'
+          % resultsDBFile)
 
-# tar up resultsHTML and directory
-TAR_PROGRAM = os.environ['TAR_PROGRAM']
-if InstallType == "LIVE":
+    ###---
+    ### If STIG, set the status of every test case in the csv file to its
+    ###     test execution status, or its exception verbiage, in one pass.
+    ###     Test cases with neither are left as Not Executed.
+    ###---
     if hardSpecUC == 'STIG':
-        cmd = 'cd %s; %s -czvf %s %s %s %s' \
-              % (backupLogs, TAR_PROGRAM, tarFileName, rdirbasename,
-                 rbasename, stigCSVFileBasename)
-    else:
-        cmd = 'cd %s; %s -czvf %s %s %s' \
-              % (backupLogs, TAR_PROGRAM, tarFileName, rdirbasename,
-                 rbasename)
-else:
+        # the modules are done writing test execution status
+        stigStatus_fp.close()
+
+        (ecode, rval, stigStatus) = loadStigStatus(stigStatusFile)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+        # test cases reported as events, by modules not writing the status file
+        for (tcid, tcstatus) in demux.testStatus.items():
+            stigStatus.setdefault(tcid, tcstatus)
+
+        # rules come from the cache saved when the csv file was first written
+        (ecode, rval, stigRules) = loadSRGRules(stigXMLOrigFile, stigCacheFile)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+
+        (ecode, rval) = writeSRGCSV(stigRules, stigCSVFile, stigStatus,
+                                    stigExceptions)
+        if ecode != 0:
+            print('%s' % rval)
+            sys.exit(1)
+        resultsArchive.add(stigCSVFile, stigCSVFileBasename)
+
     if hardSpecUC == 'STIG':
-        cmd = 'cd %s; sudo %s -czvf %s %s %s %s' \
-              % (backupLogs, TAR_PROGRAM, tarFileName, rdirbasename,
-                 rbasename, stigCSVFileBasename)
-    else:
-        cmd = 'cd %s; sudo %s -czvf %s %s %s' \
-              % (backupLogs, TAR_PROGRAM, tarFileName, rdirbasename,
-                 rbasename)
+        print('\n  STIG csv file: %s' % stigCSVFile)
+        print('    Import into Excel with options set to: UTF-8, \
+separated by Tab, Text Delimiter of ";", and Merge delimiters.\n\n')
 
-try:
-    standardp = subprocess.Popen(["bash", "-c", cmd],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-except Exception:
-    # if error, print message, and exit
-    (type, value, traceback) = sys.exc_info()
-    print('Could not execute %s: %s' % (cmd, value))
-    sys.exit(1)
-
-standardp.wait()
-
-# get the standard output and standard error results
-(stdout, stderr) = standardp.communicate()
-if stderr:
-    print('%s: subprocess.Popen error %s' % (cmd, stderr))
-    sys.exit(1)
-
-print('Results archived to:')
-print('  tar file : %s/%s' % (backupLogs, tarFileName))
-print('    To extract it, use "tar -vxzf %s"' % tarFileName)
-
-endTime = datetime.datetime.now()
-diffTime = endTime - startTime
-print('\nExecution complete. Elapsed time = %s seconds.' % diffTime.seconds)
-
-sys.exit(0)
+    # all results are in, finish the archive
+    try:
+        (tarFiles, tarBytesIn, tarBytesOut, tarSeconds) = \
+            resultsArchive.close()
+    except Exception:
+        # if error, print message, and exit
+        (type, value, traceback) = sys.exc_info()
+        print('Could not write %s/%s: %s' % (backupLogs, tarFileName, value))
+        sys.exit(1)
+
+    print('Results archived to:')
+    print('  tar file : %s/%s' % (backupLogs, tarFileName))
+    print('    To extract it, use "tar -vxzf %s"' % tarFileName)
+    print('    %s files, %.1f MB compressed to %.1f MB at %.1f MB/s'
+          % (tarFiles, tarBytesIn / 1048576.0, tarBytesOut / 1048576.0,
+             tarBytesIn / 1048576.0 / max(tarSeconds, 0.001)))
+
+    endTime = datetime.datetime.now()
+    diffTime = endTime - startTime
+    print('\nExecution complete. Elapsed time = %s seconds.'
+          % diffTime.seconds)
+
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
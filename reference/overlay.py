@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Copy on write overlay of the test root: files are read from a
+#            read only base, / or a snapshot, until they are changed, and
+#            changes go to a sparse upper directory, payload/sys.
+#            ------------------------------------------------------------------
+#            Use: (ecode, rval, overlay) = openOverlay(exeDir, '/')
+#                 fp = overlay.open('/etc/samba/smb.conf', 'a')
+#                 (ecode, rval, counts) = overlay.reset(['/root/hardening'])
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/05/12
+
+
+
+"""
+PURPOSE:    Test mode used to need a complete fake root in payload/sys, and
+            each module with -r copied the files it changed back from its
+            backups after every execution.
+
+            Now payload/sys is only the upper layer of an overlay. The
+            lower layer, the base, is read only: the real / by default, or
+            a snapshot directory as snapshot.py saves it (manifest.tsv and
+            store/), e.g. logs/initialstate copied from another host, so a
+            host can be tested without its files.
+
+            Python modules access files through an Overlay: a file is read
+            from the upper directory if it is there, else from the base. It
+            is copied up, contents, mode and mtime, before its first write,
+            chmod or chown, and only then. A file removed is hidden by a
+            whiteout. Not being root, the owner a file is given is recorded
+            in the index, upper/.overlay.tsv, and stat returns it:
+
+                kind     uid  gid  path
+                owner    0    0    /etc/samba/smb.conf
+                whiteout -    -    /etc/samba/lmhosts
+
+            Shell modules open their files by path, under $exeDir, so
+            install.py copies up the targets and the module inputs declared
+            in <standard>_modules.list before the standard executes. Those
+            already in the upper directory are not copied again.
+
+            Reset, with -r, is discarding the upper layer: every file the
+            standard changed or added is removed, compared with the base by
+            type, size, mode, mtime and owner, as snapshot.py does; files
+            copied up and left as they were, and paths to keep, such as
+            root/hardening, stay. A test run costs a stat of each file in
+            the upper directory, and a copy of each file changed, however
+            large the base is. No mount, namespace or privilege is needed.
+
+ASSUMPTION: 1) A module which changes a file and sets its size and mtime
+               back to what they were is not reset.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/05/12
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import errno
+import os
+import shutil
+import stat
+import sys
+import time
+from collections import namedtuple
+
+from snapshot import loadManifest, manifestName, storeName, storedPath
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# the state of a file of the overlay, as much of a stat as is compared
+OverlayStat = namedtuple('OverlayStat',
+                         'st_mode st_uid st_gid st_size st_mtime')
+
+# index of the upper directory, at its top, and its columns
+indexName = '.overlay.tsv'
+indexHeader = 'kind\tuid\tgid\tpath\n'
+
+# a directory a snapshot holds files of, but not itself
+impliedDirectory = OverlayStat(stat.S_IFDIR | 0o755, 0, 0, 0, 0.0)
+
+# mtimes closer than this are the same, a snapshot keeps microseconds
+mtimeResolution = 0.001
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def notFound(path):
+    ''' the error of a file which is not there '''
+    return(OSError(errno.ENOENT, os.strerror(errno.ENOENT), path))
+
+
+def parentsOf(path):
+    ''' directories path is in, / excluded, outermost first '''
+    parents = []
+    parent = os.path.dirname(path)
+    while parent not in ('/', ''):
+        parents.insert(0, parent)
+        parent = os.path.dirname(parent)
+    return(parents)
+
+
+class DirectoryBase(object):
+    ''' A directory tree, / by default, read only. '''
+
+    def __init__(self, rootDir='/'):
+        self.rootDir = rootDir.rstrip('/')
+
+    def lstat(self, path):
+        ''' OverlayStat of path, not following a symbolic link '''
+        fstat = os.lstat(self.rootDir + path)
+        return(OverlayStat(fstat.st_mode, fstat.st_uid, fstat.st_gid,
+                           fstat.st_size, fstat.st_mtime))
+
+    def listdir(self, path):
+        ''' names in directory path '''
+        return(os.listdir(self.rootDir + path or '/'))
+
+    def readlink(self, path):
+        ''' where symbolic link path points to '''
+        return(os.readlink(self.rootDir + path))
+
+    def contentsPath(self, path):
+        ''' file the contents of path are read from '''
+        return(self.rootDir + path)
+
+
+class SnapshotBase(object):
+    ''' The files of a snapshot, as takeSnapshot saved them, read only. '''
+
+    def __init__(self, snapshotDir, manifest=manifestName):
+        (ecode, rval, self.states) = loadManifest(os.path.join(snapshotDir,
+                                                               manifest))
+        if ecode != 0:
+            raise IOError(rval)
+        self.storeDir = os.path.join(snapshotDir, storeName)
+        # names in each directory, those only implied by the paths included
+        self.names = {}
+        for path in self.states:
+            for name in parentsOf(path) + [path]:
+                self.names.setdefault(os.path.dirname(name), set()).add(
+                    os.path.basename(name))
+
+    def lstat(self, path):
+        ''' OverlayStat of path, not following a symbolic link '''
+        if path in self.states:
+            (mode, uid, gid, size, mtime, digest) = self.states[path]
+            return(OverlayStat(mode, uid, gid, size, float(mtime)))
+        if path in self.names:
+            return(impliedDirectory)
+        raise notFound(path)
+
+    def listdir(self, path):
+        ''' names in directory path '''
+        if path not in self.names:
+            raise notFound(path)
+        return(sorted(self.names[path]))
+
+    def readlink(self, path):
+        ''' where symbolic link path points to '''
+        fp = open(self.contentsPath(path), 'rb')
+        target = fp.read()
+        fp.close()
+        if not isinstance(target, str):
+            target = target.decode('utf-8', 'surrogateescape')
+        return(target)
+
+    def contentsPath(self, path):
+        ''' file the contents of path are read from '''
+        if path not in self.states:
+            raise notFound(path)
+        digest = self.states[path][5]
+        if digest == '?':
+            # could not be read when the snapshot was taken
+            raise IOError(errno.EACCES, os.strerror(errno.EACCES), path)
+        return(storedPath(self.storeDir, digest))
+
+
+class Overlay(object):
+    ''' The files of base, a DirectoryBase or SnapshotBase, with changes  '''
+    ''' copied on write to upperDir. Paths are absolute, as in the root   '''
+    ''' the overlay stands for.                                           '''
+
+    def __init__(self, upperDir, base):
+        self.upperDir = upperDir.rstrip('/')
+        self.base = base
+        self.indexFile = os.path.join(self.upperDir, indexName)
+        # {path: (uid, gid)} given to files, and paths removed from the base
+        self.owners = {}
+        self.whiteouts = set()
+        # while materializing, the index is saved once, at the end
+        self.batching = False
+        if os.path.isfile(self.indexFile):
+            fp = open(self.indexFile, 'r')
+            # skip the column names
+            fp.readline()
+            for line in fp:
+                (kind, uid, gid, path) = line.rstrip('\n').split('\t', 3)
+                if kind == 'owner':
+                    self.owners[path] = (int(uid), int(gid))
+                else:
+                    self.whiteouts.add(path)
+            fp.close()
+
+    def saveIndex(self):
+        ''' write the owners and whiteouts to the index '''
+        if not os.path.isdir(self.upperDir):
+            os.makedirs(self.upperDir, 0o755)
+        tmpFile = self.indexFile + '.%d' % os.getpid()
+        fp = open(tmpFile, 'w')
+        fp.write(indexHeader)
+        for path in sorted(self.owners):
+            fp.write('owner\t%s\t%s\t%s\n' % (self.owners[path] + (path,)))
+        for path in sorted(self.whiteouts):
+            fp.write('whiteout\t-\t-\t%s\n' % path)
+        fp.close()
+        os.rename(tmpFile, self.indexFile)
+
+    def upperPath(self, path):
+        ''' where path is in the upper directory '''
+        return(self.upperDir + path)
+
+    def inUpper(self, path):
+        ''' True if path was copied up, or created '''
+        return(os.path.lexists(self.upperPath(path)))
+
+    def hidden(self, path):
+        ''' True if path, or a directory it is in, was removed '''
+        if not self.whiteouts:
+            return(False)
+        return(bool([parent for parent in parentsOf(path) + [path]
+                     if parent in self.whiteouts]))
+
+    def lstat(self, path):
+        ''' OverlayStat of path, not following a symbolic link '''
+        if self.inUpper(path):
+            fstat = os.lstat(self.upperPath(path))
+            (uid, gid) = self.owners.get(path, (fstat.st_uid, fstat.st_gid))
+            return(OverlayStat(fstat.st_mode, uid, gid, fstat.st_size,
+                               fstat.st_mtime))
+        if self.hidden(path):
+            raise notFound(path)
+        return(self.base.lstat(path))
+
+    def exists(self, path):
+        ''' True if path is in the overlay '''
+        try:
+            self.lstat(path)
+        except (OSError, IOError):
+            return(False)
+        return(True)
+
+    def isdir(self, path):
+        ''' True if path is a directory of the overlay '''
+        try:
+            return(stat.S_ISDIR(self.lstat(path).st_mode))
+        except (OSError, IOError):
+            return(False)
+
+    def listdir(self, path):
+        ''' names in directory path, of the upper directory and the base '''
+        names = set()
+        if self.inUpper(path):
+            names.update(os.listdir(self.upperPath(path)))
+            names.discard(indexName)
+        if not self.hidden(path):
+            try:
+                names.update(self.base.listdir(path))
+            except (OSError, IOError):
+                if not names:
+                    raise
+        return(sorted([name for name in names
+                       if os.path.join(path, name) not in self.whiteouts]))
+
+    def readlink(self, path):
+        ''' where symbolic link path points to '''
+        if self.inUpper(path):
+            return(os.readlink(self.upperPath(path)))
+        if self.hidden(path):
+            raise notFound(path)
+        return(self.base.readlink(path))
+
+    def copyUp(self, path, contents=True):
+        ''' Copy path from the base to the upper directory, unless it is   '''
+        ''' there, with its mode, mtime and, in the index, owner; without  '''
+        ''' contents if they are about to be replaced. The directories it  '''
+        ''' is in are made, like those of the base.                        '''
+        if self.inUpper(path):
+            return
+        if not os.path.isdir(self.upperDir):
+            os.makedirs(self.upperDir, 0o755)
+        for parent in parentsOf(path):
+            if not self.inUpper(parent):
+                self.copyUpDirectory(parent)
+        if self.hidden(path) or not self.exists(path):
+            # a new file, created where it is opened
+            return
+
+        bstat = self.base.lstat(path)
+        upperPath = self.upperPath(path)
+        if stat.S_ISDIR(bstat.st_mode):
+            self.copyUpDirectory(path)
+            return
+        if stat.S_ISLNK(bstat.st_mode):
+            # chmod and utime would change the file it points to
+            os.symlink(self.base.readlink(path), upperPath)
+            self.keepOwner(path, bstat)
+            return
+        if contents:
+            shutil.copyfile(self.base.contentsPath(path), upperPath)
+        else:
+            open(upperPath, 'wb').close()
+        os.chmod(upperPath, stat.S_IMODE(bstat.st_mode))
+        os.utime(upperPath, (bstat.st_mtime, bstat.st_mtime))
+        self.keepOwner(path, bstat)
+
+    def copyUpDirectory(self, path):
+        ''' make directory path in the upper directory, as in the base '''
+        try:
+            bstat = self.lstat(path)
+        except (OSError, IOError):
+            bstat = impliedDirectory
+        # we must be able to add to it, whatever its mode in the base
+        os.mkdir(self.upperPath(path), stat.S_IMODE(bstat.st_mode) | 0o700)
+        self.keepOwner(path, bstat)
+
+    def keepOwner(self, path, bstat):
+        ''' record the owner of path in the base, if we cannot give it '''
+        if (bstat.st_uid, bstat.st_gid) != (os.geteuid(), os.getegid()):
+            self.owners[path] = (bstat.st_uid, bstat.st_gid)
+            if not self.batching:
+                self.saveIndex()
+
+    def open(self, path, mode='r'):
+        ''' open path, copying it up first if mode writes to it '''
+        if [flag for flag in 'wa+' if flag in mode]:
+            self.copyUp(path, 'w' not in mode)
+            if path in self.whiteouts:
+                self.whiteouts.discard(path)
+                self.saveIndex()
+            return(open(self.upperPath(path), mode))
+        if self.inUpper(path):
+            return(open(self.upperPath(path), mode))
+        if self.hidden(path):
+            raise notFound(path)
+        return(open(self.base.contentsPath(path), mode))
+
+    def mkdir(self, path, mode=0o777):
+        ''' make directory path '''
+        if self.exists(path):
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        self.copyUp(path)
+        os.mkdir(self.upperPath(path), mode)
+        if path in self.whiteouts:
+            self.whiteouts.discard(path)
+            self.saveIndex()
+
+    def chmod(self, path, mode):
+        ''' change the mode of path '''
+        self.copyUp(path)
+        os.chmod(self.upperPath(path), mode)
+
+    def chown(self, path, uid, gid):
+        ''' change the owner of path, in the index unless we are root '''
+        self.copyUp(path)
+        if os.geteuid() == 0:
+            os.lchown(self.upperPath(path), uid, gid)
+            self.owners.pop(path, None)
+        else:
+            fstat = self.lstat(path)
+            self.owners[path] = (fstat.st_uid if uid == -1 else uid,
+                                 fstat.st_gid if gid == -1 else gid)
+        self.saveIndex()
+
+    def remove(self, path):
+        ''' remove file path, hiding it if the base has it '''
+        if not self.exists(path):
+            raise notFound(path)
+        if self.inUpper(path):
+            os.remove(self.upperPath(path))
+            self.owners.pop(path, None)
+        try:
+            self.base.lstat(path)
+            self.whiteouts.add(path)
+        except (OSError, IOError):
+            pass
+        self.saveIndex()
+
+    def materialize(self, targets):
+        ''' Copy up each of targets, and everything below target          '''
+        ''' directories, which is not in the upper directory yet, so       '''
+        ''' programs find them under it. Returns (0, '', counts) with      '''
+        ''' counts {'files', 'copied', 'unreadable', 'seconds'}.           '''
+        startTime = time.time()
+        counts = {'files': 0, 'copied': 0, 'unreadable': 0}
+        pending = [target for target in targets if self.exists(target)]
+        self.batching = True
+        try:
+            self.copyUpAll(pending, counts)
+        finally:
+            self.batching = False
+            if self.owners:
+                self.saveIndex()
+        counts['seconds'] = time.time() - startTime
+        return(0, '', counts)
+
+    def copyUpAll(self, pending, counts):
+        ''' copy up pending paths, and everything below them, for         '''
+        ''' materialize                                                    '''
+        while pending:
+            path = pending.pop()
+            counts['files'] += 1
+            if not self.inUpper(path):
+                try:
+                    self.copyUp(path)
+                    counts['copied'] += 1
+                except (OSError, IOError):
+                    counts['unreadable'] += 1
+                    continue
+            if self.isdir(path):
+                try:
+                    names = self.listdir(path)
+                except (OSError, IOError):
+                    counts['unreadable'] += 1
+                    continue
+                pending.extend([os.path.join(path, name) for name in names])
+
+    def pristine(self, path, fstat):
+        ''' True if path, with lstat fstat in the upper directory, is as   '''
+        ''' the base has it                                                '''
+        if self.hidden(path):
+            return(False)
+        try:
+            bstat = self.base.lstat(path)
+        except (OSError, IOError):
+            return(False)
+        owner = self.owners.get(path, (fstat.st_uid, fstat.st_gid))
+        if owner != (bstat.st_uid, bstat.st_gid):
+            return(False)
+        if stat.S_ISDIR(fstat.st_mode):
+            # copied up writable by us, see copyUpDirectory
+            return(stat.S_ISDIR(bstat.st_mode) and
+                   fstat.st_mode | 0o700 == bstat.st_mode | 0o700)
+        if fstat.st_mode != bstat.st_mode:
+            return(False)
+        if stat.S_ISLNK(fstat.st_mode):
+            return(os.readlink(self.upperPath(path)) ==
+                   self.base.readlink(path))
+        return(fstat.st_size == bstat.st_size and
+               abs(fstat.st_mtime - bstat.st_mtime) < mtimeResolution)
+
+    def reset(self, keep=()):
+        ''' Discard every change in the upper directory: remove what the   '''
+        ''' standard changed or added, and the whiteouts; keep files       '''
+        ''' copied up as they are, and keep, paths and everything below    '''
+        ''' them. Returns (0, '', counts) with counts {'files', 'removed',  '''
+        ''' 'seconds'}, else (1, error message, counts so far).            '''
+        startTime = time.time()
+        counts = {'files': 0, 'removed': 0, 'seconds': 0.0}
+        keep = [path.rstrip('/') for path in keep]
+        try:
+            for (dirPath, dirNames, fileNames) in os.walk(self.upperDir,
+                                                          topdown=False):
+                directory = dirPath[len(self.upperDir):] or '/'
+                for name in dirNames + fileNames:
+                    path = os.path.join(directory, name)
+                    fullPath = self.upperPath(path)
+                    if path == '/' + indexName or \
+                            [kept for kept in keep
+                             if path == kept or path.startswith(kept + '/')
+                             or kept.startswith(path + '/')]:
+                        continue
+                    counts['files'] += 1
+                    fstat = os.lstat(fullPath)
+                    if stat.S_ISDIR(fstat.st_mode):
+                        # a directory goes once everything in it went
+                        if not os.listdir(fullPath) and \
+                                not self.pristine(path, fstat):
+                            os.rmdir(fullPath)
+                            self.owners.pop(path, None)
+                            counts['removed'] += 1
+                    elif not self.pristine(path, fstat):
+                        os.remove(fullPath)
+                        self.owners.pop(path, None)
+                        counts['removed'] += 1
+            self.whiteouts = set()
+            self.saveIndex()
+        except Exception:
+            # if error, return error message
+            (type, value, traceback) = sys.exc_info()
+            counts['seconds'] = time.time() - startTime
+            return(1, 'Could not reset %s: %s' % (self.upperDir, value),
+                   counts)
+        counts['seconds'] = time.time() - startTime
+        return(0, '', counts)
+
+
+def openOverlay(upperDir, baseDir='/'):
+    ''' Return (0, '', Overlay) of upperDir over baseDir, a snapshot       '''
+    ''' directory if it has a manifest, else a directory tree. Else (1,    '''
+    ''' error message, None).                                              '''
+    try:
+        if os.path.isfile(os.path.join(baseDir, manifestName)):
+            base = SnapshotBase(baseDir)
+        elif os.path.isdir(baseDir):
+            base = DirectoryBase(baseDir)
+        else:
+            return(1, 'Test base %s is not a directory' % baseDir, None)
+        overlay = Overlay(upperDir, base)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open overlay %s over %s: %s'
+               % (upperDir, baseDir, value), None)
+    # return 0 for success, no error message, and the overlay
+    return(0, '', overlay)
+
+
+def environmentOverlay():
+    ''' Return openOverlay of $exeDir over $overlayBase, as install.py   '''
+    ''' sets them in test mode, for a Python module; (0, '', None) when   '''
+    ''' executing LIVE.                                                   '''
+    exeDir = os.environ.get('exeDir', '')
+    if not exeDir:
+        return(0, '', None)
+    return(openOverlay(exeDir, os.environ.get('overlayBase', '/')))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Show the progress of a hardening run, from the events of its
+#            modules: modules completed out of the total, test cases, rate,
+#            and estimated time left.
+#            ------------------------------------------------------------------
+#            Use: progress = Progress(total=len(modules))
+#                 demux = EventDemux(eventsFile,
+#                                    [progress.wrap(teeLine(logFp))],
+#                                    [progress.event])
+#                 ...
+#                 progress.finish()
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/04/07
+
+
+
+"""
+PURPOSE:    On a terminal nothing is drawn on a timer. The progress line
+            only changes when a module starts or ends, or a test case is
+            reported (see events.py), or when the scheduler of -j starts or
+            completes a module:
+
+              [ 5/12 modules  41% ] 37 tests, 2 failed | 0.4 modules/s |
+                  ETA 0:00:17 | harden_sshd.py
+
+            On a terminal, the line is redrawn in place each time the state
+            changes. It is cleared before a line of output is written and
+            drawn again after it, so output and progress never share a
+            line.
+
+            When standard output is not a terminal, e.g. python3 install.py
+            | tee, or a host of install.py -i, the progress line is printed
+            as an ordinary line instead, at most once every summarySeconds
+            as events arrive, and once more when the run completes. A timer
+            thread prints it too when no line was printed for
+            summarySeconds, so a module which runs for long without any
+            event or output still shows the run is alive.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/04/07
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import fcntl
+import struct
+import sys
+import termios
+import threading
+import time
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# least number of seconds between two progress lines when not on a terminal
+summarySeconds = 30
+
+# move to the start of the line and erase it
+clearLine = '\r\033[K'
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def terminalWidth(stream):
+    ''' number of columns of the terminal stream writes to, 80 if unknown '''
+    try:
+        (rows, columns) = struct.unpack('hh', fcntl.ioctl(
+            stream.fileno(), termios.TIOCGWINSZ, struct.pack('hh', 0, 0)))
+    except Exception:
+        return(80)
+    return(columns or 80)
+
+
+def formatSeconds(seconds):
+    ''' seconds as H:MM:SS '''
+    seconds = int(seconds)
+    return('%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                             seconds % 60))
+
+
+class Progress(object):
+    ''' Progress of a run of total modules, None if not known. With        '''
+    ''' moduleEvents False, modules are only counted from moduleState(),   '''
+    ''' not from module events, so they are not counted twice.            '''
+
+    def __init__(self, total=None, moduleEvents=True, stream=sys.stdout):
+        self.total = total
+        self.moduleEvents = moduleEvents
+        self.stream = stream
+        self.isTTY = stream.isatty()
+        self.startTime = time.time()
+
+        self.running = []
+        self.done = {}
+        self.tests = 0
+        self.failed = 0
+
+        # a progress line is on the screen, on a terminal
+        self.drawn = False
+        # the state changed since the last progress line, when not on one
+        self.changed = False
+        self.lastSummary = self.startTime
+
+        # when not on a terminal, progress lines are also printed by a timer
+        #   thread, and one line is written at a time
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.timer = None
+        if not self.isTTY:
+            self.timer = threading.Thread(target=self.repeat)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def event(self, event):
+        ''' event handler, as EventDemux of events.py calls it '''
+        kind = event['event']
+        if kind == 'test':
+            self.tests += 1
+            if event.get('status') == 'FAIL':
+                self.failed += 1
+        elif kind == 'module-start' and self.moduleEvents:
+            self.start(event.get('module', ''))
+        elif kind == 'module-end' and self.moduleEvents:
+            self.end(event.get('module', ''))
+        else:
+            return
+        self.update()
+
+    def moduleState(self, module, state):
+        ''' state handler, as runModules of scheduler.py calls it '''
+        if state == 'running':
+            self.start(module)
+        else:
+            self.end(module)
+        self.update()
+
+    def start(self, module):
+        if module not in self.running:
+            self.running.append(module)
+
+    def end(self, module):
+        if module in self.running:
+            self.running.remove(module)
+        self.done[module] = True
+
+    def line(self):
+        ''' the progress line for the current state '''
+        elapsed = max(time.time() - self.startTime, 0.001)
+        done = len(self.done)
+        rate = done / elapsed
+
+        if self.total:
+            fields = ['[ %s/%s modules %3d%% ]'
+                      % (done, self.total, 100 * done // self.total)]
+        else:
+            fields = ['[ %s modules ]' % done]
+        fields[0] += ' %s tests, %s failed' % (self.tests, self.failed)
+        fields.append('%.1f modules/s' % rate)
+        if self.total and done and done < self.total:
+            fields.append('ETA %s' % formatSeconds((self.total - done) / rate))
+        else:
+            fields.append('elapsed %s' % formatSeconds(elapsed))
+        if self.running:
+            fields.append(', '.join(self.running))
+        return(' | '.join(fields))
+
+    def draw(self):
+        ''' draw the progress line over the current terminal line, cut to  '''
+        ''' the terminal width so it never wraps                           '''
+        self.stream.write(clearLine +
+                          self.line()[:terminalWidth(self.stream) - 1])
+
+    def update(self):
+        ''' show the new state: redraw it on a terminal, else print it if  '''
+        ''' the last progress line is old enough                           '''
+        if self.isTTY:
+            self.draw()
+            self.stream.flush()
+            self.drawn = True
+            return
+
+        self.changed = True
+        if time.time() - self.lastSummary >= summarySeconds:
+            self.summary()
+
+    def repeat(self):
+        ''' timer thread: print the progress line whenever none was printed '''
+        ''' for summarySeconds, until finish()                              '''
+        while True:
+            self.finished.wait(max(self.lastSummary + summarySeconds -
+                                   time.time(), 0.1))
+            if self.finished.isSet():
+                return
+            if time.time() - self.lastSummary >= summarySeconds:
+                self.summary()
+
+    def summary(self):
+        ''' print the progress line as an ordinary line '''
+        self.lock.acquire()
+        try:
+            self.stream.write(self.line() + '\n')
+            self.stream.flush()
+            self.lastSummary = time.time()
+            self.changed = False
+        finally:
+            self.lock.release()
+
+    def wrap(self, lineHandler):
+        ''' Return lineHandler wrapped so the progress line is cleared     '''
+        ''' before, and drawn again after, each line it writes.            '''
+        def handler(streamName, line):
+            self.lock.acquire()
+            try:
+                if self.drawn:
+                    self.stream.write(clearLine)
+                    self.stream.flush()
+                lineHandler(streamName, line)
+                if self.drawn:
+                    self.draw()
+                    self.stream.flush()
+            finally:
+                self.lock.release()
+        return(handler)
+
+    def finish(self):
+        ''' leave the final progress line on its own line '''
+        if self.timer is not None:
+            self.finished.set()
+            self.timer.join()
+            self.timer = None
+        if self.drawn:
+            self.draw()
+            self.stream.write('\n')
+            self.stream.flush()
+            self.drawn = False
+        elif self.changed:
+            self.summary()
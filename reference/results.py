@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Keep the history of every hardening run, its output and the
+#            status of each test case, in one indexed database, and answer
+#            questions about it from the command line.
+#            ------------------------------------------------------------------
+#            Use: python3 results.py runs -H node01
+#                 python3 results.py first \
+#                     TC_V-22457_GEN005504_SV-26750r1_rule -H node01
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/03/24
+
+
+
+"""
+PURPOSE:    install.py records each run to hardening/logs/results.db, a
+            sqlite database, while the standard executes:
+
+                runs      one row per run: host, standard, version, mode,
+                          start and finish time, exit status, text log
+                results   status of each test case, as the modules write it
+                          to the STIG status file or emit it as an event (see
+                          events.py), by run
+                output    every line the standard printed, by run
+                modules   exit status of each module, with -j
+                timings   wall clock and CPU seconds, commands executed, and
+                          bytes read and written, of each module and
+                          external command, by run
+
+            results is indexed by test case, host, standard and run, so
+            questions such as "when did this rule first fail on node01"
+            are answered without reading any log file:
+
+                python3 results.py runs -H node01
+                python3 results.py history TC_V-22457_GEN005504_SV-26750r1_rule
+                python3 results.py first TC_V-22457_GEN005504_SV-26750r1_rule \
+                    -H node01 --status FAIL
+                python3 results.py summary
+                python3 results.py output 12
+
+            The database is in WAL mode, so queries can be made while a run
+            is writing to it.
+
+ASSUMPTION: 1) Modules write test case status lines of "tcid filename
+                status" to the file named by stigStatusFile; the first
+                status of a test case in a run is the one kept.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/03/24
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# tables and indexes, created on first use
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run         INTEGER PRIMARY KEY,
+    host        TEXT NOT NULL,
+    standard    TEXT NOT NULL,
+    version     TEXT,
+    mode        TEXT,
+    started     TEXT NOT NULL,
+    finished    TEXT,
+    exit        INTEGER,
+    log         TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_host ON runs (host, standard, run);
+
+CREATE TABLE IF NOT EXISTS results (
+    run         INTEGER NOT NULL,
+    host        TEXT NOT NULL,
+    standard    TEXT NOT NULL,
+    tcid        TEXT NOT NULL,
+    module      TEXT,
+    status      TEXT NOT NULL,
+    PRIMARY KEY (run, tcid)
+);
+CREATE INDEX IF NOT EXISTS results_tcid ON results (tcid, host, standard, run);
+CREATE INDEX IF NOT EXISTS results_host ON results (host, standard, run);
+
+CREATE TABLE IF NOT EXISTS output (
+    run         INTEGER NOT NULL,
+    line        INTEGER NOT NULL,
+    stream      TEXT NOT NULL,
+    text        TEXT NOT NULL,
+    PRIMARY KEY (run, line)
+);
+
+CREATE TABLE IF NOT EXISTS modules (
+    run         INTEGER NOT NULL,
+    module      TEXT NOT NULL,
+    exit        INTEGER,
+    stderr      INTEGER,
+    PRIMARY KEY (run, module)
+);
+
+CREATE TABLE IF NOT EXISTS timings (
+    run         INTEGER NOT NULL,
+    kind        TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    duration    REAL,
+    cpu         REAL,
+    children    INTEGER,
+    read_bytes  INTEGER,
+    write_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS timings_name ON timings (name, run);
+'''
+
+# results database of a LIVE run by root
+defaultDBFile = '~/hardening/logs/results.db'
+
+# output lines held before they are written, and the longest they are held
+outputBatch = 500
+outputSeconds = 1.0
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def toText(value):
+    ''' text of value, decoding bytes as utf-8 '''
+    if isinstance(value, bytes):
+        return(value.decode('utf-8', 'replace'))
+    return(value)
+
+
+def now():
+    ''' current local time, as stored in the database '''
+    return(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+class ResultsDB(object):
+    ''' Results database at dbFile. One run is recorded at a time, from    '''
+    ''' startRun() to finishRun().                                         '''
+
+    def __init__(self, dbFile):
+        self.dbFile = dbFile
+        # wait for another run writing to the database instead of failing
+        self.db = sqlite3.connect(dbFile, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(schema)
+        self.db.commit()
+
+        self.run = None
+        self.host = ''
+        self.standard = ''
+        self.lines = 0
+        self.pending = []
+        self.lastFlush = time.time()
+        self.statusFp = None
+        self.statusPartial = ''
+
+    def startRun(self, host, standard, version, mode, logFile):
+        ''' record the start of a run, returns its run ID '''
+        cursor = self.db.execute(
+            'INSERT INTO runs (host, standard, version, mode, started, log) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (toText(host), standard, version, mode, now(), logFile))
+        self.db.commit()
+        self.run = cursor.lastrowid
+        self.host = toText(host)
+        self.standard = standard
+        return(self.run)
+
+    def watchStatus(self, statusFile):
+        ''' record test case status lines as they are appended to          '''
+        ''' statusFile                                                     '''
+        self.statusFp = open(statusFile, 'r')
+
+    def readStatus(self):
+        ''' record every complete status line written since the last call '''
+        if self.statusFp is None:
+            return
+        data = self.statusFp.read()
+        if not data:
+            return
+        lines = (self.statusPartial + data).split('\n')
+        # last line is still being written, keep it for the next call
+        self.statusPartial = lines.pop()
+        rows = []
+        for line in lines:
+            fields = line.split()
+            # skip blank or malformed lines
+            if len(fields) != 3:
+                continue
+            (tcid, module, status) = [toText(field) for field in fields]
+            rows.append((self.run, self.host, self.standard, tcid, module,
+                         status))
+        # first status of a test case wins, as in the STIG csv file
+        self.db.executemany(
+            'INSERT OR IGNORE INTO results '
+            '(run, host, standard, tcid, module, status) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def handler(self, streamName, line):
+        ''' line handler, as streamProcess of install.py calls it: record  '''
+        ''' the line, writing lines and status in batches                  '''
+        self.lines += 1
+        self.pending.append((self.run, self.lines, streamName,
+                             toText(line.rstrip('\n'))))
+        if len(self.pending) >= outputBatch or \
+                time.time() - self.lastFlush >= outputSeconds:
+            self.flush()
+
+    def flush(self):
+        ''' write pending output lines and new status lines, and commit '''
+        self.db.executemany(
+            'INSERT INTO output (run, line, stream, text) VALUES (?, ?, ?, ?)',
+            self.pending)
+        self.pending = []
+        self.readStatus()
+        self.db.commit()
+        self.lastFlush = time.time()
+
+    def event(self, event):
+        ''' event handler, as EventDemux of events.py calls it: record the '''
+        ''' status of test cases reported as events                        '''
+        if event['event'] != 'test' or 'tcid' not in event:
+            return
+        self.db.execute(
+            'INSERT OR IGNORE INTO results '
+            '(run, host, standard, tcid, module, status) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.run, self.host, self.standard, event['tcid'],
+             event.get('module', ''), event.get('status', '')))
+
+    def recordModules(self, moduleResults):
+        ''' record [(module, exit status, stderr lines, timing)] of        '''
+        ''' runModules                                                     '''
+        self.db.executemany(
+            'INSERT OR REPLACE INTO modules (run, module, exit, stderr) '
+            'VALUES (?, ?, ?, ?)',
+            [(self.run, module, returncode, stderrLines)
+             for (module, returncode, stderrLines, moduleTiming)
+             in moduleResults])
+        self.db.commit()
+
+    def recordTimings(self, timings):
+        ''' record [(kind, name, timing)], timing as in a module-end event '''
+        ''' of events.py                                                   '''
+        self.db.executemany(
+            'INSERT INTO timings (run, kind, name, duration, cpu, children, '
+            'read_bytes, write_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(self.run, kind, toText(name), entry.get('duration'),
+              entry.get('cpu'), entry.get('children'),
+              entry.get('readBytes'), entry.get('writeBytes'))
+             for (kind, name, entry) in timings])
+        self.db.commit()
+
+    def finishRun(self, exitStatus):
+        ''' record what is left of the run, and its end '''
+        self.flush()
+        self.db.execute('UPDATE runs SET finished = ?, exit = ? WHERE run = ?',
+                        (now(), exitStatus, self.run))
+        self.db.commit()
+        if self.statusFp is not None:
+            self.statusFp.close()
+            self.statusFp = None
+
+    def close(self):
+        self.db.close()
+
+
+def printRows(cursor):
+    ''' print the rows of cursor, tab separated, under a header line '''
+    print('\t'.join([column[0] for column in cursor.description]))
+    for row in cursor:
+        print('\t'.join(['%s' % toText(value) for value in row]))
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # only the command line needs argparse, install.py imports this module
+    #   for ResultsDB alone
+    import argparse
+
+    commands = '''commands:
+  runs              list runs, newest first
+  history TCID      status of test case TCID in every run, newest first
+  first TCID        first run in which test case TCID had status --status
+  summary [RUN]     number of test cases by status, of RUN, else of the
+                    latest run of each host and standard
+  timings RUN       timing of the modules and commands of run RUN, slowest
+                    first
+  output RUN        output of run RUN'''
+    parser = argparse.ArgumentParser(
+        epilog=commands, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", help="what to print, see below.")
+    parser.add_argument("argument", nargs='?',
+                        help="test case or run of the command.")
+    parser.add_argument("-f", "--file", dest="DBFILE",
+                        default=os.path.expanduser(defaultDBFile),
+                        help="results database, default %(default)s.")
+    parser.add_argument("-H", "--host", dest="HOST",
+                        help="only runs of host HOST.")
+    parser.add_argument("-s", "--standard", dest="STANDARD",
+                        help="only runs of standard STANDARD, e.g. STIG.")
+    parser.add_argument("-n", "--limit", dest="LIMIT", type=int, default=-1,
+                        help="print at most LIMIT rows.")
+    parser.add_argument("--status", dest="STATUS", default='FAIL',
+                        help="status looked for by first, default \
+                        %(default)s.")
+    options = parser.parse_args()
+
+    command = options.command
+    args = [command] + [arg for arg in [options.argument] if arg is not None]
+    needsArgument = ('history', 'first', 'output', 'timings')
+    if command in needsArgument and len(args) != 2:
+        parser.error('%s takes one argument' % command)
+
+    if os.path.isfile(options.DBFILE) is False:
+        print('%s: no results database at %s' % (sys.argv[0], options.DBFILE))
+        sys.exit(1)
+    db = sqlite3.connect(options.DBFILE, timeout=60)
+
+    # host and standard filters, on the runs table as r
+    where = []
+    params = []
+    if options.HOST:
+        where.append('r.host = ?')
+        params.append(options.HOST)
+    if options.STANDARD:
+        where.append('r.standard = ?')
+        params.append(options.STANDARD.upper())
+
+    if command == 'runs':
+        sql = 'SELECT r.run, r.host, r.standard, r.version, r.mode, ' \
+              'r.started, r.finished, r.exit FROM runs r'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY r.run DESC LIMIT ?'
+    elif command in ('history', 'first'):
+        where.insert(0, 't.tcid = ?')
+        params.insert(0, args[1])
+        if command == 'first':
+            where.append('t.status = ?')
+            params.append(options.STATUS)
+        sql = 'SELECT t.run, r.host, r.standard, r.started, t.module, ' \
+              't.status FROM results t JOIN runs r ON r.run = t.run ' \
+              'WHERE ' + ' AND '.join(where)
+        if command == 'first':
+            sql += ' ORDER BY t.run LIMIT 1'
+        else:
+            sql += ' ORDER BY t.run DESC LIMIT ?'
+    elif command == 'summary':
+        if len(args) > 1:
+            where = ['r.run = ?']
+            params = [args[1]]
+        else:
+            # latest run of each host and standard
+            where.append('r.run IN (SELECT max(run) FROM runs '
+                         'GROUP BY host, standard)')
+        sql = 'SELECT r.run, r.host, r.standard, r.started, t.status, ' \
+              'count(*) AS tests FROM results t ' \
+              'JOIN runs r ON r.run = t.run WHERE ' + ' AND '.join(where) + \
+              ' GROUP BY r.run, t.status ' \
+              'ORDER BY r.host, r.standard, t.status LIMIT ?'
+    elif command == 'timings':
+        sql = 'SELECT kind, name, duration, cpu, children, read_bytes, ' \
+              'write_bytes FROM timings WHERE run = ? ' \
+              'ORDER BY duration DESC LIMIT ?'
+        params = [args[1]]
+    elif command == 'output':
+        sql = 'SELECT text FROM output WHERE run = ? ORDER BY line LIMIT ?'
+        params = [args[1]]
+    else:
+        parser.error('unknown command %s' % command)
+
+    if command != 'first':
+        params.append(options.LIMIT)
+    cursor = db.execute(sql, params)
+    if command == 'output':
+        for (text,) in cursor:
+            print(toText(text))
+    else:
+        printRows(cursor)
+    db.close()
+    sys.exit(0)
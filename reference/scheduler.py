@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Execute the modules of a hardening standard in parallel, in the
+#            order allowed by their declared dependencies.
+#            ------------------------------------------------------------------
+#            Use: python3 install.py -s tdsh -j 4
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/02/24
+
+
+
+"""
+PURPOSE:    Most modules of a standard change files no other module touches
+            (sshd_config, PAM, login.defs, sysctl, smb.conf), so there is no
+            need to execute them one after the other. The modules of each
+            standard, and the modules each one depends on, are declared in
+            payload/var/lists/<standard>_modules.list, one module per line:
+
+                # module            depends on / inputs
+                disable_rootssh.py  /etc/ssh/sshd_config
+                harden_sshd.py      disable_rootssh.py /etc/ssh
+                logindefs.py        /etc/login.defs
+                pam_policy.py       logindefs.py /etc/pam.d
+
+            A path, anything starting with /, is an input of the module: a
+            file or directory it checks and changes. With --check-drift,
+            a module whose inputs all kept their state since the last run
+            is not executed (see snapshot.py), unless a module it depends
+            on is.
+
+            Every module is executed on its own, by executing the standard
+            with exeScriptname set to it, exactly as install.py -x does. Up
+            to N modules are executed at the same time, and a module is only
+            started once all the modules it depends on completed without
+            error.
+
+            Each module's wall clock and CPU time, and the bytes it read and
+            wrote to disk, are measured from its process. With a profile
+            directory, each module is executed under cProfile, its profile
+            written to <profileDir>/<module>.prof.
+
+            The output of each module is captured to its own file and passed
+            on once all the modules before it in report order are done, so
+            the report reads the same whatever order the modules completed
+            in. Report order is the declared order, moved only as much as
+            needed to put every module after the modules it depends on.
+
+ASSUMPTION: 1) Modules that write to the same file must declare a
+                dependency between them. The STIG status file is the
+                exception: each module only appends whole lines to it.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/02/24
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Queue was renamed to queue in Python 3
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# size of the blocks counted by getrusage() for block I/O
+rusageBlockSize = 512
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def readModuleList(listFile):
+    ''' Read the module declaration listFile. Returns (0, '', [(module,    '''
+    ''' [dependencies], [inputs])]) in declared order, else (1, error      '''
+    ''' message, []).                                                      '''
+    modules = []
+
+    try:
+        fp = open(listFile, 'r')
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not open module list %s: %s' % (listFile, value), [])
+
+    for line in fp:
+        # skip comments and blank lines
+        line = line.split('#')[0].split()
+        if not line:
+            continue
+        modules.append((line[0],
+                        [field for field in line[1:]
+                         if not field.startswith('/')],
+                        [field for field in line[1:]
+                         if field.startswith('/')]))
+    fp.close()
+
+    # return 0 for success, no error message, and the modules
+    return(0, '', modules)
+
+
+def loadModuleList(listFile):
+    ''' Read the module dependency declaration listFile. Returns           '''
+    ''' (0, '', [(module, [dependencies])]) in declared order, else        '''
+    ''' (1, error message, []).                                            '''
+    (ecode, rval, modules) = readModuleList(listFile)
+    return(ecode, rval, [(module, dependencies)
+                         for (module, dependencies, inputs) in modules])
+
+
+def loadModuleInputs(listFile):
+    ''' Read the inputs declared in listFile. Returns (0, '', {module:     '''
+    ''' [inputs]}), else (1, error message, {}).                           '''
+    (ecode, rval, modules) = readModuleList(listFile)
+    return(ecode, rval, dict([(module, inputs)
+                              for (module, dependencies, inputs)
+                              in modules]))
+
+
+def orderModules(modules):
+    ''' Order modules so every module comes after the modules it depends   '''
+    ''' on, keeping the declared order otherwise. Returns (0, '', order),  '''
+    ''' else (1, error message, []) for an undeclared dependency or a      '''
+    ''' dependency cycle.                                                  '''
+    declared = [module for (module, dependencies) in modules]
+
+    # number of dependencies not yet ordered, and dependents, of each module
+    waiting = {}
+    dependents = {}
+    for (module, dependencies) in modules:
+        waiting[module] = len(dependencies)
+        dependents.setdefault(module, [])
+        for dependency in dependencies:
+            if dependency not in declared:
+                return(1, '%s depends on %s, which is not declared'
+                       % (module, dependency), [])
+            dependents.setdefault(dependency, []).append(module)
+
+    order = []
+    while len(order) < len(declared):
+        # first module, in declared order, with all its dependencies ordered
+        ready = [module for module in declared
+                 if waiting[module] == 0 and module not in order]
+        if not ready:
+            cycle = [module for module in declared if module not in order]
+            return(1, 'dependency cycle between %s' % ', '.join(cycle), [])
+        order.append(ready[0])
+        for dependent in dependents[ready[0]]:
+            waiting[dependent] -= 1
+
+    # return 0 for success, no error message, and the report order
+    return(0, '', order)
+
+
+def executeModule(standardFile, module, captureDir, profileDir=None):
+    ''' Execute the standard for module only, standard output and standard '''
+    ''' error each captured to a file in captureDir. Returns (exit status, '''
+    ''' error message, stdout file, stderr file, timing), timing as in a   '''
+    ''' module-end event of events.py, or None if it could not execute.    '''
+    env = os.environ.copy()
+    env['exeScriptname'] = module
+
+    cmd = [standardFile]
+    if profileDir:
+        cmd = [sys.executable, '-m', 'cProfile', '-o',
+               os.path.join(profileDir, module + '.prof'), standardFile]
+
+    (outFd, outFile) = tempfile.mkstemp(prefix=module + '.', suffix='.out',
+                                        dir=captureDir)
+    (errFd, errFile) = tempfile.mkstemp(prefix=module + '.', suffix='.err',
+                                        dir=captureDir)
+    moduleTiming = None
+    try:
+        startTime = time.time()
+        process = subprocess.Popen(cmd, env=env, stdout=outFd, stderr=errFd)
+        # wait4 gives the resources used by the module's process, however
+        #   many other modules the other threads are waiting for
+        (pid, status, rusage) = os.wait4(process.pid, 0)
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        process.returncode = returncode
+        moduleTiming = {'duration': round(time.time() - startTime, 3),
+                        'cpu': round(rusage.ru_utime + rusage.ru_stime, 3),
+                        'children': None,
+                        'readBytes': rusage.ru_inblock * rusageBlockSize,
+                        'writeBytes': rusage.ru_oublock * rusageBlockSize}
+        rval = ''
+    except Exception:
+        # handle any exception from subprocess when it execs the process
+        (type, value, traceback) = sys.exc_info()
+        returncode = 1
+        rval = 'Could not execute %s for %s: %s' % (standardFile, module,
+                                                    value)
+    os.close(outFd)
+    os.close(errFd)
+
+    return(returncode, rval, outFile, errFile, moduleTiming)
+
+
+def worker(standardFile, captureDir, profileDir, readyQueue, doneQueue):
+    ''' Execute modules from readyQueue until it hands us None, putting    '''
+    ''' (module, result of executeModule) on doneQueue for each one.      '''
+    while True:
+        module = readyQueue.get()
+        if module is None:
+            return
+        doneQueue.put((module, executeModule(standardFile, module,
+                                             captureDir, profileDir)))
+
+
+def replayOutput(outFile, errFile, lineHandlers):
+    ''' Pass the captured output of a module, line by line, to each       '''
+    ''' function in lineHandlers as handler(streamName, line), then remove '''
+    ''' the capture files. Returns the number of stderr lines.            '''
+    stderrLines = 0
+    for (streamName, filename) in (('stdout', outFile), ('stderr', errFile)):
+        fp = open(filename, 'r')
+        for line in fp:
+            if streamName == 'stderr':
+                stderrLines += 1
+            for handler in lineHandlers:
+                handler(streamName, line)
+        fp.close()
+        os.remove(filename)
+    return(stderrLines)
+
+
+def runModules(standardFile, modules, jobs, lineHandlers, captureDir,
+               profileDir=None, stateHandler=None, unchanged=()):
+    ''' Execute the modules of standardFile, declared as [(module,         '''
+    ''' [dependencies])], up to jobs at a time. Output of each module is   '''
+    ''' passed to lineHandlers, as streamProcess of install.py does, one   '''
+    ''' module at a time, in report order. A module which fails, or one it '''
+    ''' depends on failed, is not executed. Returns (0, '', results) when  '''
+    ''' all modules were executed, else (1, error message, results), with  '''
+    ''' results [(module, exit status, stderr lines, timing)] in report    '''
+    ''' order; a module not executed has exit status and timing None.     '''
+    ''' stateHandler, if given, is called as stateHandler(module, state)   '''
+    ''' as soon as a module is 'running', 'ok', 'failed', 'skipped' or     '''
+    ''' 'unchanged'. A module of unchanged is not executed, and is         '''
+    ''' 'unchanged', if all the modules it depends on are too.             '''
+    (ecode, rval, order) = orderModules(modules)
+    if ecode != 0:
+        return(1, rval, [])
+
+    dependencies = dict(modules)
+    readyQueue = queue.Queue()
+    doneQueue = queue.Queue()
+
+    workers = []
+    for i in range(max(1, min(jobs, len(order)))):
+        thread = threading.Thread(target=worker,
+                                  args=(standardFile, captureDir, profileDir,
+                                        readyQueue, doneQueue))
+        # Allows program to exit if only the worker threads are alive
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    # modules are 'running', 'ok', 'failed', 'skipped' or 'unchanged' once
+    #   handled
+    state = {}
+    captured = {}
+    results = {}
+    nextToReport = 0
+    errors = []
+
+    while nextToReport < len(order):
+        # start every module whose dependencies all completed; skip those
+        #   depending on a module that did not
+        for module in order:
+            if module in state:
+                continue
+            depStates = [state.get(dep) for dep in dependencies[module]]
+            if 'failed' in depStates or 'skipped' in depStates:
+                state[module] = 'skipped'
+                results[module] = (module, None, 0, None)
+                errors.append('%s not executed, a module it depends on '
+                              'failed' % module)
+            elif module in unchanged and \
+                    depStates.count('unchanged') == len(depStates):
+                state[module] = 'unchanged'
+                results[module] = (module, None, 0, None)
+            elif depStates.count('ok') + depStates.count('unchanged') == \
+                    len(depStates):
+                state[module] = 'running'
+                readyQueue.put(module)
+            else:
+                continue
+            if stateHandler is not None:
+                stateHandler(module, state[module])
+
+        # report, in order, every module done so far
+        while nextToReport < len(order):
+            module = order[nextToReport]
+            if state.get(module) in ('skipped', 'unchanged'):
+                nextToReport += 1
+                continue
+            if module not in captured:
+                break
+            (returncode, rval, outFile, errFile,
+             moduleTiming) = captured.pop(module)
+            stderrLines = replayOutput(outFile, errFile, lineHandlers)
+            results[module] = (module, returncode, stderrLines, moduleTiming)
+            if rval:
+                errors.append(rval)
+            nextToReport += 1
+
+        if nextToReport == len(order):
+            break
+
+        if 'running' not in state.values():
+            continue
+
+        # wait for the next module to complete
+        (module, result) = doneQueue.get()
+        (returncode, rval, outFile, errFile, moduleTiming) = result
+        captured[module] = result
+        if returncode == 0 and not rval and os.path.getsize(errFile) == 0:
+            state[module] = 'ok'
+        else:
+            state[module] = 'failed'
+            if not rval:
+                errors.append('%s failed with exit status %s, %s bytes '
+                              'written to stderr'
+                              % (module, returncode,
+                                 os.path.getsize(errFile)))
+        if stateHandler is not None:
+            stateHandler(module, state[module])
+
+    for thread in workers:
+        readyQueue.put(None)
+    for thread in workers:
+        thread.join()
+
+    results = [results[module] for module in order]
+    if errors:
+        return(1, '\n'.join(errors), results)
+
+    # return 0 for success, no error message, and results
+    return(0, '', results)
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Save the initial state of the files a standard may change: the
+#            mode, ownership and contents of each, before the first run,
+#            and find which of them drifted since the last run.
+#            ------------------------------------------------------------------
+#            Use: (ecode, rval, targets) = loadTargets(targetsFile)
+#                 (ecode, rval, counts) = takeSnapshot(targets, exeDir,
+#                                                      initialStateDir)
+#                 (ecode, rval, drifted, counts) = checkDrift(targets, exeDir,
+#                                                             manifestFile)
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/04/14
+
+
+
+"""
+PURPOSE:    The targets, files and directories listed one per line in
+            payload/var/lists/initialstate.list, are walked once, with a
+            single lstat of each file found. The contents of regular files
+            are hashed, and stored, on hashThreads threads. The contents of
+            a symbolic link is the path it points to.
+
+            Each file's state is one line of the manifest, tab separated:
+
+                mode    uid  gid  size  mtime              digest  path
+                100644  0    0    3264  1397475533.000000  9f1c... /etc/...
+
+            mode is the octal st_mode, type included. digest is the sha1 of
+            the contents, - for a directory or special file. Contents are
+            stored once per digest, however many files have them:
+
+                logs/initialstate/manifest.tsv
+                logs/initialstate/store/9f/9f1c...
+
+            so the store holds each distinct file once, not a copy of every
+            file. The manifest is written last, under a temporary name and
+            renamed, so a snapshot which did not complete is taken again on
+            the next run.
+
+            After each run which completed, the state is saved again, to
+            converged.tsv. Only files whose size or mtime differ from the
+            last manifest are hashed again, and only new contents are
+            stored, so on a converged host this is an lstat of each file.
+
+            install.py --check-drift compares the state of the targets with
+            converged.tsv the same way, stat first, and prints each file
+            whose type, mode, owner or contents changed. A new mtime alone
+            is not drift.
+
+ASSUMPTION: 1) No target path holds a tab or a newline.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/04/14
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import hashlib
+import os
+import stat
+import sys
+import threading
+import time
+
+from toolchain import fileDigest
+
+# Queue was renamed to queue in Python 3
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# targets when there is no targets list
+defaultTargets = ['/etc']
+
+# files of a snapshot directory: the initial state, the state after the
+#   last run which completed, and the contents of both
+manifestName = 'manifest.tsv'
+convergedName = 'converged.tsv'
+storeName = 'store'
+
+# columns of the manifest
+manifestHeader = 'mode\tuid\tgid\tsize\tmtime\tdigest\tpath\n'
+
+# threads hashing and storing contents
+hashThreads = 8
+
+# size of the blocks files are read and copied in
+copyBlockSize = 65536
+
+# held while contents are added to the store, so two threads storing the
+#   same contents count them once
+storeLock = threading.Lock()
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def loadTargets(targetsFile):
+    ''' Return (0, '', [path]) of the targets listed in targetsFile, one   '''
+    ''' per line, skipping blank lines and # comments; defaultTargets if   '''
+    ''' there is no targetsFile. Else (1, error message, []).              '''
+    if os.path.isfile(targetsFile) is False:
+        return(0, '', list(defaultTargets))
+
+    targets = []
+    try:
+        for line in open(targetsFile):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                targets.append(line)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not read targets list %s: %s'
+               % (targetsFile, value), [])
+    return(0, '', targets)
+
+
+def walkTargets(targets, rootDir):
+    ''' Yield (path, lstat) of each target, and everything below target   '''
+    ''' directories, with path relative to rootDir. Symbolic links are not '''
+    ''' followed, and missing targets are skipped.                        '''
+    for target in targets:
+        try:
+            fstat = os.lstat(rootDir + target)
+        except OSError:
+            continue
+        yield(target, fstat)
+        if not stat.S_ISDIR(fstat.st_mode):
+            continue
+
+        # os.walk lists a directory without a stat of each of its files, the
+        #   lstat below is the only one
+        for (dirpath, dirnames, filenames) in os.walk(rootDir + target):
+            for name in dirnames + filenames:
+                fullPath = os.path.join(dirpath, name)
+                try:
+                    fstat = os.lstat(fullPath)
+                except OSError:
+                    # removed since it was listed
+                    continue
+                yield(fullPath[len(rootDir):], fstat)
+
+
+def storedPath(storeDir, digest):
+    ''' path of the contents with digest in storeDir '''
+    return(os.path.join(storeDir, digest[:2], digest))
+
+
+def tmpName(path):
+    ''' temporary name for path, unique to this thread '''
+    return('%s.%d.%d' % (path, os.getpid(), threading.current_thread().ident))
+
+
+def addToStore(tmpFile, storedFile):
+    ''' Rename tmpFile to storedFile, read only. Returns True, or False if '''
+    ''' another thread stored the same contents first.                     '''
+    storeLock.acquire()
+    try:
+        if os.path.isfile(storedFile):
+            os.remove(tmpFile)
+            return(False)
+        os.chmod(tmpFile, 0o400)
+        os.rename(tmpFile, storedFile)
+    finally:
+        storeLock.release()
+    return(True)
+
+
+def storeBytes(data, storeDir):
+    ''' Store data, the contents of a symbolic link. Returns (digest,     '''
+    ''' True if it was added to the store, its size).                     '''
+    digest = hashlib.sha1(data).hexdigest()
+    storedFile = storedPath(storeDir, digest)
+    if os.path.isfile(storedFile):
+        return(digest, False, len(data))
+
+    tmpFile = tmpName(storedFile)
+    fp = open(tmpFile, 'wb')
+    fp.write(data)
+    fp.close()
+    return(digest, addToStore(tmpFile, storedFile), len(data))
+
+
+def storeFile(fullPath, storeDir):
+    ''' Store the contents of regular file fullPath, unless the store has  '''
+    ''' them already. Returns (digest, True if they were added to the      '''
+    ''' store, their size).                                                '''
+    digest = fileDigest(fullPath)
+    if os.path.isfile(storedPath(storeDir, digest)):
+        return(digest, False, 0)
+
+    # copy under a temporary name, hashing what is copied, in case the file
+    #   changed since it was hashed, then rename to the digest of the copy
+    tmpFile = tmpName(os.path.join(storeDir, digest))
+    copyDigest = hashlib.sha1()
+    size = 0
+    srcFp = open(fullPath, 'rb')
+    destFp = open(tmpFile, 'wb')
+    try:
+        while True:
+            block = srcFp.read(copyBlockSize)
+            if not block:
+                break
+            copyDigest.update(block)
+            destFp.write(block)
+            size += len(block)
+    finally:
+        destFp.close()
+        srcFp.close()
+
+    digest = copyDigest.hexdigest()
+    return(digest, addToStore(tmpFile, storedPath(storeDir, digest)), size)
+
+
+def hashWorker(fileQueue, doneQueue, rootDir, storeDir):
+    ''' hash, and store unless storeDir is None, files from fileQueue     '''
+    ''' until it hands us None                                          '''
+    while True:
+        entry = fileQueue.get()
+        if entry is None:
+            return
+        (path, mode) = entry
+        try:
+            if stat.S_ISLNK(mode):
+                data = os.readlink(rootDir + path)
+                if not isinstance(data, bytes):
+                    data = data.encode('utf-8', 'surrogateescape')
+                if storeDir is None:
+                    (digest, stored, size) = \
+                        (hashlib.sha1(data).hexdigest(), False, 0)
+                else:
+                    (digest, stored, size) = storeBytes(data, storeDir)
+            elif storeDir is None:
+                (digest, stored, size) = (fileDigest(rootDir + path), False, 0)
+            else:
+                (digest, stored, size) = storeFile(rootDir + path, storeDir)
+            doneQueue.put((path, digest, stored, size, ''))
+        except Exception:
+            (type, value, traceback) = sys.exc_info()
+            doneQueue.put((path, '', False, 0, '%s' % value))
+
+
+def loadManifest(manifestFile):
+    ''' Return (0, '', {path: (mode, uid, gid, size, mtime, digest)}) of  '''
+    ''' manifestFile, else (1, error message, {}).                        '''
+    states = {}
+    try:
+        fp = open(manifestFile, 'r')
+        # skip the column names
+        fp.readline()
+        for line in fp:
+            (mode, uid, gid, size, mtime, digest, path) = \
+                line.rstrip('\n').split('\t', 6)
+            states[path] = (int(mode, 8), int(uid), int(gid), int(size),
+                            mtime, digest)
+        fp.close()
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not read manifest %s: %s' % (manifestFile, value),
+               {})
+    return(0, '', states)
+
+
+def scanTargets(targets, rootDir, previous, storeDir, threads, counts):
+    ''' Return {path: (mode, uid, gid, size, mtime, digest)} of targets,  '''
+    ''' hashing on threads only the files whose size or mtime differ from '''
+    ''' their state in previous; the others keep their previous digest.   '''
+    ''' Contents hashed are stored in storeDir, unless it is None. Adds    '''
+    ''' what was hashed and stored to counts.                            '''
+    fileQueue = queue.Queue()
+    doneQueue = queue.Queue()
+    workers = []
+    for i in range(max(1, threads)):
+        thread = threading.Thread(target=hashWorker,
+                                  args=(fileQueue, doneQueue, rootDir,
+                                        storeDir))
+        # Allows program to exit if only the worker threads are alive
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    # walk on this thread while the workers hash what is found so far
+    states = {}
+    for (path, fstat) in walkTargets(targets, rootDir):
+        if path in states:
+            # below two of the targets
+            continue
+        state = (fstat.st_mode, fstat.st_uid, fstat.st_gid, fstat.st_size,
+                 '%.6f' % fstat.st_mtime)
+        if not (stat.S_ISREG(fstat.st_mode) or stat.S_ISLNK(fstat.st_mode)):
+            states[path] = state + ('-',)
+            continue
+
+        before = previous.get(path)
+        if before is not None and before[3:5] == state[3:5] and \
+                before[0] == state[0] and before[5] not in ('-', '?'):
+            # same size and mtime, the contents are taken to be the same
+            states[path] = state + (before[5],)
+        else:
+            states[path] = state
+            fileQueue.put((path, fstat.st_mode))
+            counts['hashed'] += 1
+    for thread in workers:
+        fileQueue.put(None)
+
+    for i in range(counts['hashed']):
+        (path, digest, stored, size, error) = doneQueue.get()
+        if error:
+            counts['unreadable'] += 1
+            digest = '?'
+        elif stored:
+            counts['stored'] += 1
+            counts['storedBytes'] += size
+        states[path] = states[path] + (digest,)
+    for thread in workers:
+        thread.join()
+    return(states)
+
+
+def takeSnapshot(targets, rootDir, snapshotDir, manifest=manifestName,
+                 previous=None, threads=hashThreads):
+    ''' Save the state of targets, paths relative to rootDir, to manifest '''
+    ''' and the store of snapshotDir. Files with the same size and mtime  '''
+    ''' as in previous, as loadManifest returns it, are not hashed again. '''
+    ''' Returns (0, '', counts) with counts {'files', 'hashed', 'stored', '''
+    ''' 'storedBytes', 'unreadable', 'seconds'}, else (1, error message, '''
+    ''' counts so far).                                                   '''
+    if previous is None:
+        previous = {}
+    startTime = time.time()
+    counts = {'files': 0, 'hashed': 0, 'stored': 0, 'storedBytes': 0,
+              'unreadable': 0, 'seconds': 0.0}
+    storeDir = os.path.join(snapshotDir, storeName)
+
+    try:
+        if os.path.isdir(storeDir) is False:
+            os.makedirs(storeDir, mode=0o700)
+        for i in range(256):
+            subDir = os.path.join(storeDir, '%02x' % i)
+            if os.path.isdir(subDir) is False:
+                os.mkdir(subDir, 0o700)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not create initial state store %s: %s'
+               % (storeDir, value), counts)
+
+    states = scanTargets(targets, rootDir, previous, storeDir, threads,
+                         counts)
+
+    manifestFile = os.path.join(snapshotDir, manifest)
+    tmpFile = '%s.%d' % (manifestFile, os.getpid())
+    try:
+        fp = open(tmpFile, 'w')
+        fp.write(manifestHeader)
+        for path in sorted(states):
+            fp.write('%o\t%d\t%d\t%d\t%s\t%s\t%s\n'
+                     % (states[path] + (path,)))
+        fp.close()
+        os.rename(tmpFile, manifestFile)
+    except Exception:
+        # if error, return error message
+        (type, value, traceback) = sys.exc_info()
+        return(1, 'Could not write manifest %s: %s'
+               % (manifestFile, value), counts)
+
+    counts['files'] = len(states)
+    counts['seconds'] = time.time() - startTime
+    # return 0 for success, no error message, and what was saved
+    return(0, '', counts)
+
+
+def underTargets(path, targets):
+    ''' True if path is one of targets, or below one of them '''
+    for target in targets:
+        if path == target or path.startswith(target.rstrip('/') + '/'):
+            return(True)
+    return(False)
+
+
+def compareStates(previous, current, targets):
+    ''' Return [(path, [change])] of the paths of targets whose state     '''
+    ''' differs from previous to current, in path order. A change is      '''
+    ''' 'added', 'removed', 'type', 'mode', 'owner' or 'contents'. A new  '''
+    ''' mtime alone is not a change.                                     '''
+    drifted = []
+    for path in sorted(set(current) |
+                       set([path for path in previous
+                            if underTargets(path, targets)])):
+        if path not in previous:
+            drifted.append((path, ['added']))
+            continue
+        if path not in current:
+            drifted.append((path, ['removed']))
+            continue
+
+        (mode, uid, gid, size, mtime, digest) = current[path]
+        before = previous[path]
+        changes = []
+        if stat.S_IFMT(mode) != stat.S_IFMT(before[0]):
+            changes.append('type')
+        elif stat.S_IMODE(mode) != stat.S_IMODE(before[0]):
+            changes.append('mode')
+        if (uid, gid) != before[1:3]:
+            changes.append('owner')
+        if digest != before[5] or digest == '?':
+            changes.append('contents')
+        if changes:
+            drifted.append((path, changes))
+    return(drifted)
+
+
+def checkDrift(targets, rootDir, manifestFile, threads=hashThreads):
+    ''' Compare the state of targets with manifestFile, hashing only the  '''
+    ''' files whose size or mtime changed, nothing stored. Returns (0,    '''
+    ''' '', drifted, counts), drifted as compareStates returns it, counts '''
+    ''' as takeSnapshot returns them; else (1, error message, [], {}).    '''
+    startTime = time.time()
+    (ecode, rval, previous) = loadManifest(manifestFile)
+    if ecode != 0:
+        return(1, rval, [], {})
+
+    counts = {'files': 0, 'hashed': 0, 'stored': 0, 'storedBytes': 0,
+              'unreadable': 0, 'seconds': 0.0}
+    current = scanTargets(targets, rootDir, previous, None, threads, counts)
+    drifted = compareStates(previous, current, targets)
+
+    counts['files'] = len(current)
+    counts['seconds'] = time.time() - startTime
+    return(0, '', drifted, counts)
+
+
+def unchangedModules(moduleInputs, drifted, dependencies=None):
+    ''' Return the modules of {module: [input path]} which declared       '''
+    ''' inputs, none of which, nor anything below them, drifted, and      '''
+    ''' which only depend, as {module: [dependencies]}, on such modules.  '''
+    if dependencies is None:
+        dependencies = {}
+    driftedPaths = [path for (path, changes) in drifted]
+    unchanged = set()
+    for (module, inputs) in moduleInputs.items():
+        if not inputs:
+            continue
+        if not [path for path in driftedPaths
+                if underTargets(path, inputs)]:
+            unchanged.add(module)
+
+    # a module depending on one which is executed is executed too
+    removed = True
+    while removed:
+        removed = False
+        for module in sorted(unchanged):
+            for dependency in dependencies.get(module, []):
+                if dependency not in unchanged:
+                    unchanged.discard(module)
+                    removed = True
+                    break
+    return(sorted(unchanged))
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+#   PURPOSE: Resolve and cache the paths of the external programs used by
+#            install.py and the standard scripts it executes.
+#            ------------------------------------------------------------------
+#            Use: import toolchain
+#                 (ecode, rval, CHMOD_PROGRAM) = \
+#                     toolchain.program('CHMOD_PROGRAM')
+#            ------------------------------------------------------------------
+#   AUTHOR:  Todd E Thomas
+#     DATE:  2014/02/17
+
+
+
+"""
+PURPOSE:    Keep one verified list of the external programs (chmod, chown,
+            useradd, ...) for install.py and every module it executes, in a
+            small cache file under tmpDir. Each cached program records its
+            path, inode and mtime, and the sha1 of its contents, so a later
+            run, or a child script, can check it with a single stat instead
+            of searching PATH for it again.
+
+            Programs are resolved lazily: nothing is searched for until a
+            program is first asked for, and only a program that is missing
+            from the cache, or was replaced since it was cached, is searched
+            for again.
+
+ASSUMPTION: 1) install.py puts the location of the cache file in the
+                environment as toolchainCache, and puts the directory of
+                this module on PYTHONPATH, so child scripts can simply:
+                    import toolchain
+                    (ecode, rval, CHMOD_PROGRAM) = \
+                        toolchain.program('CHMOD_PROGRAM')
+
+            2) install.py also exports a *_PROGRAM environment variable for
+                every standard program, for the scripts which do not import
+                toolchain, and exits if one can not be found. On a fresh
+                cache this searches for all of them once; later runs only
+                stat them.
+
+AUTHOR:     Todd E Thomas
+CREATED:    2014/02/17
+MODIFIED:
+"""
+
+###----------------------------------------------------------------------------
+### IMPORTS
+###----------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import sys
+
+
+###----------------------------------------------------------------------------
+### VARIABLES
+###----------------------------------------------------------------------------
+# External programs, by environment variable name, at their standard location
+standardPrograms = [('BASH_PROGRAM', '/bin/bash'),
+                    ('CHAGE_PROGRAM', '/usr/bin/chage'),
+                    ('CHGRP_PROGRAM', '/bin/chgrp'),
+                    ('CHMOD_PROGRAM', '/bin/chmod'),
+                    ('CHOWN_PROGRAM', '/bin/chown'),
+                    ('CP_PROGRAM', '/bin/cp'),
+                    ('DIG_PROGRAM', '/usr/bin/dig'),
+                    ('FIND_PROGRAM', '/usr/bin/find'),
+                    ('GROUPADD_PROGRAM', '/usr/sbin/groupadd'),
+                    ('GROUPDEL_PROGRAM', '/usr/sbin/groupdel'),
+                    ('HOSTNAME_PROGRAM', '/bin/hostname'),
+                    ('LN_PROGRAM', '/bin/ln'),
+                    ('LOGROTATE_PROGRAM', '/usr/sbin/logrotate'),
+                    ('MKDIR_PROGRAM', '/bin/mkdir'),
+                    ('MV_PROGRAM', '/bin/mv'),
+                    ('PAMCONFIG_PROGRAM', '/usr/bin/pam-config'),
+                    ('PASSWD_PROGRAM', '/usr/bin/passwd'),
+                    ('PWCONV_PROGRAM', '/usr/sbin/pwconv'),
+                    ('RPM_PROGRAM', '/bin/rpm'),
+                    ('RM_PROGRAM', '/bin/rm'),
+                    ('SYSCTL_PROGRAM', '/sbin/sysctl'),
+                    ('SERVICE_PROGRAM', '/sbin/service'),
+                    ('TAR_PROGRAM', '/usr/bin/tar'),
+                    ('TOUCH_PROGRAM', '/usr/bin/touch'),
+                    ('USERADD_PROGRAM', '/usr/sbin/useradd'),
+                    ('USERDEL_PROGRAM', '/usr/sbin/userdel'),
+                    ('USERMOD_PROGRAM', '/usr/sbin/usermod'),
+                    ('WHOAMI_PROGRAM', '/usr/bin/whoami')]
+
+# toolchain of this process, see program()
+defaultToolchain = None
+
+
+###----------------------------------------------------------------------------
+### FUNCTIONS
+###----------------------------------------------------------------------------
+
+
+def findProgram(fbasename, searchPath):
+    ''' In-process equivalent of the bash built-in type -P: return the     '''
+    ''' first executable file named fbasename in the directories of       '''
+    ''' searchPath, or an empty string if there is none.                 '''
+    for directory in searchPath.split(os.pathsep):
+        # an empty PATH entry means the current directory
+        candidate = os.path.join(directory or '.', fbasename)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return(candidate)
+    return('')
+
+
+def fileDigest(filename):
+    ''' return the sha1 hex digest of the contents of filename '''
+    digest = hashlib.sha1()
+    fp = open(filename, 'rb')
+    while True:
+        block = fp.read(65536)
+        if not block:
+            break
+        digest.update(block)
+    fp.close()
+    return(digest.hexdigest())
+
+
+class Toolchain(object):
+    ''' Programs by environment variable name, resolved on first use and   '''
+    ''' kept in cacheFile, if given, between runs and across processes.   '''
+    ''' With verifyDigest, a cached program is also hashed before it is   '''
+    ''' trusted, not just checked for the same inode and mtime.           '''
+
+    def __init__(self, cacheFile=None, programList=standardPrograms,
+                 verifyDigest=False):
+        self.cacheFile = cacheFile
+        self.verifyDigest = verifyDigest
+        # standard location of each program
+        self.standard = dict(programList)
+        # directories searched, as type -P would
+        self.searchPath = os.environ.get('PATH', '')
+        # entries are {'path': , 'ino': , 'mtime': , 'digest': } by name
+        self.entries = {}
+        # names whose entry was checked by this process
+        self.checked = {}
+
+        if cacheFile:
+            self.load()
+
+    def load(self):
+        ''' read the cache file; a cache made under another PATH is dropped '''
+        try:
+            fp = open(self.cacheFile, 'r')
+            cache = json.load(fp)
+            fp.close()
+        except Exception:
+            # no cache, or unreadable cache, start over
+            return
+
+        if cache.get('PATH') == self.searchPath:
+            self.entries = cache.get('programs', {})
+
+    def save(self):
+        ''' Write the cache file, replacing it in one rename so a child     '''
+        ''' never reads it half written. Failing to save only costs a       '''
+        ''' lookup next time.                                               '''
+        if not self.cacheFile:
+            return
+        tmpFile = '%s.%d' % (self.cacheFile, os.getpid())
+        try:
+            fp = open(tmpFile, 'w')
+            json.dump({'PATH': self.searchPath, 'programs': self.entries}, fp,
+                      indent=1, sort_keys=True)
+            fp.close()
+            os.rename(tmpFile, self.cacheFile)
+        except Exception:
+            pass
+
+    def valid(self, var):
+        ''' True if the cached entry for var is still the same program '''
+        entry = self.entries.get(var)
+        if entry is None:
+            return(False)
+        try:
+            fstat = os.stat(entry['path'])
+        except OSError:
+            # program is gone
+            return(False)
+        if fstat.st_ino != entry['ino'] or fstat.st_mtime != entry['mtime']:
+            return(False)
+        if self.verifyDigest and fileDigest(entry['path']) != entry['digest']:
+            return(False)
+        return(True)
+
+    def resolve(self, var, save=True):
+        ''' Search PATH for var's program, cache and return its entry, or   '''
+        ''' None if it can not be found.                                    '''
+        if var not in self.standard:
+            return(None)
+
+        # get the basename of the program
+        fbasename = self.standard[var].strip().split('/')[-1]
+
+        location = findProgram(fbasename, self.searchPath)
+        if location == '':
+            return(None)
+
+        fstat = os.stat(location)
+        entry = {'path': location, 'ino': fstat.st_ino,
+                 'mtime': fstat.st_mtime, 'digest': fileDigest(location)}
+        self.entries[var] = entry
+        if save:
+            self.save()
+        return(entry)
+
+    def program(self, var):
+        ''' Return (0, '', path) for the program of environment variable    '''
+        ''' name var, e.g. CHMOD_PROGRAM, else (1, error message, '').      '''
+        if var in self.checked or self.valid(var):
+            self.checked[var] = True
+            return(0, '', self.entries[var]['path'])
+
+        entry = self.resolve(var)
+        if entry is None:
+            return(1, self.missingMessage(var), '')
+
+        self.checked[var] = True
+        return(0, '', entry['path'])
+
+    def verified(self):
+        ''' Return [(var, path)] of every cached program which is still     '''
+        ''' valid, without searching for the others.                        '''
+        verifiedProgs = []
+        for (var, program) in sorted(self.standard.items()):
+            if var in self.checked or self.valid(var):
+                self.checked[var] = True
+                verifiedProgs.append((var, self.entries[var]['path']))
+        return(verifiedProgs)
+
+    def missingMessage(self, var):
+        ''' error message for the program of var, which can not be found '''
+        return('External program for %s is not located at %s.\n \
+Please update the externalPrograms list with correct location of executable.'
+               % (var, self.standard.get(var, '')))
+
+    def resolved(self):
+        ''' Return ([(var, path)], [var]): every standard program which can '''
+        ''' be found, and every one which can not, searching for those not  '''
+        ''' validly cached, and saving the cache once after them.           '''
+        resolvedProgs = []
+        missingVars = []
+        searched = False
+        for (var, program) in sorted(self.standard.items()):
+            if var in self.checked or self.valid(var):
+                self.checked[var] = True
+            elif self.resolve(var, False) is not None:
+                self.checked[var] = True
+                searched = True
+            else:
+                missingVars.append(var)
+                continue
+            resolvedProgs.append((var, self.entries[var]['path']))
+        if searched:
+            self.save()
+        return(resolvedProgs, missingVars)
+
+
+def program(var):
+    ''' Return (ecode, error message, path) for the program of environment '''
+    ''' variable name var, from the toolchain cache install.py made.       '''
+    global defaultToolchain
+
+    if defaultToolchain is None:
+        defaultToolchain = Toolchain(os.environ.get('toolchainCache'))
+    return(defaultToolchain.program(var))
+
+
+###----------------------------------------------------------------------------
+### MAIN PROGRAM
+###----------------------------------------------------------------------------
+if __name__ == '__main__':
+    # print the path of each program named on the command line, e.g.
+    #   python toolchain.py CHMOD_PROGRAM CHOWN_PROGRAM
+    exitCode = 0
+    for var in sys.argv[1:]:
+        (ecode, rval, path) = program(var)
+        if ecode != 0:
+            print('%s' % rval)
+            exitCode = 1
+        else:
+            print('%s=%s' % (var, path))
+    sys.exit(exitCode)